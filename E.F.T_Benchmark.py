@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+Load-testing and latency benchmark for the E.F.T Flask app (E.F.T_VER1.py).
+
+Seeds synthetic ledgers (12, 120 and 1200 months by default), drives each
+route with concurrent clients through Flask's test client or a local WSGI
+server, and reports req/s and p50/p95/p99 latency per route together with
+the time spent in load_data, save_data and chart_urls. Results are
+written as JSON; pass --compare with an earlier file for a before/after table.
+
+Usage:
+    python E.F.T_Benchmark.py
+    python E.F.T_Benchmark.py --engine sqlite --mode server --clients 8
+    python E.F.T_Benchmark.py --compare bench_before.json
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'E.F.T_VER1.py')
+FOODS = ['maize', 'rice', 'beans', 'wheat', 'sorghum']
+
+
+def load_app(engine):
+    os.environ['EFT_STORAGE'] = engine
+    spec = importlib.util.spec_from_file_location('eft_app', APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['eft_app'] = module  # so worker processes can unpickle the chart renderers
+    spec.loader.exec_module(module)
+    return module
+
+
+def month_key(index):
+    return f"{2000 + index // 12}-{index % 12 + 1:02d}"
+
+
+def synthetic_ledger(months, seed=42):
+    rng = random.Random(seed)
+    history = []
+    for i in range(months):
+        income = rng.uniform(40000, 150000)
+        available = income * 0.5
+        expenditures = {
+            'upkeep': rng.uniform(5000, 30000),
+            'transport': rng.uniform(0, 10000),
+            'utilities': rng.uniform(0, 8000),
+            'entertainment': rng.uniform(0, 6000),
+            'rent': rng.uniform(0, 25000)
+        }
+        purchases = [{'food': food, 'quantity': 1.0, 'price': 2500.0, 'cost': 2500.0}
+                     for food in rng.sample(FOODS, 2)]
+        total = sum(expenditures.values()) + sum(p['cost'] for p in purchases)
+        loan = max(0.0, total - available)
+        history.append({
+            'month': month_key(i),
+            'income': income,
+            'savings_reserve': income * 0.3,
+            'investments': income * 0.1,
+            'emergency_fund': income * 0.1,
+            'available_budget': available,
+            'expenditures': expenditures,
+            'food_purchases': purchases,
+            'food_sales': [],
+            'savings': {'total': income * 0.5, 'reserve': income * 0.3, 'investments': income * 0.1,
+                        'emergency': income * 0.1},
+            'loan': {'needed': loan > 0, 'total': loan},
+            'budget_analysis': {}
+        })
+    return {
+        'history': history,
+        'total_savings': 472000,
+        'short_term_savings': 0,
+        'food_inventory': {food: 100 for food in FOODS},
+        'food_prices': {food: {'buy': 2500, 'sell': 2200} for food in FOODS}
+    }
+
+
+class Timings:
+    """Thread-safe accumulator for named timings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def summary(self):
+        with self._lock:
+            return {name: {
+                'calls': len(values),
+                'total_ms': round(sum(values) * 1000, 3),
+                'mean_ms': round(sum(values) / len(values) * 1000, 3)
+            } for name, values in self.samples.items()}
+
+
+def instrument(app, store, timings):
+    """Wrap the store and graph functions the routes call to time them; returns an undo function."""
+    original_load = store.load
+    original_transaction = store.transaction
+    original_chart_urls = app.chart_urls
+
+    def timed_load():
+        start = time.perf_counter()
+        try:
+            return original_load()
+        finally:
+            timings.add('load_data', time.perf_counter() - start)
+
+    @contextmanager
+    def timed_transaction():
+        # Covers the read-modify-write and the write itself, i.e. what save_data used to do
+        start = time.perf_counter()
+        try:
+            with original_transaction() as data:
+                yield data
+        finally:
+            timings.add('save_data', time.perf_counter() - start)
+
+    def timed_chart_urls(data, current_month):
+        start = time.perf_counter()
+        try:
+            return original_chart_urls(data, current_month)
+        finally:
+            timings.add('chart_urls', time.perf_counter() - start)
+
+    store.load = timed_load
+    store.transaction = timed_transaction
+    app.chart_urls = timed_chart_urls
+
+    def restore():
+        del store.load, store.transaction
+        app.chart_urls = original_chart_urls
+    return restore
+
+
+def stub_templates_if_missing(app):
+    """Templates are not part of the repository; if absent, time the routes without rendering."""
+    try:
+        app.app.jinja_env.get_template('results.html')
+        return False
+    except Exception:
+        app.render_template = lambda template, **context: f'<html>{template}</html>'
+        return True
+
+
+def route_plan(months):
+    """(name, method, path, form) for every route, against a month in the ledger."""
+    month = month_key(months - 1)
+    expenditure_form = {'upkeep': '8000', 'transport': '2000', 'utilities': '1500',
+                        'entertainment': '1000', 'rent': '15000'}
+    for food in FOODS:
+        expenditure_form.update({f'{food}_buy': '2500', f'{food}_sell': '2200', f'{food}_qty': '0'})
+    return [
+        ('GET /month_selector', 'GET', '/month_selector', None),
+        ('GET /income', 'GET', f'/income?month={month}', None),
+        ('POST /income', 'POST', f'/income?month={month}', {'income': '90000'}),
+        ('GET /expenditure', 'GET', f'/expenditure?month={month}', None),
+        ('POST /expenditure', 'POST', f'/expenditure?month={month}', expenditure_form),
+        ('GET /results', 'GET', f'/results?month={month}', None),
+        ('GET /history', 'GET', '/history', None),
+        ('GET /export_csv', 'GET', '/export_csv', None),
+        ('GET /api/v1/months', 'GET', '/api/v1/months?limit=50', None)
+    ]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class TestClientDriver:
+    def __init__(self, app, credentials, clients):
+        # One logged-in client per worker, created up front so no login
+        # (a deliberately slow password hash) lands in a timed request
+        self.clients = []
+        for _ in range(clients):
+            client = app.app.test_client()
+            client.post('/login', data=credentials)
+            self.clients.append(client)
+
+    def request(self, method, path, form, worker=0):
+        response = self.clients[worker].open(path, method=method, data=form)
+        response.get_data()  # drain streamed bodies
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class ServerDriver:
+    def __init__(self, app, credentials):
+        from http.cookiejar import CookieJar
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no per-request access log
+        self.server = make_server('127.0.0.1', 0, app.app, threaded=True)
+        self.base = f'http://127.0.0.1:{self.server.server_port}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        class NoRedirect(urllib.request.HTTPRedirectHandler):
+            def redirect_request(self, *args, **kwargs):
+                return None
+        self.opener = urllib.request.build_opener(NoRedirect, urllib.request.HTTPCookieProcessor(CookieJar()))
+        self.request('POST', '/login', credentials)
+
+    def request(self, method, path, form, worker=0):
+        body = urllib.parse.urlencode(form).encode() if form else None
+        req = urllib.request.Request(self.base + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def close(self):
+        self.server.shutdown()
+
+
+def run_route(driver, method, path, form, requests, clients):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(index, count):
+        local = []
+        local_errors = 0
+        for _ in range(count):
+            start = time.perf_counter()
+            status = driver.request(method, path, form, index)
+            local.append(time.perf_counter() - start)
+            if status >= 400:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    per_client = [requests // clients + (1 if i < requests % clients else 0) for i in range(clients)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(worker, range(clients), per_client))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(len(latencies) / elapsed, 2) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3)
+    }
+
+
+def benchmark_size(app, months, args):
+    # Each ledger size gets its own account (and so its own store) and a fresh chart cache
+    credentials = {'username': f'bench_{months}_{os.getpid()}', 'password': 'benchmark-password'}
+    user_id = app.users.create(credentials['username'], credentials['password'])
+    store = app.tenant_stores.get(user_id)
+    store.save(synthetic_ledger(months))
+    app.chart_cache = app.ChartCache()
+
+    timings = Timings()
+    restore = instrument(app, store, timings)
+    driver = (ServerDriver(app, credentials) if args.mode == 'server'
+              else TestClientDriver(app, credentials, args.clients))
+    routes = {}
+    try:
+        for name, method, path, form in route_plan(months):
+            if args.warmup:
+                run_route(driver, method, path, form, args.warmup, 1)
+            routes[name] = run_route(driver, method, path, form, args.requests, args.clients)
+            print(f"  {months:>5} months  {name:<22} {routes[name]['rps']:>9.1f} req/s  "
+                  f"p50 {routes[name]['p50_ms']:>8.2f} ms  p95 {routes[name]['p95_ms']:>8.2f} ms  "
+                  f"p99 {routes[name]['p99_ms']:>8.2f} ms  errors {routes[name]['errors']}")
+    finally:
+        driver.close()
+        restore()
+    return {'routes': routes, 'breakdown': timings.summary()}
+
+
+def print_comparison(before, after):
+    print('\nBefore/after (p50 ms, req/s):')
+    for size, result in after['results'].items():
+        old = before.get('results', {}).get(size)
+        if not old:
+            continue
+        for route, stats in result['routes'].items():
+            prev = old['routes'].get(route)
+            if not prev:
+                continue
+            speedup = prev['p50_ms'] / stats['p50_ms'] if stats['p50_ms'] else float('inf')
+            print(f"  {size:>5} {route:<22} p50 {prev['p50_ms']:>8.2f} -> {stats['p50_ms']:>8.2f} "
+                  f"({speedup:.2f}x)  req/s {prev['rps']:>8.1f} -> {stats['rps']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the E.F.T Flask app')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[12, 120, 1200], help='ledger sizes in months')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent clients')
+    parser.add_argument('--warmup', type=int, default=5, help='warm-up requests per route')
+    parser.add_argument('--engine', choices=['json', 'sqlite'], default='json', help='storage engine')
+    parser.add_argument('--mode', choices=['testclient', 'server'], default='testclient',
+                        help="Flask test client or a local threaded WSGI server")
+    parser.add_argument('--output', help='results file (default bench_<engine>_<timestamp>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='eft_bench_')
+    os.chdir(workdir)
+    app = load_app(args.engine)
+    stubbed = stub_templates_if_missing(app)
+    if stubbed:
+        print('Templates not found: timing routes with template rendering stubbed out')
+
+    results = {}
+    for months in args.sizes:
+        results[str(months)] = benchmark_size(app, months, args)
+    os.chdir(cwd)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'engine': args.engine,
+            'mode': args.mode,
+            'clients': args.clients,
+            'requests_per_route': args.requests,
+            'render_workers': app.RENDER_WORKERS,
+            'templates_stubbed': stubbed
+        },
+        'results': results
+    }
+
+    output = args.output or f"bench_{args.engine}_{datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nResults saved to {output}')
+
+    for size, result in results.items():
+        breakdown = ', '.join(f"{name} {stats['mean_ms']:.2f} ms x{stats['calls']}"
+                              for name, stats in sorted(result['breakdown'].items()))
+        print(f'  {size:>5} months breakdown: {breakdown}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
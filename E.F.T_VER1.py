@@ -1,8 +1,31 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, make_response, abort, Response, send_file, session, g
+from werkzeug.local import LocalProxy
+from werkzeug.security import generate_password_hash, check_password_hash
 import json
+import os
+import re
+import copy
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import atexit
+import zlib
+import bisect
+import binascii
+import shutil
+import time
+import uuid
+import secrets
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 import matplotlib
 matplotlib.use('Agg')  # Use non-GUI backend
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import numpy as np
 from datetime import datetime
 import io
@@ -10,52 +33,835 @@ import base64
 import csv
 
 app = Flask(__name__)
-app.secret_key = 'your-secret-key-here'  # Change this in production
 
-# Load data from JSON file
-def load_data():
+DATA_FILE = 'finance_data.json'
+DATABASE_FILE = os.environ.get('EFT_DATABASE', 'finance_data.db')
+STORAGE_ENGINE = os.environ.get('EFT_STORAGE', 'json')  # 'json' or 'sqlite'
+
+# Accounts: each user gets an isolated ledger under TENANTS_DIR/<user id>/
+USERS_DATABASE = os.environ.get('EFT_USERS_DB', 'eft_users.db')
+TENANTS_DIR = os.environ.get('EFT_TENANTS_DIR', 'tenants')
+TENANT_CACHE_SIZE = int(os.environ.get('EFT_TENANT_CACHE', 64))  # open stores kept in memory
+SECRET_KEY_FILE = os.environ.get('EFT_SECRET_KEY_FILE', '.eft_secret_key')
+USERNAME_PATTERN = re.compile(r'[A-Za-z0-9_.-]{3,32}')
+
+def load_secret_key():
+    """EFT_SECRET_KEY, or a random key generated once and kept in SECRET_KEY_FILE."""
+    key = os.environ.get('EFT_SECRET_KEY')
+    if key:
+        return key
     try:
-        with open('finance_data.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        # Return default data structure if file doesn't exist
-        return {
-            "history": [],
-            "total_savings": 472000,
-            "short_term_savings": 0,
-            "food_inventory": {
-                "maize": 0,
-                "rice": 0,
-                "beans": 0,
-                "wheat": 0,
-                "sorghum": 0
-            },
-            "food_prices": {
-                "maize": {"buy": 2500, "sell": 2200},
-                "rice": {"buy": 6000, "sell": 5500},
-                "beans": {"buy": 8000, "sell": 7500},
-                "wheat": {"buy": 3500, "sell": 3200},
-                "sorghum": {"buy": 2000, "sell": 1800}
+        fd = os.open(SECRET_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:  # already created (possibly by another worker)
+        with open(SECRET_KEY_FILE, 'r') as f:
+            return f.read().strip()
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, 'w') as f:
+        f.write(key)
+    return key
+
+app.secret_key = load_secret_key()
+app.config.update(SESSION_COOKIE_HTTPONLY=True, SESSION_COOKIE_SAMESITE='Lax')
+
+# Default data structure for a new ledger
+def default_data():
+    return {
+        "history": [],
+        "total_savings": 472000,
+        "short_term_savings": 0,
+        "food_inventory": {
+            "maize": 0,
+            "rice": 0,
+            "beans": 0,
+            "wheat": 0,
+            "sorghum": 0
+        },
+        "food_prices": {
+            "maize": {"buy": 2500, "sell": 2200},
+            "rice": {"buy": 6000, "sell": 5500},
+            "beans": {"buy": 8000, "sell": 7500},
+            "wheat": {"buy": 3500, "sell": 3200},
+            "sorghum": {"buy": 2000, "sell": 1800}
+        }
+    }
+
+def month_expenses(month):
+    return (sum(month['expenditures'].values()) +
+            sum(item['cost'] for item in month.get('food_purchases', [])) -
+            sum(item['income'] for item in month.get('food_sales', [])))
+
+class HistoryAggregates:
+    """Running totals over the month history, kept in step with the store.
+
+    Each month's contribution is remembered so re-saving a month replaces it
+    instead of recounting everything; rolling windows only look at the last
+    12 month keys. summary() therefore costs the same for 12 or 1200 months.
+    `tag` identifies the store state the totals were built from, so the
+    store can tell when they must be rebuilt (e.g. another process wrote).
+    """
+
+    WINDOWS = (3, 6, 12)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tag = None
+        self._reset_totals()
+
+    def _reset_totals(self):
+        self._months = {}  # month -> (income, expenses, credited savings, loan, categories)
+        self._keys = []
+        self._income = 0
+        self._expenses = 0
+        self._savings = 0
+        self._loans = 0
+        self._loan_months = 0
+        self._categories = {}
+
+    def _add(self, month, sign):
+        income, expenses, savings, loan, categories = self._months[month]
+        self._income += sign * income
+        self._expenses += sign * expenses
+        self._savings += sign * savings
+        self._loans += sign * loan
+        self._loan_months += sign * (loan > 0)
+        for category, amount in categories.items():
+            self._categories[category] = self._categories.get(category, 0) + sign * amount
+
+    def _apply(self, month_data):
+        month = month_data['month']
+        if month in self._months:
+            self._add(month, -1)
+        else:
+            bisect.insort(self._keys, month)
+        loan = month_data['loan']
+        categories = dict(month_data['expenditures'])
+        categories['food'] = sum(item['cost'] for item in month_data.get('food_purchases', []))
+        # As in the expenditure route: the allocations count as savings only
+        # in months that did not need a loan
+        savings = 0 if loan.get('needed') else (
+            month_data['savings_reserve'] + month_data['investments'] + month_data['emergency_fund'])
+        self._months[month] = (
+            month_data['income'],
+            month_expenses(month_data),
+            savings,
+            loan['total'] if loan.get('needed') else 0,
+            categories
+        )
+        self._add(month, 1)
+
+    def rebuild(self, history, tag):
+        with self._lock:
+            self._reset_totals()
+            for month_data in history:
+                self._apply(month_data)
+            self.tag = tag
+
+    def update(self, months, old_tag, new_tag):
+        """Apply re-saved months if the totals matched the state they were saved over."""
+        with self._lock:
+            if self.tag is None or self.tag != old_tag:
+                self.tag = None  # out of step: rebuild on next read
+                return
+            for month_data in months:
+                self._apply(month_data)
+            self.tag = new_tag
+
+    def clear(self, tag):
+        with self._lock:
+            self._reset_totals()
+            self.tag = tag
+
+    def invalidate(self):
+        with self._lock:
+            self.tag = None
+
+    def summary(self):
+        with self._lock:
+            rolling = {}
+            for window in self.WINDOWS:
+                recent = [self._months[month] for month in self._keys[-window:]]
+                rolling[f'{window}m'] = {
+                    'months': len(recent),
+                    'income': sum(m[0] for m in recent) / len(recent) if recent else 0,
+                    'expenses': sum(m[1] for m in recent) / len(recent) if recent else 0
+                }
+            spent = sum(max(amount, 0) for amount in self._categories.values())
+            return {
+                'months': len(self._keys),
+                'first_month': self._keys[0] if self._keys else None,
+                'last_month': self._keys[-1] if self._keys else None,
+                'total_income': self._income,
+                'total_expenses': self._expenses,
+                'cumulative_savings': self._savings,
+                'loan_total': self._loans,
+                'loan_months': self._loan_months,
+                'rolling_averages': rolling,
+                'category_totals': dict(self._categories),
+                'category_shares': {category: (max(amount, 0) / spent if spent else 0)
+                                    for category, amount in self._categories.items()}
             }
+
+class JsonFinanceStore:
+    """Cached access to the JSON ledger.
+
+    The parsed file is kept in memory and only re-read when its mtime, size
+    or inode change (e.g. another process wrote it). Readers get the cached
+    snapshot; writers go through transaction(), which works on a private copy
+    under a lock and publishes it with an atomic file replace, so concurrent
+    POSTs are serialised instead of overwriting each other. Cached snapshots
+    must be treated as read-only outside a transaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._data = None
+        self._signature = None
+        self._generation = 0  # bumped whenever self._data is replaced
+        self._month_index = {}
+        self.aggregates = HistoryAggregates()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            return None
+
+    def _reindex(self, data):
+        self._month_index = {m['month']: i for i, m in enumerate(data['history'])}
+
+    def _refresh(self):
+        signature = self._stat()
+        if self._data is not None and signature == self._signature:
+            return
+        if signature is None:
+            data = default_data()
+        else:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        self._data = data
+        self._signature = signature
+        self._generation += 1
+        self._reindex(data)
+
+    def _write(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.finance_', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._data = data
+        self._signature = self._stat()
+        self._generation += 1
+        self._reindex(data)
+
+    def load(self):
+        working = getattr(self._local, 'data', None)
+        if working is not None:
+            return working
+        data = self._data
+        if data is not None and self._stat() == self._signature:
+            return data
+        with self._lock:
+            self._refresh()
+            return self._data
+
+    def save(self, data):
+        with self._lock:
+            self._write(data)
+
+    @contextmanager
+    def transaction(self):
+        """Yield a private copy of the data and write it back if the block succeeds."""
+        working = getattr(self._local, 'data', None)
+        if working is not None:  # nested: join the outer transaction
+            yield working
+            return
+        with self._lock:
+            self._refresh()
+            working = copy.deepcopy(self._data)
+            self._local.data = working
+            self._local.saved = {}
+            self._local.reset = False
+            try:
+                yield working
+                generation = self._generation
+                self._write(working)
+                if self._local.reset:
+                    self.aggregates.clear(generation)
+                self.aggregates.update(self._local.saved.values(), generation, self._generation)
+            finally:
+                self._local.data = None
+
+    def get_month(self, month):
+        history = self.load()['history']
+        i = self._month_index.get(month)
+        if i is not None and i < len(history) and history[i]['month'] == month:
+            return history[i]
+        # Index belongs to a newer or older snapshot than this one
+        return next((m for m in history if m['month'] == month), None)
+
+    def month_exists(self, month):
+        return self.get_month(month) is not None
+
+    def add_month(self, month_data):
+        with self.transaction() as data:
+            data['history'].append(month_data)
+            self._month_index[month_data['month']] = len(data['history']) - 1
+            self._local.saved[month_data['month']] = month_data
+
+    def save_month(self, month_data):
+        """Write back a month fetched with get_month (a no-op inside a transaction)."""
+        with self.transaction() as data:
+            i = self._month_index.get(month_data['month'])
+            if i is not None and i < len(data['history']) and data['history'][i]['month'] == month_data['month']:
+                data['history'][i] = month_data
+            else:
+                data['history'].append(month_data)
+                self._month_index[month_data['month']] = len(data['history']) - 1
+            self._local.saved[month_data['month']] = month_data
+
+    def reset(self):
+        """Clear all months and totals but keep the food prices."""
+        with self.transaction() as data:
+            food_prices = data['food_prices']
+            data.clear()
+            data.update(default_data())
+            data['food_prices'] = food_prices
+            self._local.saved = {}
+            self._local.reset = True
+
+    def history_summary(self):
+        """Rolling aggregates plus ledger totals, without walking the history."""
+        data = self.load()
+        if self.aggregates.tag != self._generation:
+            # First use, or the file was replaced by another process
+            with self._lock:
+                self._refresh()
+                data = self._data
+                self.aggregates.rebuild(data['history'], self._generation)
+        summary = self.aggregates.summary()
+        summary.update(total_savings=data['total_savings'], short_term_savings=data['short_term_savings'])
+        return summary
+
+class SqliteFinanceStore:
+    """SQLite storage engine with the same interface as JsonFinanceStore.
+
+    Months, expenditures, food transactions and loans live in normalised
+    tables keyed/indexed by month, so single-month reads and writes are
+    indexed row operations. Each thread gets its own connection (WAL mode,
+    so readers never block the writer) and transactions use BEGIN IMMEDIATE,
+    which makes the app safe under multi-worker WSGI servers. load() serves
+    a cached full snapshot that is rebuilt only when the revision counter,
+    bumped by every write, changes.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS food (
+            food TEXT PRIMARY KEY,
+            buy REAL NOT NULL DEFAULT 0,
+            sell REAL NOT NULL DEFAULT 0,
+            inventory REAL NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS months (
+            month TEXT PRIMARY KEY,
+            income REAL NOT NULL DEFAULT 0,
+            savings_reserve REAL NOT NULL DEFAULT 0,
+            investments REAL NOT NULL DEFAULT 0,
+            emergency_fund REAL NOT NULL DEFAULT 0,
+            available_budget REAL NOT NULL DEFAULT 0,
+            savings_total REAL NOT NULL DEFAULT 0,
+            savings_json TEXT NOT NULL DEFAULT '{}',
+            budget_analysis_json TEXT NOT NULL DEFAULT '{}',
+            extra_json TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE TABLE IF NOT EXISTS expenditures (
+            month TEXT NOT NULL REFERENCES months(month) ON DELETE CASCADE,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL DEFAULT 0,
+            position INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, category)
+        );
+        CREATE TABLE IF NOT EXISTS food_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            month TEXT NOT NULL REFERENCES months(month) ON DELETE CASCADE,
+            kind TEXT NOT NULL CHECK (kind IN ('purchase', 'sale')),
+            food TEXT NOT NULL,
+            quantity REAL NOT NULL DEFAULT 0,
+            price REAL NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_food_transactions_month ON food_transactions(month);
+        CREATE TABLE IF NOT EXISTS loans (
+            month TEXT PRIMARY KEY REFERENCES months(month) ON DELETE CASCADE,
+            needed INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            extra_json TEXT NOT NULL DEFAULT '{}'
+        );
+    '''
+
+    MONTH_COLUMNS = ('income', 'savings_reserve', 'investments', 'emergency_fund', 'available_budget')
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = []
+        self._snapshot = None
+        self._snapshot_revision = None
+        self.aggregates = HistoryAggregates()
+        conn = self._connection()
+        conn.executescript(self.SCHEMA)
+        if conn.execute("SELECT 1 FROM settings WHERE key = 'revision'").fetchone() is None:
+            self._write_ledger(conn, default_data())
+            conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('revision', '0')")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def _revision(self, conn):
+        return int(conn.execute("SELECT value FROM settings WHERE key = 'revision'").fetchone()[0])
+
+    def _read_ledger(self, conn):
+        settings = {row['key']: json.loads(row['value']) for row in conn.execute('SELECT key, value FROM settings')}
+        food_inventory, food_prices = {}, {}
+        for row in conn.execute('SELECT food, buy, sell, inventory FROM food ORDER BY rowid'):
+            food_inventory[row['food']] = row['inventory']
+            food_prices[row['food']] = {'buy': row['buy'], 'sell': row['sell']}
+        return {
+            'total_savings': settings.get('total_savings', 0),
+            'short_term_savings': settings.get('short_term_savings', 0),
+            'food_inventory': food_inventory,
+            'food_prices': food_prices
         }
 
-# Save data to JSON file
+    def _write_ledger(self, conn, ledger):
+        conn.executemany('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', [
+            ('total_savings', json.dumps(ledger['total_savings'])),
+            ('short_term_savings', json.dumps(ledger['short_term_savings']))
+        ])
+        foods = list(ledger['food_prices']) + [f for f in ledger['food_inventory'] if f not in ledger['food_prices']]
+        conn.executemany('''
+            INSERT INTO food (food, buy, sell, inventory) VALUES (?, ?, ?, ?)
+            ON CONFLICT(food) DO UPDATE SET buy = excluded.buy, sell = excluded.sell, inventory = excluded.inventory
+        ''', [(
+            food,
+            ledger['food_prices'].get(food, {}).get('buy', 0),
+            ledger['food_prices'].get(food, {}).get('sell', 0),
+            ledger['food_inventory'].get(food, 0)
+        ) for food in foods])
+
+    def _build_months(self, conn, months):
+        """Assemble month dicts from month rows plus their child rows."""
+        if not months:
+            return []
+        by_month = {}
+        result = []
+        for row in months:
+            month = json.loads(row['extra_json'])
+            month['month'] = row['month']
+            for column in self.MONTH_COLUMNS:
+                month[column] = row[column]
+            month['expenditures'] = {}
+            month['food_purchases'] = []
+            month['food_sales'] = []
+            month['savings'] = json.loads(row['savings_json'])
+            month['loan'] = {'needed': False, 'total': 0}
+            month['budget_analysis'] = json.loads(row['budget_analysis_json'])
+            by_month[row['month']] = month
+            result.append(month)
+
+        if len(months) == 1:
+            where, params = 'WHERE month = ?', (months[0]['month'],)
+        else:
+            where, params = '', ()
+        for row in conn.execute(f'SELECT month, category, amount FROM expenditures {where} ORDER BY month, position', params):
+            if row['month'] in by_month:
+                by_month[row['month']]['expenditures'][row['category']] = row['amount']
+        for row in conn.execute(f'SELECT month, kind, food, quantity, price, amount FROM food_transactions {where} ORDER BY id', params):
+            if row['month'] in by_month:
+                if row['kind'] == 'purchase':
+                    by_month[row['month']]['food_purchases'].append(
+                        {'food': row['food'], 'quantity': row['quantity'], 'price': row['price'], 'cost': row['amount']})
+                else:
+                    by_month[row['month']]['food_sales'].append(
+                        {'food': row['food'], 'quantity': row['quantity'], 'price': row['price'], 'income': row['amount']})
+        for row in conn.execute(f'SELECT month, needed, total, extra_json FROM loans {where}', params):
+            if row['month'] in by_month:
+                loan = json.loads(row['extra_json'])
+                loan.update({'needed': bool(row['needed']), 'total': row['total']})
+                by_month[row['month']]['loan'] = loan
+        return result
+
+    def _write_month(self, conn, month_data):
+        known = set(self.MONTH_COLUMNS) | {'month', 'expenditures', 'food_purchases', 'food_sales', 'savings', 'loan', 'budget_analysis'}
+        extra = {k: v for k, v in month_data.items() if k not in known}
+        savings = month_data.get('savings', {})
+        month = month_data['month']
+        conn.execute(f'''
+            INSERT INTO months (month, {', '.join(self.MONTH_COLUMNS)}, savings_total, savings_json, budget_analysis_json, extra_json)
+            VALUES (?, {', '.join('?' for _ in self.MONTH_COLUMNS)}, ?, ?, ?, ?)
+            ON CONFLICT(month) DO UPDATE SET
+                {', '.join(f'{c} = excluded.{c}' for c in self.MONTH_COLUMNS)},
+                savings_total = excluded.savings_total,
+                savings_json = excluded.savings_json,
+                budget_analysis_json = excluded.budget_analysis_json,
+                extra_json = excluded.extra_json
+        ''', (month, *[month_data.get(c, 0) for c in self.MONTH_COLUMNS], savings.get('total', 0),
+              json.dumps(savings), json.dumps(month_data.get('budget_analysis', {})), json.dumps(extra)))
+
+        conn.execute('DELETE FROM expenditures WHERE month = ?', (month,))
+        conn.executemany('INSERT INTO expenditures (month, category, amount, position) VALUES (?, ?, ?, ?)',
+                         [(month, category, amount, i) for i, (category, amount) in enumerate(month_data.get('expenditures', {}).items())])
+
+        conn.execute('DELETE FROM food_transactions WHERE month = ?', (month,))
+        conn.executemany('INSERT INTO food_transactions (month, kind, food, quantity, price, amount) VALUES (?, ?, ?, ?, ?, ?)',
+                         [(month, 'purchase', p['food'], p.get('quantity', 0), p.get('price', 0), p.get('cost', 0))
+                          for p in month_data.get('food_purchases', [])] +
+                         [(month, 'sale', p['food'], p.get('quantity', 0), p.get('price', 0), p.get('income', 0))
+                          for p in month_data.get('food_sales', [])])
+
+        loan = month_data.get('loan', {})
+        conn.execute('INSERT OR REPLACE INTO loans (month, needed, total, extra_json) VALUES (?, ?, ?, ?)', (
+            month, int(bool(loan.get('needed', False))), loan.get('total', 0),
+            json.dumps({k: v for k, v in loan.items() if k not in ('needed', 'total')})))
+
+    def load(self):
+        working = getattr(self._local, 'working', None)
+        if working is not None:
+            return working
+        conn = self._connection()
+        revision = self._revision(conn)
+        snapshot = self._snapshot
+        if snapshot is not None and revision == self._snapshot_revision:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or revision != self._snapshot_revision:
+                conn.execute('BEGIN')
+                try:
+                    revision = self._revision(conn)
+                    data = self._read_ledger(conn)
+                    data['history'] = self._build_months(conn, conn.execute('SELECT * FROM months ORDER BY rowid').fetchall())
+                finally:
+                    conn.execute('COMMIT')
+                self._snapshot = data
+                self._snapshot_revision = revision
+            return self._snapshot
+
+    def save(self, data):
+        """Replace the whole ledger (used by the JSON migrator)."""
+        with self.transaction() as working:
+            conn = self._connection()
+            conn.execute('DELETE FROM months')
+            conn.execute('DELETE FROM food')
+            self._local.saved = {}
+            self._local.reset = True
+            for month_data in data.get('history', []):
+                self._write_month(conn, month_data)
+                self._local.saved[month_data['month']] = month_data
+            working.update({k: data[k] for k in ('total_savings', 'short_term_savings', 'food_inventory', 'food_prices') if k in data})
+
+    @contextmanager
+    def transaction(self):
+        """Yield the ledger totals/prices/inventory; months go through get_month/save_month."""
+        working = getattr(self._local, 'working', None)
+        if working is not None:  # nested: join the outer transaction
+            yield working
+            return
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            revision = self._revision(conn)
+            working = self._read_ledger(conn)
+            self._local.working = working
+            self._local.saved = {}
+            self._local.reset = False
+            yield working
+            self._write_ledger(conn, working)
+            conn.execute("UPDATE settings SET value = CAST(value AS INTEGER) + 1 WHERE key = 'revision'")
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            self._local.working = None
+        if self._local.reset:
+            self.aggregates.clear(revision)
+        self.aggregates.update(self._local.saved.values(), revision, revision + 1)
+
+    def get_month(self, month):
+        conn = self._connection()
+        rows = conn.execute('SELECT * FROM months WHERE month = ?', (month,)).fetchall()
+        months = self._build_months(conn, rows)
+        return months[0] if months else None
+
+    def month_exists(self, month):
+        return self._connection().execute('SELECT 1 FROM months WHERE month = ?', (month,)).fetchone() is not None
+
+    def add_month(self, month_data):
+        self.save_month(month_data)
+
+    def save_month(self, month_data):
+        with self.transaction():
+            self._write_month(self._connection(), month_data)
+            self._local.saved[month_data['month']] = month_data
+
+    def reset(self):
+        """Clear all months and totals but keep the food prices."""
+        with self.transaction() as working:
+            self._connection().execute('DELETE FROM months')
+            defaults = default_data()
+            working['total_savings'] = defaults['total_savings']
+            working['short_term_savings'] = defaults['short_term_savings']
+            working['food_inventory'] = {food: 0 for food in working['food_inventory']}
+            self._local.saved = {}
+            self._local.reset = True
+
+    def history_summary(self):
+        """Rolling aggregates plus ledger totals, without walking the history."""
+        conn = self._connection()
+        if self.aggregates.tag != self._revision(conn):
+            # First use, or another process wrote to the database
+            data = self.load()
+            with self._lock:
+                revision = self._snapshot_revision if self._snapshot is data else None
+            self.aggregates.rebuild(data['history'], revision)
+        summary = self.aggregates.summary()
+        ledger = self._read_ledger(conn)
+        summary.update(total_savings=ledger['total_savings'], short_term_savings=ledger['short_term_savings'])
+        return summary
+
+    def is_empty(self):
+        conn = self._connection()
+        return conn.execute('SELECT 1 FROM months LIMIT 1').fetchone() is None and \
+            conn.execute("SELECT 1 FROM settings WHERE key = 'migrated_from'").fetchone() is None
+
+    def migrate_from_json(self, json_path):
+        """One-time import of an existing JSON ledger."""
+        with open(json_path, 'r') as f:
+            data = json.load(f)
+        with self.transaction():
+            self.save(data)
+            self._connection().execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('migrated_from', ?)",
+                                       (json.dumps(os.path.abspath(json_path)),))
+        return len(data.get('history', []))
+
+def create_store(directory='.'):
+    data_file = os.path.join(directory, os.path.basename(DATA_FILE))
+    if STORAGE_ENGINE == 'sqlite':
+        sqlite_store = SqliteFinanceStore(os.path.join(directory, os.path.basename(DATABASE_FILE)))
+        if sqlite_store.is_empty() and os.path.exists(data_file):
+            sqlite_store.migrate_from_json(data_file)
+        return sqlite_store
+    return JsonFinanceStore(data_file)
+
+class UserRegistry:
+    """Accounts in a small SQLite database (one connection per thread)."""
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE COLLATE NOCASE,
+            password_hash TEXT NOT NULL,
+            created TEXT NOT NULL
+        );
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def count(self):
+        return self._connection().execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def create(self, username, password):
+        """Return the new user's id, or None if the username is taken."""
+        try:
+            cursor = self._connection().execute(
+                'INSERT INTO users (username, password_hash, created) VALUES (?, ?, ?)',
+                (username, generate_password_hash(password), datetime.now().isoformat(timespec='seconds')))
+        except sqlite3.IntegrityError:
+            return None
+        return cursor.lastrowid
+
+    def authenticate(self, username, password):
+        row = self._connection().execute('SELECT id, username, password_hash FROM users WHERE username = ?',
+                                         (username,)).fetchone()
+        if row and check_password_hash(row['password_hash'], password):
+            return row['id'], row['username']
+        return None
+
+class TenantStores:
+    """Per-user stores, opened on demand and kept in a bounded LRU.
+
+    Only the most recently used TENANT_CACHE_SIZE stores (with their parsed
+    snapshots and aggregates) stay in memory, so hot tenants are served from
+    cache without holding every ledger. An evicted store that a request is
+    still using is found again through the weak map, so two store objects
+    (and two locks) never exist for the same ledger at once.
+    """
+
+    def __init__(self, root, max_open=TENANT_CACHE_SIZE):
+        self.root = root
+        self.max_open = max(max_open, 1)
+        self._open = OrderedDict()
+        self._live = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def directory(self, user_id):
+        return os.path.join(self.root, str(int(user_id)))
+
+    def get(self, user_id):
+        with self._lock:
+            tenant_store = self._open.get(user_id)
+            if tenant_store is not None:
+                self._open.move_to_end(user_id)
+                return tenant_store
+            tenant_store = self._live.get(user_id)
+            if tenant_store is None:
+                directory = self.directory(user_id)
+                os.makedirs(directory, exist_ok=True)
+                tenant_store = create_store(directory)
+                self._live[user_id] = tenant_store
+            self._open[user_id] = tenant_store
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+            return tenant_store
+
+    def adopt_legacy_ledger(self, user_id):
+        """Give the first account the pre-accounts single-user ledger, if there is one."""
+        directory = self.directory(user_id)
+        os.makedirs(directory, exist_ok=True)
+        for path in (DATA_FILE, DATABASE_FILE):
+            if os.path.exists(path):
+                shutil.copy2(path, os.path.join(directory, os.path.basename(path)))
+
+users = UserRegistry(USERS_DATABASE)
+tenant_stores = TenantStores(TENANTS_DIR)
+
+def current_store():
+    if 'store' not in g:
+        g.store = tenant_stores.get(session['user_id'])
+    return g.store
+
+# The signed-in user's store; routes use it like a single global store
+store = LocalProxy(current_store)
+
+PUBLIC_ENDPOINTS = {'login', 'register', 'static'}
+
+@app.before_request
+def require_login():
+    if request.endpoint in PUBLIC_ENDPOINTS or 'user_id' in session:
+        return None
+    if request.path.startswith(('/api/', '/jobs/')):
+        return api_error(401, 'Login required')
+    return redirect(url_for('login', next=request.full_path.rstrip('?')))
+
+def safe_next(target):
+    # Only follow local paths after login
+    return target if target and target.startswith('/') and not target.startswith('//') else url_for('month_selector')
+
+def start_session(user_id, username):
+    session.clear()
+    session['user_id'] = user_id
+    session['username'] = username
+
+@app.route('/register', methods=['GET', 'POST'])
+def register():
+    if request.method == 'POST':
+        username = request.form.get('username', '').strip()
+        password = request.form.get('password', '')
+        if not USERNAME_PATTERN.fullmatch(username):
+            flash('Usernames are 3-32 letters, digits, dots, dashes or underscores.', 'error')
+        elif len(password) < 8:
+            flash('Passwords must be at least 8 characters.', 'error')
+        elif password != request.form.get('confirm', password):
+            flash('Passwords do not match.', 'error')
+        else:
+            first_account = users.count() == 0
+            user_id = users.create(username, password)
+            if user_id is None:
+                flash(f'The username {username} is already taken.', 'error')
+            else:
+                if first_account:
+                    tenant_stores.adopt_legacy_ledger(user_id)
+                start_session(user_id, username)
+                return redirect(url_for('month_selector'))
+    return render_template('register.html')
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        account = users.authenticate(request.form.get('username', '').strip(), request.form.get('password', ''))
+        if account:
+            start_session(*account)
+            return redirect(safe_next(request.args.get('next')))
+        flash('Invalid username or password.', 'error')
+    return render_template('login.html')
+
+@app.route('/logout', methods=['POST'])
+def logout():
+    session.clear()
+    return redirect(url_for('login'))
+
+# Load data (cached, re-read only when the file changes)
+def load_data():
+    return store.load()
+
+# Save data to JSON file atomically
 def save_data(data):
-    with open('finance_data.json', 'w') as f:
-        json.dump(data, f, indent=4)
+    store.save(data)
 
 # Home page - Month selector
 @app.route('/', methods=['GET', 'POST'])
 @app.route('/month_selector', methods=['GET', 'POST'])
 def month_selector():
-    data = load_data()
-    
     if request.method == 'POST':
         month = request.form['month']
         action = request.form['action']
         
         # Check if month already exists
-        month_exists = any(m['month'] == month for m in data['history'])
+        month_exists = store.month_exists(month)
         
         if action == 'new' and month_exists:
             flash(f"Month {month} already exists. Please choose 'Load Existing Month' or select a different month.", 'error')
@@ -96,15 +902,16 @@ def month_selector():
                 "budget_analysis": {}
             }
             
-            # Add to history if it doesn't exist
-            if not month_exists:
-                data['history'].append(new_month)
-                save_data(data)
+            # Add to history if it doesn't exist (re-checked under the store lock)
+            with store.transaction():
+                if not store.month_exists(month):
+                    store.add_month(new_month)
             
             return redirect(url_for('income', month=month))
         else:  # Load existing
             return redirect(url_for('results', month=month))
     
+    data = load_data()
     return render_template('month_selector.html', data=data)
 
 # Income page
@@ -114,7 +921,7 @@ def income():
     data = load_data()
     
     # Find the current month in history
-    current_month = next((m for m in data['history'] if m['month'] == month), None)
+    current_month = store.get_month(month)
     
     if not current_month:
         flash('Month not found. Please select a valid month.', 'error')
@@ -129,15 +936,16 @@ def income():
         emergency_fund = income * 0.1   # 10%
         available_budget = income * 0.5  # 50%
         
-        # Update month data
-        current_month['income'] = income
-        current_month['savings_reserve'] = savings_reserve
-        current_month['investments'] = investments
-        current_month['emergency_fund'] = emergency_fund
-        current_month['available_budget'] = available_budget
-        
-        # Save data
-        save_data(data)
+        with store.transaction():
+            current_month = store.get_month(month)
+            if current_month:
+                # Update month data
+                current_month['income'] = income
+                current_month['savings_reserve'] = savings_reserve
+                current_month['investments'] = investments
+                current_month['emergency_fund'] = emergency_fund
+                current_month['available_budget'] = available_budget
+                store.save_month(current_month)
         
         return redirect(url_for('expenditure', month=month))
     
@@ -150,109 +958,113 @@ def expenditure():
     data = load_data()
     
     # Find the current month in history
-    current_month = next((m for m in data['history'] if m['month'] == month), None)
+    current_month = store.get_month(month)
     
     if not current_month:
         flash('Month not found. Please select a valid month.', 'error')
         return redirect(url_for('month_selector'))
     
     if request.method == 'POST':
-        # Get regular expenses
-        current_month['expenditures']['upkeep'] = float(request.form['upkeep'])
-        current_month['expenditures']['transport'] = float(request.form.get('transport', 0))
-        current_month['expenditures']['utilities'] = float(request.form.get('utilities', 0))
-        current_month['expenditures']['entertainment'] = float(request.form.get('entertainment', 0))
-        current_month['expenditures']['rent'] = float(request.form.get('rent', 0))
-        
-        # Process food transactions
-        food_purchases = []
-        food_sales = []
-        
-        for food in data['food_prices'].keys():
-            # Update food prices
-            buy_price = float(request.form[f'{food}_buy'])
-            sell_price = float(request.form[f'{food}_sell'])
-            data['food_prices'][food]['buy'] = buy_price
-            data['food_prices'][food]['sell'] = sell_price
+        with store.transaction() as data:
+            current_month = store.get_month(month)
+            if not current_month:
+                flash('Month not found. Please select a valid month.', 'error')
+                return redirect(url_for('month_selector'))
             
-            # Process quantity
-            qty = float(request.form.get(f'{food}_qty', 0))
+            # Get regular expenses
+            current_month['expenditures']['upkeep'] = float(request.form['upkeep'])
+            current_month['expenditures']['transport'] = float(request.form.get('transport', 0))
+            current_month['expenditures']['utilities'] = float(request.form.get('utilities', 0))
+            current_month['expenditures']['entertainment'] = float(request.form.get('entertainment', 0))
+            current_month['expenditures']['rent'] = float(request.form.get('rent', 0))
             
-            if qty > 0:  # Buying
-                cost = qty * buy_price
-                food_purchases.append({
-                    'food': food,
-                    'quantity': qty,
-                    'price': buy_price,
-                    'cost': cost
-                })
-                data['food_inventory'][food] = data['food_inventory'].get(food, 0) + qty
-            elif qty < 0:  # Selling
-                qty_abs = abs(qty)
-                if data['food_inventory'].get(food, 0) >= qty_abs:
-                    income = qty_abs * sell_price
-                    food_sales.append({
+            # Process food transactions
+            food_purchases = []
+            food_sales = []
+            
+            for food in data['food_prices'].keys():
+                # Update food prices
+                buy_price = float(request.form[f'{food}_buy'])
+                sell_price = float(request.form[f'{food}_sell'])
+                data['food_prices'][food]['buy'] = buy_price
+                data['food_prices'][food]['sell'] = sell_price
+            
+                # Process quantity
+                qty = float(request.form.get(f'{food}_qty', 0))
+            
+                if qty > 0:  # Buying
+                    cost = qty * buy_price
+                    food_purchases.append({
                         'food': food,
-                        'quantity': qty_abs,
-                        'price': sell_price,
-                        'income': income
+                        'quantity': qty,
+                        'price': buy_price,
+                        'cost': cost
                     })
-                    data['food_inventory'][food] = data['food_inventory'].get(food, 0) - qty_abs
-        
-        current_month['food_purchases'] = food_purchases
-        current_month['food_sales'] = food_sales
-        
-        # Calculate total expenses
-        total_expenses = sum(current_month['expenditures'].values())
-        total_expenses += sum(item['cost'] for item in food_purchases)
-        total_expenses -= sum(item['income'] for item in food_sales)
-        
-        # Check if loan is needed
-        loan_needed = total_expenses > current_month['available_budget']
-        loan_amount = max(0, total_expenses - current_month['available_budget'])
-        
-        current_month['loan']['needed'] = loan_needed
-        current_month['loan']['total'] = loan_amount
-        
-        # Update savings
-        if not loan_needed:
-            # Add remaining budget to short-term savings
-            remaining_budget = current_month['available_budget'] - total_expenses
-            data['short_term_savings'] += remaining_budget
+                    data['food_inventory'][food] = data['food_inventory'].get(food, 0) + qty
+                elif qty < 0:  # Selling
+                    qty_abs = abs(qty)
+                    if data['food_inventory'].get(food, 0) >= qty_abs:
+                        income = qty_abs * sell_price
+                        food_sales.append({
+                            'food': food,
+                            'quantity': qty_abs,
+                            'price': sell_price,
+                            'income': income
+                        })
+                        data['food_inventory'][food] = data['food_inventory'].get(food, 0) - qty_abs
             
-            # Add to long-term savings
-            data['total_savings'] += current_month['savings_reserve']
-            data['total_savings'] += current_month['investments']
-            data['total_savings'] += current_month['emergency_fund']
-        
-        # Calculate budget analysis
-        planned_budget = current_month['available_budget'] * 0.5  # Assume 50% for regular expenses
-        actual_expenses = sum(current_month['expenditures'].values())
-        
-        variance_percentage = ((actual_expenses - planned_budget) / planned_budget * 100) if planned_budget > 0 else 0
-        
-        current_month['budget_analysis'] = {
-            'planned': {
-                'regular': planned_budget,
-                'food': current_month['available_budget'] * 0.3,  # 30% for food
-                'other': current_month['available_budget'] * 0.2   # 20% for other
-            },
-            'actual': {
-                'regular': actual_expenses,
-                'food': sum(item['cost'] for item in food_purchases),
-                'other': 0  # Placeholder for other expenses
-            },
-            'variance': {
-                'regular': variance_percentage,
-                'food': 0,  # Will be calculated
-                'other': 0   # Will be calculated
-            },
-            'significant': abs(variance_percentage) > 10  # More than 10% variance is significant
-        }
-        
-        # Save data
-        save_data(data)
-        
+            current_month['food_purchases'] = food_purchases
+            current_month['food_sales'] = food_sales
+            
+            # Calculate total expenses
+            total_expenses = sum(current_month['expenditures'].values())
+            total_expenses += sum(item['cost'] for item in food_purchases)
+            total_expenses -= sum(item['income'] for item in food_sales)
+            
+            # Check if loan is needed
+            loan_needed = total_expenses > current_month['available_budget']
+            loan_amount = max(0, total_expenses - current_month['available_budget'])
+            
+            current_month['loan']['needed'] = loan_needed
+            current_month['loan']['total'] = loan_amount
+            
+            # Update savings
+            if not loan_needed:
+                # Add remaining budget to short-term savings
+                remaining_budget = current_month['available_budget'] - total_expenses
+                data['short_term_savings'] += remaining_budget
+            
+                # Add to long-term savings
+                data['total_savings'] += current_month['savings_reserve']
+                data['total_savings'] += current_month['investments']
+                data['total_savings'] += current_month['emergency_fund']
+            
+            # Calculate budget analysis
+            planned_budget = current_month['available_budget'] * 0.5  # Assume 50% for regular expenses
+            actual_expenses = sum(current_month['expenditures'].values())
+            
+            variance_percentage = ((actual_expenses - planned_budget) / planned_budget * 100) if planned_budget > 0 else 0
+            
+            current_month['budget_analysis'] = {
+                'planned': {
+                    'regular': planned_budget,
+                    'food': current_month['available_budget'] * 0.3,  # 30% for food
+                    'other': current_month['available_budget'] * 0.2   # 20% for other
+                },
+                'actual': {
+                    'regular': actual_expenses,
+                    'food': sum(item['cost'] for item in food_purchases),
+                    'other': 0  # Placeholder for other expenses
+                },
+                'variance': {
+                    'regular': variance_percentage,
+                    'food': 0,  # Will be calculated
+                    'other': 0   # Will be calculated
+                },
+                'significant': abs(variance_percentage) > 10  # More than 10% variance is significant
+            }
+            
+            store.save_month(current_month)
         return redirect(url_for('results', month=month))
     
     return render_template('expenditure.html', 
@@ -267,69 +1079,174 @@ def results():
     data = load_data()
     
     # Find the current month in history
-    current_month = next((m for m in data['history'] if m['month'] == month), None)
+    current_month = store.get_month(month)
     
     if not current_month:
         flash('Month not found. Please select a valid month.', 'error')
         return redirect(url_for('month_selector'))
     
-    # Generate graphs
-    graphs = generate_graphs(data, current_month)
-    
+    # Charts are linked as /chart/<key>.png and rendered (or served from the
+    # chart cache) when the browser requests them
     return render_template('results.html', 
                          current_month=current_month, 
                          data=data,
-                         graphs=graphs)
+                         chart_urls=chart_urls(data, current_month))
 
 # History page
 @app.route('/history')
 def history():
     data = load_data()
-    return render_template('history.html', data=data)
+    return render_template('history.html', data=data, summary=store.history_summary())
 
 # Clear all data
 @app.route('/clear_data', methods=['POST'])
 def clear_data():
     # Reset to initial data structure but keep food prices
-    data = load_data()
-    initial_food_prices = data['food_prices']
-    
-    new_data = {
-        "history": [],
-        "total_savings": 472000,
-        "short_term_savings": 0,
-        "food_inventory": {
-            "maize": 0,
-            "rice": 0,
-            "beans": 0,
-            "wheat": 0,
-            "sorghum": 0
-        },
-        "food_prices": initial_food_prices
-    }
-    
-    save_data(new_data)
+    store.reset()
     flash('All data has been cleared.', 'info')
     return redirect(url_for('history'))
 
-# Export CSV
-@app.route('/export_csv')
-def export_csv():
-    data = load_data()
-    
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
+# JSON API (v1)
+API_DEFAULT_LIMIT = 50
+API_MAX_LIMIT = 500
+_api_index = (None, [], [])  # (snapshot, sorted month keys, months in the same order)
+
+def api_month_index(data):
+    """Months sorted by key, computed once per store snapshot."""
+    global _api_index
+    snapshot, keys, months = _api_index
+    if snapshot is not data:
+        months = sorted(data['history'], key=lambda m: m['month'])
+        keys = [m['month'] for m in months]
+        _api_index = (data, keys, months)
+    return keys, months
+
+def api_response(payload, status=200):
+    body = json.dumps(payload, separators=(',', ':'))
+    response = make_response(body, status)
+    response.mimetype = 'application/json'
+    if status == 200:
+        response.set_etag(hashlib.sha1(body.encode()).hexdigest())
+        response.headers['Cache-Control'] = 'no-cache'
+        response = response.make_conditional(request)
+    return response
+
+def api_error(status, message):
+    return api_response({'error': message}, status)
+
+def api_fields():
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return {field.strip() for field in fields.split(',') if field.strip()} | {'month'}
+
+def select_fields(month, fields):
+    if fields is None:
+        return month
+    return {key: value for key, value in month.items() if key in fields}
+
+def encode_cursor(month):
+    return base64.urlsafe_b64encode(month.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    return base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+
+@app.route('/api/v1/months')
+def api_months():
+    try:
+        limit = min(max(int(request.args.get('limit', API_DEFAULT_LIMIT)), 1), API_MAX_LIMIT)
+        after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        return api_error(400, 'Invalid limit or cursor')
+    start = request.args.get('from')
+    end = request.args.get('to')
+    for value in (start, end):
+        if value and not MONTH_PATTERN.fullmatch(value):
+            return api_error(400, 'Months must be in YYYY-MM format')
     
-    # Write header
-    writer.writerow(['Month', 'Income', 'Savings Reserve', 'Investments', 
-                    'Emergency Fund', 'Available Budget', 'Upkeep', 'Transport',
-                    'Utilities', 'Entertainment', 'Rent', 'Total Savings', 
-                    'Loan Needed', 'Loan Amount'])
+    keys, months = api_month_index(load_data())
+    # Keyset pagination: binary search for the first month after the cursor
+    i = max(bisect.bisect_right(keys, after) if after else 0,
+            bisect.bisect_left(keys, start) if start else 0)
+    j = bisect.bisect_right(keys, end) if end else len(keys)
+    page = months[i:min(i + limit, j)]
     
-    # Write data
-    for month in data['history']:
-        writer.writerow([
+    fields = api_fields()
+    next_cursor = encode_cursor(page[-1]['month']) if page and i + limit < j else None
+    return api_response({
+        'items': [select_fields(month, fields) for month in page],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/v1/months/<month>')
+def api_month(month):
+    current_month = store.get_month(month)
+    if not current_month:
+        return api_error(404, f'Month {month} not found')
+    return api_response(select_fields(current_month, api_fields()))
+
+@app.route('/api/v1/months/<month>/summary')
+def api_month_summary(month):
+    current_month = store.get_month(month)
+    if not current_month:
+        return api_error(404, f'Month {month} not found')
+    expenses = month_expenses(current_month)
+    return api_response({
+        'month': month,
+        'income': current_month['income'],
+        'expenses': expenses,
+        'available_budget': current_month['available_budget'],
+        'surplus': current_month['available_budget'] - expenses,
+        'savings_total': current_month['savings']['total'],
+        'loan': current_month['loan'],
+        'budget_significant': current_month.get('budget_analysis', {}).get('significant', False)
+    })
+
+@app.route('/api/v1/summary')
+def api_summary():
+    summary = store.history_summary()
+    return api_response({
+        'months': summary['months'],
+        'first_month': summary['first_month'],
+        'last_month': summary['last_month'],
+        'total_savings': summary['total_savings'],
+        'short_term_savings': summary['short_term_savings'],
+        'total_income': summary['total_income'],
+        'total_expenses': summary['total_expenses'],
+        'total_loans': summary['loan_total']
+    })
+
+@app.route('/api/v1/history/summary')
+def api_history_summary():
+    return api_response(store.history_summary())
+
+@app.route('/api/v1/food_inventory')
+def api_food_inventory():
+    data = load_data()
+    return api_response({
+        food: {
+            'quantity': quantity,
+            'buy': data['food_prices'].get(food, {}).get('buy', 0),
+            'sell': data['food_prices'].get(food, {}).get('sell', 0),
+            'value': quantity * data['food_prices'].get(food, {}).get('sell', 0)
+        }
+        for food, quantity in data['food_inventory'].items()
+    })
+
+# Export CSV
+EXPORT_HEADER = ['Month', 'Income', 'Savings Reserve', 'Investments', 
+                 'Emergency Fund', 'Available Budget', 'Upkeep', 'Transport',
+                 'Utilities', 'Entertainment', 'Rent', 'Total Savings', 
+                 'Loan Needed', 'Loan Amount']
+EXPORT_BLOCK_ROWS = 500
+MONTH_PATTERN = re.compile(r'\d{4}-\d{2}')
+
+def export_rows(history, start=None, end=None):
+    yield EXPORT_HEADER
+    for month in history:
+        if (start and month['month'] < start) or (end and month['month'] > end):
+            continue
+        yield [
             month['month'],
             month['income'],
             month['savings_reserve'],
@@ -344,79 +1261,438 @@ def export_csv():
             month['savings']['total'],
             month['loan']['needed'],
             month['loan']['total']
-        ])
-    
-    # Prepare response
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode()),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name='financial_data.csv'
-    )
-
-# Generate graphs
-def generate_graphs(data, current_month):
-    graphs = {}
+        ]
+
+def stream_csv(rows, compress=False):
+    """Encode rows as CSV in blocks, optionally gzip-compressed, without building the whole file."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31: gzip container
     
-    # Budget Allocation Pie Chart
-    plt.figure(figsize=(8, 6))
-    labels = ['Savings Reserve', 'Investments', 'Emergency Fund', 'Available Budget']
-    sizes = [
-        current_month['savings_reserve'],
-        current_month['investments'],
-        current_month['emergency_fund'],
-        current_month['available_budget']
-    ]
+    def emit(text):
+        chunk = text.encode()
+        return compressor.compress(chunk) if compressor else chunk
     
-    plt.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90)
-    plt.axis('equal')
-    plt.title('Budget Allocation')
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % EXPORT_BLOCK_ROWS == 0:
+            chunk = emit(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate(0)
+            if chunk:
+                yield chunk
+    chunk = emit(buffer.getvalue())
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+@app.route('/export_csv')
+def export_csv():
+    # Optional month range (?from=YYYY-MM&to=YYYY-MM) and compression (?gzip=1)
+    start = request.args.get('from') or None
+    end = request.args.get('to') or None
+    for value in (start, end):
+        if value and not MONTH_PATTERN.fullmatch(value):
+            abort(400, description='Months must be in YYYY-MM format')
+    compress = request.args.get('gzip') in ('1', 'true', 'yes')
     
-    # Save to base64
+    # The cached snapshot is never mutated in place, so it is safe to stream from
+    history = load_data()['history']
+    filename = 'financial_data.csv.gz' if compress else 'financial_data.csv'
+    response = Response(stream_csv(export_rows(history, start, end), compress),
+                        mimetype='application/gzip' if compress else 'text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+# Chart rendering: each renderer takes JSON-able inputs and returns PNG bytes.
+# They use explicit Figure/FigureCanvasAgg objects rather than pyplot's global
+# figure manager, so they are safe in threads and can run in worker processes.
+def figure_png(fig):
     img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png')
-    img_buffer.seek(0)
-    graphs['budget_allocation'] = base64.b64encode(img_buffer.getvalue()).decode()
-    plt.close()
-    
-    # Expense Breakdown Bar Chart
-    plt.figure(figsize=(10, 6))
-    expenses = current_month['expenditures']
-    categories = list(expenses.keys())
-    values = list(expenses.values())
+    FigureCanvasAgg(fig).print_png(img_buffer)
+    return img_buffer.getvalue()
+
+def render_budget_allocation(sizes):
+    fig = Figure(figsize=(8, 6))
+    ax = fig.add_subplot()
+    labels = ['Savings Reserve', 'Investments', 'Emergency Fund', 'Available Budget']
     
-    plt.bar(categories, values)
-    plt.title('Expense Breakdown')
-    plt.xlabel('Categories')
-    plt.ylabel('Amount (KES)')
-    plt.xticks(rotation=45)
+    ax.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90)
+    ax.axis('equal')
+    ax.set_title('Budget Allocation')
+    return figure_png(fig)
+
+def render_expense_breakdown(expenses):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    categories = [category for category, _ in expenses]
+    values = [value for _, value in expenses]
     
-    img_buffer = io.BytesIO()
-    plt.savefig(img_buffer, format='png')
-    img_buffer.seek(0)
-    graphs['expense_breakdown'] = base64.b64encode(img_buffer.getvalue()).decode()
-    plt.close()
+    ax.bar(categories, values)
+    ax.set_title('Expense Breakdown')
+    ax.set_xlabel('Categories')
+    ax.set_ylabel('Amount (KES)')
+    ax.tick_params(axis='x', rotation=45)
+    return figure_png(fig)
+
+def render_savings_progress(series):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    months = [month for month, _ in series]
+    savings = [total for _, total in series]
     
-    # Savings Progress Chart
+    ax.plot(months, savings, marker='o')
+    ax.set_title('Savings Progress Over Time')
+    ax.set_xlabel('Month')
+    ax.set_ylabel('Total Savings (KES)')
+    ax.tick_params(axis='x', rotation=45)
+    return figure_png(fig)
+
+CHART_RENDERERS = {
+    'budget_allocation': render_budget_allocation,
+    'expense_breakdown': render_expense_breakdown,
+    'savings_progress': render_savings_progress
+}
+CHART_VERSION = 2  # bump when a renderer's output changes
+CHART_KEY_PATTERN = re.compile(r'[0-9a-f]{40}')
+
+# Rendering is CPU-bound, so it runs in a bounded process pool to keep it off
+# the GIL used by request threads. EFT_RENDER_WORKERS=0 renders in-thread.
+RENDER_WORKERS = int(os.environ.get('EFT_RENDER_WORKERS', os.cpu_count() or 1))
+_render_pool = None
+_render_pool_lock = threading.Lock()
+_render_slots = threading.BoundedSemaphore(max(RENDER_WORKERS, 1) * 2)
+
+def get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+        return _render_pool
+
+def reset_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+def render_charts(specs):
+    """Render [(name, inputs), ...] to PNG bytes, in parallel when the pool is enabled."""
+    if RENDER_WORKERS <= 0:
+        return [CHART_RENDERERS[name](inputs) for name, inputs in specs]
+    # Bound the number of in-flight batches so a burst applies back-pressure
+    with _render_slots:
+        try:
+            pool = get_render_pool()
+            futures = [pool.submit(CHART_RENDERERS[name], inputs) for name, inputs in specs]
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            reset_render_pool()
+            return [CHART_RENDERERS[name](inputs) for name, inputs in specs]
+
+atexit.register(reset_render_pool)
+
+class ChartCache:
+    """Content-addressed PNG cache: in-memory LRU with an optional disk tier.
+
+    Keys are hashes of a chart's inputs, so an entry never goes stale and
+    can be served with long-lived Cache-Control headers. Charts show one
+    user's finances, so every entry belongs to a tenant: the tenant is part
+    of the hashed content and entries are only found under their own tenant.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._specs = OrderedDict()  # key -> (chart name, inputs), so /chart/<key>.png can render on a miss
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, tenant, key):
+        return os.path.join(self.disk_dir, str(tenant), f'{key}.png')
+
+    def register(self, tenant, name, inputs):
+        key = hashlib.sha1(json.dumps([CHART_VERSION, str(tenant), name, inputs], sort_keys=True,
+                                      separators=(',', ':')).encode()).hexdigest()
+        with self._lock:
+            self._specs[(tenant, key)] = (name, inputs)
+            self._specs.move_to_end((tenant, key))
+            while len(self._specs) > 4096:
+                self._specs.popitem(last=False)
+        return key
+
+    def get(self, tenant, key):
+        with self._lock:
+            png = self._entries.get((tenant, key))
+            if png is not None:
+                self._entries.move_to_end((tenant, key))
+                return png
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(tenant, key), 'rb') as f:
+                    png = f.read()
+                self._put_memory(tenant, key, png)
+                return png
+            except FileNotFoundError:
+                pass
+        return None
+
+    def _put_memory(self, tenant, key, png):
+        with self._lock:
+            if (tenant, key) in self._entries:
+                return
+            self._entries[(tenant, key)] = png
+            self._bytes += len(png)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def put(self, tenant, key, png):
+        self._put_memory(tenant, key, png)
+        if self.disk_dir:
+            tenant_dir = os.path.dirname(self._disk_path(tenant, key))
+            os.makedirs(tenant_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=tenant_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, self._disk_path(tenant, key))
+
+    def fetch(self, tenant, key):
+        """Return a tenant's PNG bytes for a key, rendering it if its inputs are known."""
+        return self.fetch_many(tenant, [key])[0]
+
+    def fetch_many(self, tenant, keys):
+        """Like fetch for several keys; all misses are rendered in one parallel batch."""
+        results = [self.get(tenant, key) for key in keys]
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                if results[i] is None and (tenant, key) in self._specs:
+                    missing.append((i, key, self._specs[(tenant, key)]))
+        if missing:
+            for (i, key, _), png in zip(missing, render_charts([spec for _, _, spec in missing])):
+                self.put(tenant, key, png)
+                results[i] = png
+        return results
+
+chart_cache = ChartCache(disk_dir=os.environ.get('EFT_CHART_CACHE_DIR'))
+
+def chart_inputs(data, current_month):
+    inputs = {
+        'budget_allocation': [
+            current_month['savings_reserve'],
+            current_month['investments'],
+            current_month['emergency_fund'],
+            current_month['available_budget']
+        ],
+        'expense_breakdown': list(current_month['expenditures'].items())
+    }
     if len(data['history']) > 1:
-        plt.figure(figsize=(10, 6))
-        months = [m['month'] for m in data['history']]
-        savings = [m['savings']['total'] for m in data['history']]
-        
-        plt.plot(months, savings, marker='o')
-        plt.title('Savings Progress Over Time')
-        plt.xlabel('Month')
-        plt.ylabel('Total Savings (KES)')
-        plt.xticks(rotation=45)
-        
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png')
-        img_buffer.seek(0)
-        graphs['savings_progress'] = base64.b64encode(img_buffer.getvalue()).decode()
-        plt.close()
+        inputs['savings_progress'] = [(m['month'], m['savings']['total']) for m in data['history']]
+    return inputs
+
+def chart_keys(data, current_month):
+    return {name: chart_cache.register(session['user_id'], name, inputs)
+            for name, inputs in chart_inputs(data, current_month).items()}
+
+def chart_urls(data, current_month):
+    return {name: url_for('chart', key=key) for name, key in chart_keys(data, current_month).items()}
+
+# Cached chart images
+@app.route('/chart/<key>.png')
+def chart(key):
+    if not CHART_KEY_PATTERN.fullmatch(key):
+        abort(404)
+    
+    # Content-addressed: a matching ETag is always still valid
+    if key in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        png = chart_cache.fetch(session['user_id'], key)
+        if png is None:
+            abort(404)
+        response = make_response(png)
+        response.mimetype = 'image/png'
+    response.set_etag(key)
+    # Per-user content: browsers may keep it, shared caches must not
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+# Background jobs: chart rendering, CSV export and clearing data can run off
+# the request thread. Submitting returns a job id at once; identical jobs that
+# are still queued or running share one id instead of repeating the work.
+JOB_WORKERS = int(os.environ.get('EFT_JOB_WORKERS', 2))
+JOB_MAX_FINISHED = 256
+JOB_TTL_SECONDS = 3600
+
+class JobQueue:
+    """Thread-pool job runner with a bounded job table.
+
+    Threads are enough here: rendering is handed to the render process pool
+    and exports are mostly encoding and file I/O. Export results are written
+    to files under a private temporary directory and removed when the job
+    is pruned.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_finished=JOB_MAX_FINISHED, ttl=JOB_TTL_SECONDS):
+        self.max_finished = max_finished
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='eft-job')
+        self._jobs = OrderedDict()  # id -> job record, oldest first
+        self._in_flight = {}        # dedupe key -> id of a queued/running job
+        self._lock = threading.Lock()
+        self._result_dir = None
+
+    def result_path(self, job_id, suffix):
+        with self._lock:
+            if self._result_dir is None:
+                self._result_dir = tempfile.mkdtemp(prefix='eft_jobs_')
+            return os.path.join(self._result_dir, f'{job_id}{suffix}')
+
+    def submit(self, owner, kind, key, fn, *args):
+        """Queue fn(job_id, *args) for owner, or return the owner's matching in-flight job."""
+        key = (owner, key)
+        with self._lock:
+            self._prune()
+            job_id = self._in_flight.get(key)
+            if job_id is not None:
+                return dict(self._jobs[job_id], deduplicated=True)
+            job_id = uuid.uuid4().hex
+            job = {'id': job_id, 'owner': owner, 'kind': kind, 'status': 'queued', 'created': time.time(),
+                   'started': None, 'finished': None, 'error': None, 'result': None}
+            self._jobs[job_id] = job
+            self._in_flight[key] = job_id
+        self._executor.submit(self._run, job_id, key, fn, args)
+        return dict(job, deduplicated=False)
+
+    def _run(self, job_id, key, fn, args):
+        with self._lock:
+            self._jobs[job_id].update(status='running', started=time.time())
+        try:
+            result, error, status = fn(job_id, *args), None, 'done'
+        except Exception as e:
+            result, error, status = None, str(e), 'failed'
+        with self._lock:
+            self._jobs[job_id].update(status=status, result=result, error=error, finished=time.time())
+            self._in_flight.pop(key, None)
+
+    def get(self, job_id, owner):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job and job['owner'] == owner else None
+
+    def _prune(self):
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job['finished'] is not None]
+        excess = len(finished) - self.max_finished
+        for job in finished:
+            if excess <= 0 and now - job['finished'] < self.ttl:
+                break
+            excess -= 1
+            del self._jobs[job['id']]
+            path = (job['result'] or {}).get('path')
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._result_dir:
+            shutil.rmtree(self._result_dir, ignore_errors=True)
+
+job_queue = JobQueue()
+atexit.register(job_queue.shutdown)
+
+def job_status(job):
+    status = {key: job[key] for key in ('id', 'kind', 'status', 'created', 'started', 'finished', 'error')}
+    status['status_url'] = url_for('job_detail', job_id=job['id'])
+    status['result_url'] = url_for('job_result', job_id=job['id'])
+    return status
+
+def job_accepted(job):
+    response = api_response(dict(job_status(job), deduplicated=job['deduplicated']), 202)
+    response.headers['Location'] = url_for('job_detail', job_id=job['id'])
+    return response
+
+def run_graphs_job(job_id, tenant, keys, urls):
+    chart_cache.fetch_many(tenant, list(keys.values()))
+    return {'charts': urls}
+
+def run_export_job(job_id, data, start, end, compress):
+    suffix = '.csv.gz' if compress else '.csv'
+    path = job_queue.result_path(job_id, suffix)
+    with open(path, 'wb') as f:
+        for chunk in stream_csv(export_rows(data['history'], start, end), compress):
+            f.write(chunk)
+    return {'path': path, 'filename': f'financial_data{suffix}',
+            'mimetype': 'application/gzip' if compress else 'text/csv'}
+
+def run_clear_job(job_id, tenant_store):
+    tenant_store.reset()
+    return {'cleared': True}
+
+@app.route('/jobs/graphs', methods=['POST'])
+def submit_graphs_job():
+    month = request.args.get('month')
+    data = load_data()
+    current_month = store.get_month(month)
+    if not current_month:
+        return api_error(404, f'Month {month} not found')
+    keys = chart_keys(data, current_month)
+    urls = chart_urls(data, current_month)
+    # Keys are content hashes, so identical inputs are the same job
+    job = job_queue.submit(session['user_id'], 'graphs', ('graphs', tuple(sorted(keys.values()))),
+                           run_graphs_job, session['user_id'], keys, urls)
+    return job_accepted(job)
+
+@app.route('/jobs/export_csv', methods=['POST'])
+def submit_export_job():
+    start = request.args.get('from') or None
+    end = request.args.get('to') or None
+    for value in (start, end):
+        if value and not MONTH_PATTERN.fullmatch(value):
+            return api_error(400, 'Months must be in YYYY-MM format')
+    compress = request.args.get('gzip') in ('1', 'true', 'yes')
     
-    return graphs
+    # Snapshots are replaced, never mutated, on write. The job is given the
+    # snapshot itself, which keeps it alive (so its id can't be reused by a
+    # newer one) for as long as the key is in flight
+    data = load_data()
+    key = ('export_csv', id(data), start, end, compress)
+    job = job_queue.submit(session['user_id'], 'export_csv', key, run_export_job, data, start, end, compress)
+    return job_accepted(job)
+
+@app.route('/jobs/clear_data', methods=['POST'])
+def submit_clear_job():
+    # Jobs run outside the request, so they get the tenant's store itself, not the proxy
+    return job_accepted(job_queue.submit(session['user_id'], 'clear_data', ('clear_data',), run_clear_job,
+                                         current_store()))
+
+@app.route('/jobs/<job_id>')
+def job_detail(job_id):
+    job = job_queue.get(job_id, session['user_id'])
+    if not job:
+        return api_error(404, f'Job {job_id} not found')
+    return api_response(job_status(job))
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_queue.get(job_id, session['user_id'])
+    if not job:
+        return api_error(404, f'Job {job_id} not found')
+    if job['status'] == 'failed':
+        return api_error(500, job['error'])
+    if job['status'] != 'done':
+        return api_response(job_status(job), 409)
+    result = job['result']
+    if 'path' in result:
+        return send_file(result['path'], mimetype=result['mimetype'],
+                         as_attachment=True, download_name=result['filename'])
+    return api_response(result)
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -5,9 +5,15 @@
 """
 
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import json
 import csv
+import copy
+import os
+import re
+import threading
+from collections import deque
+from itertools import islice
 from datetime import datetime
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
@@ -15,6 +21,71 @@ import numpy as np
 from matplotlib.figure import Figure
 from matplotlib import cm
 
+# Excel export is optional
+try:
+    from openpyxl import Workbook
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+class FoodCostLedger:
+    """Cost layers for one food commodity.
+
+    Purchases are queued as [bags, unit_cost] lots. FIFO sales consume the
+    oldest lots first; weighted-average ("WAC") keeps a single blended lot.
+    Bag and cost totals are kept as running aggregates, so valuation is O(1)
+    and never replays the transaction history.
+    """
+
+    def __init__(self, method="FIFO", lots=None):
+        self.method = method
+        self.lots = deque()
+        self.bags = 0.0
+        self.cost = 0.0
+        for bags, unit_cost in lots or []:
+            self.purchase(bags, unit_cost)
+
+    def purchase(self, bags, unit_cost):
+        if bags <= 0:
+            return
+        self.bags += bags
+        self.cost += bags * unit_cost
+        if self.method == "WAC":
+            self.lots = deque([[self.bags, self.cost / self.bags]])
+        else:
+            self.lots.append([bags, unit_cost])
+
+    def sell(self, bags):
+        """Remove bags from the layers and return their cost of goods sold."""
+        bags = min(bags, self.bags)
+        cogs = 0.0
+        remaining = bags
+        while remaining > 1e-9 and self.lots:
+            lot = self.lots[0]
+            taken = min(lot[0], remaining)
+            cogs += taken * lot[1]
+            lot[0] -= taken
+            remaining -= taken
+            if lot[0] <= 1e-9:
+                self.lots.popleft()
+
+        self.bags -= bags
+        self.cost -= cogs
+        if self.bags <= 1e-9:
+            self.bags, self.cost = 0.0, 0.0
+            self.lots.clear()
+        return cogs
+
+    def average_cost(self):
+        return self.cost / self.bags if self.bags else 0.0
+
+    def unrealised_gain(self, sell_price):
+        return self.bags * sell_price - self.cost
+
+    def to_list(self):
+        return [[bags, unit_cost] for bags, unit_cost in self.lots]
+
+
 class PersonalFinanceTracker:
     def __init__(self, root):
         self.root = root
@@ -38,6 +109,8 @@ class PersonalFinanceTracker:
         self.INVESTMENT_PERCENT = 10
         self.EMERGENCY_PERCENT = 10
         self.CONFIDENCE_LEVEL = 0.95
+        self.EXPORT_BLOCK_ROWS = 1000
+        self.EXPORT_BUFFER_BYTES = 1 << 20
 
         # Food prices
         self.food_prices = {
@@ -48,9 +121,36 @@ class PersonalFinanceTracker:
             "sorghum": {"buy": 2000, "sell": 1800}
         }
 
+        self.default_food_prices = copy.deepcopy(self.food_prices)
+
+        # Profiles (households/clients): a small always-loaded index, one ledger file per profile
+        self.DATA_DIR = "finance_profiles"
+        self.PROFILE_INDEX_FILE = os.path.join(self.DATA_DIR, "profiles.json")
+        self.profiles = {}
+        self.active_profile = "default"
+
         # Initialize UI state variables after root is created
         self.food_price_vars = {}
         self.food_qty_vars = {}
+
+        # Statement import rules: expenditure category -> keywords found in transaction details.
+        # Overridden by import_rules.json when present.
+        self.import_rules = {
+            "upkeep": ["naivas", "carrefour", "quickmart", "chandarana", "supermarket", "butchery", "grocer", "pharmacy"],
+            "transport": ["uber", "bolt", "little cab", "matatu", "sacco", "fuel", "petrol", "total energies", "rubis", "shell"],
+            "utilities": ["kplc", "kenya power", "water", "zuku", "safaricom home", "airtime", "bundles", "gas"],
+            "entertainment": ["netflix", "showmax", "dstv", "gotv", "spotify", "cinema", "restaurant", "bar", "betting"],
+            "rent": ["rent", "landlord", "caretaker", "house"]
+        }
+        self.IMPORT_DATE_FORMATS = ["%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d %b %Y", "%d-%b-%Y", "%d/%m/%y", "%m/%d/%Y"]
+
+        # Food inventory cost layers: "FIFO" or "WAC" (weighted average)
+        self.food_costing = "FIFO"
+        self.food_ledgers = {}
+
+        # Background export state
+        self.export_thread = None
+        self.export_progress = None
         
         # Application state
         self.state = {
@@ -59,11 +159,15 @@ class PersonalFinanceTracker:
             "total_savings": 472000,
             "short_term_savings": 0,
             "food_inventory": {food: 0 for food in self.food_prices},
+            "food_realised_gains": 0,
             "current_screen": "month_selector"
         }
 
-        # Load data
+        # Load profile index and the active profile's data
+        self.load_profile_index()
+        self.build_food_ledgers()
         self.load_data()
+        self.update_title()
 
         # Create menu bar
         self.create_menu_bar()
@@ -93,11 +197,18 @@ class PersonalFinanceTracker:
         file_menu.add_command(label="Results", command=lambda: self.show_screen("results"))
         file_menu.add_command(label="History", command=lambda: self.show_screen("history"))
         file_menu.add_separator()
-        file_menu.add_command(label="Export to CSV", command=self.export_to_csv)
+        file_menu.add_command(label="Export to CSV/Excel", command=self.export_to_csv)
+        file_menu.add_command(label="Import Statements (CSV)", command=self.import_statements)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.root.quit)
         menubar.add_cascade(label="File", menu=file_menu)
 
+        # Profiles menu
+        profile_menu = tk.Menu(menubar, tearoff=0)
+        profile_menu.add_command(label="Switch Profile...", command=self.show_profile_switcher)
+        profile_menu.add_command(label="New Profile...", command=self.create_profile)
+        menubar.add_cascade(label="Profiles", menu=profile_menu)
+
         # Tools menu
         tools_menu = tk.Menu(menubar, tearoff=0)
         tools_menu.add_command(label="Refresh Data", command=self.refresh_data)
@@ -132,9 +243,35 @@ class PersonalFinanceTracker:
         about_text += "© 2023 All Rights Reserved"
         messagebox.showinfo("About", about_text)
 
+    def load_profile_index(self):
+        try:
+            with open(self.PROFILE_INDEX_FILE, 'r') as f:
+                index = json.load(f)
+                self.profiles = index.get("profiles", {})
+                self.active_profile = index.get("active", "default")
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.profiles = {}
+
+        # The original single ledger stays in place as the default profile
+        if "default" not in self.profiles:
+            self.profiles["default"] = {"name": "Default", "file": "finance_data.json"}
+        if self.active_profile not in self.profiles:
+            self.active_profile = "default"
+
+    def save_profile_index(self):
+        os.makedirs(self.DATA_DIR, exist_ok=True)
+        with open(self.PROFILE_INDEX_FILE, 'w') as f:
+            json.dump({"active": self.active_profile, "profiles": self.profiles}, f)
+
+    def data_file(self):
+        return self.profiles[self.active_profile]["file"]
+
+    def update_title(self):
+        self.root.title(f"Enhanced Personal Finance Tracker with Graphs - {self.profiles[self.active_profile]['name']}")
+
     def load_data(self):
         try:
-            with open('finance_data.json', 'r') as f:
+            with open(self.data_file(), 'r') as f:
                 data = json.load(f)
                 self.state["history"] = data.get("history", [])
                 self.state["total_savings"] = data.get("total_savings", 442000)
@@ -145,9 +282,46 @@ class PersonalFinanceTracker:
                 for food in saved_prices:
                     if food in self.food_prices:
                         self.food_prices[food] = saved_prices[food]
+                self.state["food_realised_gains"] = data.get("food_realised_gains", 0)
+                self.food_costing = data.get("food_costing", self.food_costing)
+                self.build_food_ledgers(data.get("food_lots", {}))
         except (FileNotFoundError, json.JSONDecodeError):
             pass
 
+    def build_food_ledgers(self, saved_lots=None):
+        saved_lots = saved_lots or {}
+        self.food_ledgers = {}
+        for food in self.food_prices:
+            ledger = FoodCostLedger(self.food_costing, saved_lots.get(food))
+            # Reconcile with bag counts saved before cost layers existed
+            bags = self.state["food_inventory"].get(food, 0)
+            if bags > ledger.bags:
+                ledger.purchase(bags - ledger.bags, self.food_prices[food]["buy"])
+            elif bags < ledger.bags:
+                ledger.sell(ledger.bags - bags)
+            self.food_ledgers[food] = ledger
+
+    def set_food_costing(self, method):
+        if method == self.food_costing:
+            return
+        saved_lots = {food: ledger.to_list() for food, ledger in self.food_ledgers.items()}
+        self.food_costing = method
+        self.build_food_ledgers(saved_lots)
+        self.save_data()
+
+    def food_valuation(self):
+        valuation = {}
+        for food, ledger in self.food_ledgers.items():
+            sell_price = self.food_prices[food]["sell"]
+            valuation[food] = {
+                "bags": ledger.bags,
+                "cost_basis": ledger.cost,
+                "average_cost": ledger.average_cost(),
+                "market_value": ledger.bags * sell_price,
+                "unrealised_gain": ledger.unrealised_gain(sell_price)
+            }
+        return valuation
+
     def save_data(self):
         # Remove any StringVar references before saving
         food_prices_serializable = {}
@@ -161,11 +335,121 @@ class PersonalFinanceTracker:
             "total_savings": self.state["total_savings"],
             "short_term_savings": self.state["short_term_savings"],
             "food_inventory": self.state["food_inventory"],
-            "food_prices": food_prices_serializable
+            "food_prices": food_prices_serializable,
+            "food_costing": self.food_costing,
+            "food_lots": {food: ledger.to_list() for food, ledger in self.food_ledgers.items()},
+            "food_realised_gains": self.state["food_realised_gains"]
         }
-        with open('finance_data.json', 'w') as f:
+        with open(self.data_file(), 'w') as f:
             json.dump(data, f)
 
+        # Keep the picker's metadata current without it ever opening the ledgers
+        self.profiles[self.active_profile].update({
+            "months": len(self.state["history"]),
+            "last_month": max((item["month"] for item in self.state["history"]), default=""),
+            "total_savings": self.state["total_savings"],
+            "updated": datetime.now().strftime("%Y-%m-%d %H:%M")
+        })
+        self.save_profile_index()
+
+    def switch_profile(self, profile_id):
+        if profile_id not in self.profiles:
+            messagebox.showerror("Error", f"Unknown profile {profile_id}")
+            return
+
+        self.active_profile = profile_id
+        self.food_prices = copy.deepcopy(self.default_food_prices)
+        self.food_price_vars = {}
+        self.food_qty_vars = {}
+        self.food_costing = "FIFO"
+        self.state = {
+            "current_month": {},
+            "history": [],
+            "total_savings": 442000,
+            "short_term_savings": 0,
+            "food_inventory": {food: 0 for food in self.food_prices},
+            "food_realised_gains": 0,
+            "current_screen": "month_selector"
+        }
+        self.build_food_ledgers()
+        self.load_data()
+        self.save_profile_index()
+        self.update_title()
+        self.show_screen("month_selector")
+
+    def create_profile(self, parent=None):
+        name = simpledialog.askstring("New Profile", "Household or client name:", parent=parent or self.root)
+        if not name or not name.strip():
+            return
+        name = name.strip()
+
+        slug = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") or "profile"
+        profile_id = slug
+        counter = 2
+        while profile_id in self.profiles:
+            profile_id = f"{slug}_{counter}"
+            counter += 1
+
+        self.profiles[profile_id] = {
+            "name": name,
+            "file": os.path.join(self.DATA_DIR, f"{profile_id}.json"),
+            "months": 0,
+            "last_month": "",
+            "total_savings": 0,
+            "updated": datetime.now().strftime("%Y-%m-%d %H:%M")
+        }
+        os.makedirs(self.DATA_DIR, exist_ok=True)
+        with open(self.profiles[profile_id]["file"], 'w') as f:
+            json.dump({"history": [], "total_savings": 0, "short_term_savings": 0}, f)
+
+        if parent is not None:
+            parent.destroy()
+        self.switch_profile(profile_id)
+
+    def show_profile_switcher(self):
+        window = tk.Toplevel(self.root)
+        window.title("Profiles")
+        window.geometry("700x400")
+        window.transient(self.root)
+
+        columns = ("name", "months", "last_month", "savings", "updated")
+        tree = ttk.Treeview(window, columns=columns, show="headings")
+        tree.heading("name", text="Profile")
+        tree.heading("months", text="Months")
+        tree.heading("last_month", text="Last Month")
+        tree.heading("savings", text="Total Savings (KES)")
+        tree.heading("updated", text="Last Updated")
+        tree.column("months", width=70, anchor=tk.E)
+        tree.column("last_month", width=90)
+        tree.column("savings", width=140, anchor=tk.E)
+        tree.column("updated", width=130)
+
+        for profile_id, meta in sorted(self.profiles.items(), key=lambda item: item[1].get("name", "").lower()):
+            name = meta.get("name", profile_id) + (" (active)" if profile_id == self.active_profile else "")
+            savings = meta.get("total_savings")
+            tree.insert("", tk.END, iid=profile_id, values=(
+                name,
+                meta.get("months", ""),
+                meta.get("last_month", ""),
+                f"{savings:,.2f}" if isinstance(savings, (int, float)) else "",
+                meta.get("updated", "")
+            ))
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        def switch_selected():
+            selected = tree.focus()
+            if selected:
+                window.destroy()
+                self.switch_profile(selected)
+
+        tree.bind("<Double-1>", lambda event: switch_selected())
+
+        button_frame = ttk.Frame(window)
+        button_frame.pack(pady=5)
+        ttk.Button(button_frame, text="Switch", command=switch_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="New Profile", command=lambda: self.create_profile(window)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Close", command=window.destroy).pack(side=tk.LEFT, padx=5)
+
     def show_screen(self, screen_name):
         for screen in [self.month_selector_frame, self.income_frame,
                       self.expenditure_frame, self.results_frame, self.history_frame]:
@@ -295,7 +579,8 @@ class PersonalFinanceTracker:
     def load_month(self, month):
         month_data = next((item for item in self.state["history"] if item["month"] == month), None)
         if month_data:
-            self.state["current_month"] = month_data.copy()
+            # A deep copy: history entries are never edited in place (see build_export_sheets)
+            self.state["current_month"] = copy.deepcopy(month_data)
             self.show_screen("results")
         else:
             messagebox.showerror("Error", f"No data found for month {month}")
@@ -408,17 +693,19 @@ class PersonalFinanceTracker:
             messagebox.showerror("Error", "Please enter a valid income amount")
             return
 
-        self.state["current_month"]["income"] = income
-        self.state["current_month"]["savings_reserve"] = max(income * 0.3, self.MIN_SAVINGS)
-        self.state["current_month"]["investments"] = income * (self.INVESTMENT_PERCENT / 100)
-        self.state["current_month"]["emergency_fund"] = income * (self.EMERGENCY_PERCENT / 100)
-        self.state["current_month"]["available_budget"] = income - (
-            self.state["current_month"]["savings_reserve"] +
-            self.state["current_month"]["investments"] +
-            self.state["current_month"]["emergency_fund"]
-        )
+        self.allocate_income(self.state["current_month"], income)
         self.show_screen("expenditure")
 
+    def allocate_income(self, month_data, income):
+        # Allocation rules shared by manual entry and statement import
+        month_data["income"] = income
+        month_data["savings_reserve"] = max(income * 0.3, self.MIN_SAVINGS)
+        month_data["investments"] = income * (self.INVESTMENT_PERCENT / 100)
+        month_data["emergency_fund"] = income * (self.EMERGENCY_PERCENT / 100)
+        month_data["available_budget"] = income - (
+            month_data["savings_reserve"] + month_data["investments"] + month_data["emergency_fund"]
+        )
+
     def create_expenditure_screen(self):
         self.expenditure_frame = ttk.Frame(self.main_frame)
 
@@ -461,9 +748,17 @@ class PersonalFinanceTracker:
         self.food_stock_tab = ttk.Frame(self.expenditure_notebook)
         self.expenditure_notebook.add(self.food_stock_tab, text="Food Stock Management")
 
-        self.inventory_text = tk.Text(self.food_stock_tab, wrap=tk.WORD, height=5)
+        self.inventory_text = tk.Text(self.food_stock_tab, wrap=tk.WORD, height=7)
         self.inventory_text.pack(fill=tk.X, pady=5)
 
+        costing_frame = ttk.Frame(self.food_stock_tab)
+        costing_frame.pack(pady=2)
+        ttk.Label(costing_frame, text="Inventory Costing:").pack(side=tk.LEFT)
+        self.food_costing_var = tk.StringVar(value=self.food_costing)
+        for text, value in [("FIFO", "FIFO"), ("Weighted Average", "WAC")]:
+            ttk.Radiobutton(costing_frame, text=text, variable=self.food_costing_var, value=value,
+                            command=self.change_food_costing).pack(side=tk.LEFT, padx=5)
+
         ttk.Label(self.food_stock_tab, text="Food Price Configuration", font=('Arial', 10, 'bold')).pack()
         self.food_prices_frame = ttk.Frame(self.food_stock_tab)
         self.food_prices_frame.pack(fill=tk.X, pady=5)
@@ -516,11 +811,8 @@ class PersonalFinanceTracker:
         self.rent_entry.delete(0, tk.END)
         self.rent_entry.insert(0, str(self.state["current_month"].get("expenditures", {}).get("rent", 0)))
 
-        inventory_text = "Current Inventory:\n"
-        for food, quantity in self.state["food_inventory"].items():
-            inventory_text += f"{self.capitalize(food)}: {quantity} bags\n"
-        self.inventory_text.delete(1.0, tk.END)
-        self.inventory_text.insert(tk.END, inventory_text)
+        self.food_costing_var.set(self.food_costing)
+        self.update_inventory_text()
 
         # Clear previous widgets
         for widget in self.food_prices_frame.winfo_children():
@@ -589,6 +881,22 @@ class PersonalFinanceTracker:
                 style='Alert.TLabel'
             )
 
+    def update_inventory_text(self):
+        valuation = self.food_valuation()
+        inventory_text = "Current Inventory:\n"
+        for food, quantity in self.state["food_inventory"].items():
+            inventory_text += (
+                f"{self.capitalize(food)}: {quantity} bags "
+                f"(avg cost {valuation[food]['average_cost']:,.2f} KES/bag, "
+                f"unrealised {valuation[food]['unrealised_gain']:,.2f} KES)\n"
+            )
+        self.inventory_text.delete(1.0, tk.END)
+        self.inventory_text.insert(tk.END, inventory_text)
+
+    def change_food_costing(self):
+        self.set_food_costing(self.food_costing_var.get())
+        self.update_inventory_text()
+
     def process_expenditure(self):
         for food in self.food_prices:
             try:
@@ -613,6 +921,7 @@ class PersonalFinanceTracker:
         food_purchases = []
         food_sales = []
         food_net_cost = 0
+        realised_gain = 0
 
         for food in self.food_prices:
             try:
@@ -626,78 +935,98 @@ class PersonalFinanceTracker:
                 food_purchases.append({"food": food, "bags": qty, "cost": cost})
                 food_net_cost += cost
                 self.state["food_inventory"][food] = self.state["food_inventory"].get(food, 0) + qty
+                self.food_ledgers[food].purchase(qty, self.food_prices[food]["buy"])
             elif qty < 0:
                 bags_sold = abs(qty)
                 if bags_sold > self.state["food_inventory"].get(food, 0):
                     messagebox.showerror("Error", f"Cannot sell more {food} than in inventory")
                     return
                 income = bags_sold * self.food_prices[food]["sell"]
-                food_sales.append({"food": food, "bags": bags_sold, "income": income})
+                cost_basis = self.food_ledgers[food].sell(bags_sold)
+                food_sales.append({"food": food, "bags": bags_sold, "income": income,
+                                   "cost_basis": cost_basis, "gain": income - cost_basis})
                 food_net_cost -= income
+                realised_gain += income - cost_basis
                 self.state["food_inventory"][food] = self.state["food_inventory"].get(food, 0) - bags_sold
 
         self.state["current_month"]["food_purchases"] = food_purchases
         self.state["current_month"]["food_sales"] = food_sales
 
+        self.state["food_realised_gains"] += realised_gain
+        valuation = self.food_valuation()
+        self.state["current_month"]["food_valuation"] = {
+            "method": self.food_costing,
+            "realised_gain": realised_gain,
+            "unrealised_gain": sum(item["unrealised_gain"] for item in valuation.values()),
+            "cost_basis": sum(item["cost_basis"] for item in valuation.values()),
+            "market_value": sum(item["market_value"] for item in valuation.values())
+        }
+
         total_exp = (
             sum(self.state["current_month"]["expenditures"].values()) +
             food_net_cost
         )
 
-        loan_amount = max(total_exp - self.state["current_month"]['available_budget'], 0)
+        self.settle_month(self.state["current_month"], total_exp)
+
+        self.state["total_savings"] += self.LONG_TERM_SAVINGS
+        self.state["short_term_savings"] += self.state["current_month"]["savings"]["short_term"]
+
+        self.perform_budget_analysis()
+
+        existing_index = next((i for i, item in enumerate(self.state["history"]) if item["month"] == self.state["current_month"]["month"]), None)
+        if existing_index is not None:
+            self.state["history"][existing_index] = copy.deepcopy(self.state["current_month"])
+        else:
+            self.state["history"].append(copy.deepcopy(self.state["current_month"]))
+
+        self.save_data()
+        self.show_screen("results")
+
+    def settle_month(self, month_data, total_exp):
+        # Loan and savings rules shared by manual entry and statement import
+        loan_amount = max(total_exp - month_data["available_budget"], 0)
         if loan_amount > 0:
             loan_interest = loan_amount * (0.2 if loan_amount <= 49999 else 0.12)
-            total_loan = loan_amount + loan_interest
-            self.state["current_month"]['loan'] = {
+            month_data["loan"] = {
                 "amount": loan_amount,
                 "interest": loan_interest,
-                "total": total_loan,
+                "total": loan_amount + loan_interest,
                 "needed": True
             }
         else:
-            self.state["current_month"]['loan'] = {"needed": False}
+            month_data["loan"] = {"needed": False}
 
-        additional_savings = max(self.state["current_month"]['available_budget'] - total_exp, 0)
-        self.state["current_month"]['savings'] = {
+        additional_savings = max(month_data["available_budget"] - total_exp, 0)
+        month_data["savings"] = {
             "long_term": self.LONG_TERM_SAVINGS,
             "short_term": self.SHORT_TERM_SAVINGS + additional_savings,
             "total": self.LONG_TERM_SAVINGS + self.SHORT_TERM_SAVINGS + additional_savings
         }
 
-        self.state["total_savings"] += self.LONG_TERM_SAVINGS
-        self.state["short_term_savings"] += self.SHORT_TERM_SAVINGS + additional_savings
-
-        self.perform_budget_analysis()
-
-        existing_index = next((i for i, item in enumerate(self.state["history"]) if item["month"] == self.state["current_month"]["month"]), None)
-        if existing_index is not None:
-            self.state["history"][existing_index] = self.state["current_month"].copy()
-        else:
-            self.state["history"].append(self.state["current_month"].copy())
-
-        self.save_data()
-        self.show_screen("results")
+    def perform_budget_analysis(self, month_data=None):
+        if month_data is None:
+            month_data = self.state["current_month"]
 
-    def perform_budget_analysis(self):
         planned = {
-            "essentials": self.state["current_month"]["income"] * 0.5,
-            "savings": self.state["current_month"]["savings_reserve"],
-            "investments": self.state["current_month"]["investments"],
-            "discretionary": self.state["current_month"]["income"] * 0.1
+            "essentials": month_data["income"] * 0.5,
+            "savings": month_data["savings_reserve"],
+            "investments": month_data["investments"],
+            "discretionary": month_data["income"] * 0.1
         }
 
         actual = {
             "essentials": (
-                self.state["current_month"]["expenditures"]["upkeep"] +
-                self.state["current_month"]["expenditures"]["rent"] +
-                sum(item["cost"] for item in self.state["current_month"].get("food_purchases", []))
+                month_data["expenditures"]["upkeep"] +
+                month_data["expenditures"]["rent"] +
+                sum(item["cost"] for item in month_data.get("food_purchases", []))
             ),
-            "savings": self.state["current_month"]["savings"]["total"],
-            "investments": self.state["current_month"]["investments"],
+            "savings": month_data["savings"]["total"],
+            "investments": month_data["investments"],
             "discretionary": (
-                self.state["current_month"]["expenditures"]["transport"] +
-                self.state["current_month"]["expenditures"]["utilities"] +
-                self.state["current_month"]["expenditures"]["entertainment"]
+                month_data["expenditures"]["transport"] +
+                month_data["expenditures"]["utilities"] +
+                month_data["expenditures"]["entertainment"]
             )
         }
 
@@ -710,7 +1039,7 @@ class PersonalFinanceTracker:
             else:
                 variance[category] = 0
 
-        self.state["current_month"]["budget_analysis"] = {
+        month_data["budget_analysis"] = {
             "planned": planned,
             "actual": actual,
             "variance": variance,
@@ -756,6 +1085,11 @@ class PersonalFinanceTracker:
         self.results_notebook.add(self.loan_tab, text="Loan Details")
         self.create_loan_tab()
 
+        # Savings target projection tab
+        self.projection_tab = ttk.Frame(self.results_notebook)
+        self.results_notebook.add(self.projection_tab, text="Savings Projection")
+        self.create_projection_tab()
+
         # Common buttons for all tabs
         button_frame = ttk.Frame(self.results_frame)
         button_frame.pack(pady=10, fill=tk.X)
@@ -810,6 +1144,82 @@ class PersonalFinanceTracker:
 
         self.loan_text.insert(tk.END, loan_text)
 
+    def create_projection_tab(self):
+        for widget in self.projection_tab.winfo_children():
+            widget.destroy()
+
+        self.projection_text = tk.Text(self.projection_tab, wrap=tk.WORD, height=12)
+        self.projection_text.pack(fill=tk.X)
+
+        self.projection_graph_frame = ttk.Frame(self.projection_tab)
+        self.projection_graph_frame.pack(fill=tk.BOTH, expand=True)
+
+        ttk.Button(self.projection_tab, text="Run Projection", command=self.update_projection_tab).pack(pady=5)
+
+    def add_months(self, month, count):
+        year, mon = (int(part) for part in month.split("-")[:2])
+        index = year * 12 + (mon - 1) + int(count)
+        return f"{index // 12}-{index % 12 + 1:02d}"
+
+    def project_savings_target(self):
+        """When total savings, the quantity the savings gauge shows, reach SAVINGS_TARGET.
+
+        process_expenditure adds LONG_TERM_SAVINGS to total_savings for every
+        processed month, whatever the month's income, expenses or loan, so
+        the date follows directly from the amount remaining.
+        """
+        history = sorted(self.state["history"], key=lambda x: x["month"])
+        if not history:
+            return None
+
+        remaining = max(self.SAVINGS_TARGET - self.state["total_savings"], 0)
+        months_needed = int(np.ceil(remaining / self.LONG_TERM_SAVINGS))
+        base_month = history[-1]["month"]
+        return {
+            "base_month": base_month,
+            "remaining": remaining,
+            "monthly_contribution": self.LONG_TERM_SAVINGS,
+            "months_needed": months_needed,
+            "date": self.add_months(base_month, months_needed)
+        }
+
+    def update_projection_tab(self):
+        self.projection_text.delete(1.0, tk.END)
+        for widget in self.projection_graph_frame.winfo_children():
+            widget.destroy()
+
+        projection = self.project_savings_target()
+        if projection is None:
+            self.projection_text.insert(tk.END, "No enough data for a savings projection (need at least 1 processed month)\n")
+            return
+
+        projection_text = "=== SAVINGS TARGET PROJECTION ===\n\n"
+        projection_text += f"Savings Target: {self.SAVINGS_TARGET:,.2f} KES\n"
+        projection_text += f"Total Savings: {self.state['total_savings']:,.2f} KES\n"
+        projection_text += f"Remaining: {projection['remaining']:,.2f} KES\n"
+        projection_text += f"Monthly Long-term Contribution: {projection['monthly_contribution']:,.2f} KES\n\n"
+        projection_text += f"Expected Date: {projection['date']} ({projection['months_needed']} months after {projection['base_month']})\n"
+        projection_text += "Every processed month adds the long-term contribution, so income, expenses and loans do not move this date.\n"
+        self.projection_text.insert(tk.END, projection_text)
+
+        if projection["months_needed"]:
+            months = np.arange(projection["months_needed"] + 1)
+            balance = np.minimum(self.state["total_savings"] + months * projection["monthly_contribution"],
+                                 max(self.SAVINGS_TARGET, self.state["total_savings"]))
+            fig = Figure(figsize=(10, 4), dpi=100)
+            ax = fig.add_subplot(111)
+            ax.plot(months / 12, balance, color='#2196F3')
+            ax.axhline(self.SAVINGS_TARGET, color='#4CAF50', linestyle='--', label=f"Target reached: {projection['date']}")
+            ax.set_title('Projected Total Savings')
+            ax.set_xlabel('Years from ' + projection["base_month"])
+            ax.set_ylabel('Total Savings (KES)')
+            ax.legend()
+            ax.grid(linestyle='--', alpha=0.7)
+
+            canvas = FigureCanvasTkAgg(fig, master=self.projection_graph_frame)
+            canvas.draw()
+            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
     def create_graphs_tab(self):
         # Clear previous graphs if they exist
         for widget in self.graphs_tab.winfo_children():
@@ -1033,6 +1443,22 @@ class PersonalFinanceTracker:
             summary_text += f"{self.capitalize(food)}: {quantity} bags\n"
         summary_text += "\n"
 
+        summary_text += "=== FOOD INVENTORY VALUATION ===\n"
+        valuation = self.food_valuation()
+        method_name = "Weighted Average" if self.food_costing == "WAC" else "FIFO"
+        summary_text += f"Costing Method: {method_name}\n"
+        for food, item in valuation.items():
+            if item["bags"]:
+                summary_text += (
+                    f"{self.capitalize(food)}: cost {item['cost_basis']:,.2f} KES, "
+                    f"market {item['market_value']:,.2f} KES, "
+                    f"unrealised {item['unrealised_gain']:,.2f} KES\n"
+                )
+        month_valuation = self.state["current_month"].get("food_valuation", {})
+        summary_text += f"Realised Gain This Month: {month_valuation.get('realised_gain', 0):,.2f} KES\n"
+        summary_text += f"Unrealised Gain: {sum(item['unrealised_gain'] for item in valuation.values()):,.2f} KES\n"
+        summary_text += f"Total Realised Gains: {self.state['food_realised_gains']:,.2f} KES\n\n"
+
         summary_text += "=== INVESTMENTS AND EMERGENCY FUND ===\n"
         summary_text += f"Investments: {self.state['current_month'].get('investments', 0):,.2f} KES\n"
         summary_text += f"Emergency Fund: {self.state['current_month'].get('emergency_fund', 0):,.2f} KES\n\n"
@@ -1098,6 +1524,9 @@ class PersonalFinanceTracker:
         # Update loan tab
         self.update_loan_tab()
 
+        # Update savings projection
+        self.update_projection_tab()
+
         # Update graphs
         self.create_graphs_tab()
 
@@ -1320,89 +1749,436 @@ class PersonalFinanceTracker:
             canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
     def export_to_csv(self):
-        if not self.state["current_month"]:
-            messagebox.showerror("Error", "No current month data to export")
+        if not self.state["current_month"] and not self.state["history"]:
+            messagebox.showerror("Error", "No data to export")
             return
 
+        if self.export_thread is not None and self.export_thread.is_alive():
+            messagebox.showwarning("Export", "An export is already running")
+            return
+
+        filetypes = [("CSV files", "*.csv")]
+        if OPENPYXL_AVAILABLE:
+            filetypes.append(("Excel workbook", "*.xlsx"))
         file_path = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv")],
+            filetypes=filetypes,
             initialfile=f"finance_report_{self.state['current_month'].get('month', 'report')}.csv"
         )
         if not file_path:
             return
+        if file_path.lower().endswith(".xlsx") and not OPENPYXL_AVAILABLE:
+            messagebox.showerror("Error", "Excel export requires openpyxl (pip install openpyxl)")
+            return
 
-        try:
-            progress = (self.state["total_savings"] / self.SAVINGS_TARGET) * 100
-            with open(file_path, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(['Category', 'Amount (KES)', 'Details'])
-                writer.writerow(['Income', self.state["current_month"].get("income", 0), ''])
-                writer.writerow(['Total Long-term Savings', self.state["total_savings"], f"Target: {self.SAVINGS_TARGET:,.0f} KES"])
-                writer.writerow(['Short-term Savings', self.state["short_term_savings"], ''])
-                writer.writerow(['Savings Progress', f"{self.state['total_savings']}/{self.SAVINGS_TARGET:,.0f} KES ({progress:.1f}%)", ''])
-
-                for category, amount in self.state["current_month"].get("expenditures", {}).items():
-                    writer.writerow([self.capitalize(category), amount, ''])
-
-                for data in self.state["current_month"].get("food_purchases", []):
-                    writer.writerow([
-                        f"Food Purchase {self.capitalize(data['food'])}",
-                        data["cost"],
-                        f"{data['bags']} bags @ {self.food_prices[data['food']]['buy']:.2f} KES/bag"
-                    ])
-
-                for data in self.state["current_month"].get("food_sales", []):
-                    writer.writerow([
-                        f"Food Sale {self.capitalize(data['food'])}",
-                        data["income"],
-                        f"{data['bags']} bags @ {self.food_prices[data['food']]['sell']:.2f} KES/bag"
-                    ])
-
-                writer.writerow(['Investments', self.state["current_month"].get("investments", 0), ''])
-                writer.writerow(['Emergency Fund', self.state["current_month"].get("emergency_fund", 0), ''])
-                writer.writerow(['Savings Reserve', self.state["current_month"].get("savings_reserve", 0), ''])
-                writer.writerow(['From Savings Reserve', 18000.00, "15,000 long-term + 3,000 short-term"])
-
-                total_exp = (
-                    sum(self.state["current_month"].get("expenditures", {}).values()) +
-                    sum(item["cost"] for item in self.state["current_month"].get("food_purchases", [])) -
-                    sum(item["income"] for item in self.state["current_month"].get("food_sales", []))
-                )
+        sheets = self.build_export_sheets()
+        self.export_progress = {
+            "rows": 0,
+            "total": sum(count for _, _, count in sheets),
+            "done": False,
+            "error": None
+        }
+        self.show_export_progress()
+
+        self.export_thread = threading.Thread(target=self.write_export, args=(file_path, sheets, self.export_progress))
+        self.export_thread.daemon = True
+        self.export_thread.start()
+        self.root.after(100, self.poll_export_progress)
+
+    def build_export_sheets(self):
+        # A shallow snapshot is enough: history entries are replaced, never edited
+        # in place, so the worker only ever reads months nobody changes
+        history = sorted(self.state["history"], key=lambda x: x["month"])
+        sheets = []
+
+        if self.state["current_month"]:
+            current_rows = list(self.iter_current_month_rows(
+                copy.deepcopy(self.state["current_month"]),
+                self.state["total_savings"],
+                self.state["short_term_savings"],
+                copy.deepcopy(self.food_prices)
+            ))
+            sheets.append(("Current Month", iter(current_rows), len(current_rows)))
+
+        food_count = sum(len(m.get("food_purchases", [])) + len(m.get("food_sales", [])) for m in history)
+        loan_count = sum(1 for m in history if m.get("loan", {}).get("needed", False))
+        sheets.append(("Monthly Summary", self.iter_monthly_summary_rows(history), len(history) + 1))
+        sheets.append(("Food Transactions", self.iter_food_transaction_rows(history), food_count + 1))
+        sheets.append(("Loans", self.iter_loan_rows(history), loan_count + 1))
+        return sheets
+
+    def iter_current_month_rows(self, month, total_savings, short_term_savings, food_prices):
+        progress = (total_savings / self.SAVINGS_TARGET) * 100
+        yield ['Category', 'Amount (KES)', 'Details']
+        yield ['Income', month.get("income", 0), '']
+        yield ['Total Long-term Savings', total_savings, f"Target: {self.SAVINGS_TARGET:,.0f} KES"]
+        yield ['Short-term Savings', short_term_savings, '']
+        yield ['Savings Progress', f"{total_savings}/{self.SAVINGS_TARGET:,.0f} KES ({progress:.1f}%)", '']
+
+        for category, amount in month.get("expenditures", {}).items():
+            yield [self.capitalize(category), amount, '']
+
+        for data in month.get("food_purchases", []):
+            yield [
+                f"Food Purchase {self.capitalize(data['food'])}",
+                data["cost"],
+                f"{data['bags']} bags @ {food_prices[data['food']]['buy']:.2f} KES/bag"
+            ]
+
+        for data in month.get("food_sales", []):
+            yield [
+                f"Food Sale {self.capitalize(data['food'])}",
+                data["income"],
+                f"{data['bags']} bags @ {food_prices[data['food']]['sell']:.2f} KES/bag"
+            ]
+
+        yield ['Investments', month.get("investments", 0), '']
+        yield ['Emergency Fund', month.get("emergency_fund", 0), '']
+        yield ['Savings Reserve', month.get("savings_reserve", 0), '']
+        yield ['From Savings Reserve', 18000.00, "15,000 long-term + 3,000 short-term"]
 
-                if self.state["current_month"].get("loan", {}).get("needed", False):
-                    writer.writerow(['Additional Savings', -(total_exp - self.state["current_month"]['available_budget']), 'Deducted from short-term savings'])
-                else:
-                    writer.writerow(['Additional Savings', self.state["current_month"]['available_budget'] - total_exp, 'Added to short-term savings'])
-
-                writer.writerow([
-                    "Total Savings",
-                    self.state["current_month"].get("savings", {}).get("total", 0),
-                    f"{self.state['current_month'].get('savings', {}).get('total', 0)/self.state['current_month'].get('income', 1)*100:.1f}% of income"
-                ])
-
-                if self.state["current_month"].get("loan", {}).get("needed", False):
-                    writer.writerow(['Loan Amount', self.state["current_month"]['loan']['amount'], ''])
-                    writer.writerow([
-                        "Loan Interest",
-                        self.state["current_month"]['loan']['interest'],
-                        f"{15 if self.state['current_month']['loan']['amount'] <= 49999 else 10}% rate"
-                    ])
-                    writer.writerow(['Total Loan Repayment', self.state["current_month"]['loan']['total'], ''])
-
-                budget_analysis = self.state["current_month"].get("budget_analysis", {})
-                writer.writerow([
-                    "Budget Alignment",
-                    "Needs Review" if budget_analysis.get("significant", False) else "Aligned",
-                    ""
-                ])
-
-                for category, var_pct in budget_analysis.get("variance", {}).items():
-                    writer.writerow([f"{self.capitalize(category)} Variance", f"{var_pct:.1f}%", ""])
-
-            messagebox.showinfo("Success", "Data exported to CSV successfully")
+        total_exp = (
+            sum(month.get("expenditures", {}).values()) +
+            sum(item["cost"] for item in month.get("food_purchases", [])) -
+            sum(item["income"] for item in month.get("food_sales", []))
+        )
+
+        if month.get("loan", {}).get("needed", False):
+            yield ['Additional Savings', -(total_exp - month.get('available_budget', 0)), 'Deducted from short-term savings']
+        else:
+            yield ['Additional Savings', month.get('available_budget', 0) - total_exp, 'Added to short-term savings']
+
+        yield [
+            "Total Savings",
+            month.get("savings", {}).get("total", 0),
+            f"{month.get('savings', {}).get('total', 0)/(month.get('income') or 1)*100:.1f}% of income"
+        ]
+
+        if month.get("loan", {}).get("needed", False):
+            yield ['Loan Amount', month['loan']['amount'], '']
+            yield [
+                "Loan Interest",
+                month['loan']['interest'],
+                f"{15 if month['loan']['amount'] <= 49999 else 10}% rate"
+            ]
+            yield ['Total Loan Repayment', month['loan']['total'], '']
+
+        budget_analysis = month.get("budget_analysis", {})
+        yield [
+            "Budget Alignment",
+            "Needs Review" if budget_analysis.get("significant", False) else "Aligned",
+            ""
+        ]
+
+        for category, var_pct in budget_analysis.get("variance", {}).items():
+            yield [f"{self.capitalize(category)} Variance", f"{var_pct:.1f}%", ""]
+
+    def iter_monthly_summary_rows(self, history):
+        yield ['Month', 'Income (KES)', 'Expenses (KES)', 'Savings (KES)', 'Investments (KES)',
+               'Emergency Fund (KES)', 'Loan Total (KES)', 'Budget Aligned']
+        for month_data in history:
+            expenses = (
+                sum(month_data.get("expenditures", {}).values()) +
+                sum(item["cost"] for item in month_data.get("food_purchases", [])) -
+                sum(item["income"] for item in month_data.get("food_sales", []))
+            )
+            yield [
+                month_data.get("month", ""),
+                month_data.get("income", 0),
+                expenses,
+                month_data.get("savings", {}).get("total", 0),
+                month_data.get("investments", 0),
+                month_data.get("emergency_fund", 0),
+                month_data.get("loan", {}).get("total", 0),
+                "Needs Review" if month_data.get("budget_analysis", {}).get("significant", False) else "Aligned"
+            ]
+
+    def iter_food_transaction_rows(self, history):
+        yield ['Month', 'Type', 'Food', 'Bags', 'Amount (KES)']
+        for month_data in history:
+            for item in month_data.get("food_purchases", []):
+                yield [month_data.get("month", ""), "Purchase", self.capitalize(item["food"]), item["bags"], item["cost"]]
+            for item in month_data.get("food_sales", []):
+                yield [month_data.get("month", ""), "Sale", self.capitalize(item["food"]), item["bags"], item["income"]]
+
+    def iter_loan_rows(self, history):
+        yield ['Month', 'Amount (KES)', 'Interest (KES)', 'Total (KES)', 'Rate %']
+        for month_data in history:
+            loan = month_data.get("loan", {})
+            if loan.get("needed", False):
+                amount = loan.get("amount", 0)
+                yield [
+                    month_data.get("month", ""),
+                    amount,
+                    loan.get("interest", 0),
+                    loan.get("total", 0),
+                    round(loan.get("interest", 0) / amount * 100, 1) if amount else 0
+                ]
+
+    def iter_blocks(self, rows):
+        rows = iter(rows)
+        while True:
+            block = list(islice(rows, self.EXPORT_BLOCK_ROWS))
+            if not block:
+                return
+            yield block
+
+    def write_export(self, file_path, sheets, progress):
+        # Runs on the export thread: no Tk calls here, the UI polls `progress`
+        try:
+            if file_path.lower().endswith(".xlsx"):
+                workbook = Workbook(write_only=True)
+                for name, rows, _ in sheets:
+                    worksheet = workbook.create_sheet(title=name)
+                    for block in self.iter_blocks(rows):
+                        for row in block:
+                            worksheet.append(row)
+                        progress["rows"] += len(block)
+                workbook.save(file_path)
+            else:
+                with open(file_path, 'w', newline='', buffering=self.EXPORT_BUFFER_BYTES) as csvfile:
+                    writer = csv.writer(csvfile)
+                    for index, (name, rows, _) in enumerate(sheets):
+                        # Sections after the current-month report are separated by a title row
+                        if index or name != "Current Month":
+                            if index:
+                                writer.writerow([])
+                            writer.writerow([f"=== {name.upper()} ==="])
+                        for block in self.iter_blocks(rows):
+                            writer.writerows(block)
+                            progress["rows"] += len(block)
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to export data: {str(e)}")
+            progress["error"] = str(e)
+        finally:
+            progress["done"] = True
+
+    def show_export_progress(self):
+        self.export_window = tk.Toplevel(self.root)
+        self.export_window.title("Exporting")
+        self.export_window.transient(self.root)
+        self.export_window.resizable(False, False)
+        self.export_progress_label = ttk.Label(self.export_window, text="Preparing export...")
+        self.export_progress_label.pack(padx=20, pady=(15, 5))
+        self.export_progress_bar = ttk.Progressbar(self.export_window, length=300, mode='determinate',
+                                                   maximum=max(self.export_progress["total"], 1))
+        self.export_progress_bar.pack(padx=20, pady=(5, 15))
+
+    def poll_export_progress(self):
+        progress = self.export_progress
+        self.export_progress_bar['value'] = progress["rows"]
+        self.export_progress_label.config(text=f"Exported {progress['rows']:,} of {progress['total']:,} rows")
+
+        if not progress["done"]:
+            self.root.after(100, self.poll_export_progress)
+            return
+
+        self.export_window.destroy()
+        if progress["error"]:
+            messagebox.showerror("Error", f"Failed to export data: {progress['error']}")
+        else:
+            messagebox.showinfo("Success", f"Exported {progress['rows']:,} rows successfully")
+
+    def load_import_rules(self):
+        try:
+            with open('import_rules.json', 'r') as f:
+                rules = json.load(f)
+                for category, keywords in rules.items():
+                    if category in self.import_rules:
+                        self.import_rules[category] = [str(keyword) for keyword in keywords]
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    def compile_import_rules(self):
+        # One alternation with a named group per category: a single regex pass per transaction,
+        # and match.lastgroup names the category that matched
+        groups = []
+        for category, keywords in self.import_rules.items():
+            keywords = sorted((k.strip() for k in keywords if k.strip()), key=len, reverse=True)
+            if keywords:
+                groups.append(f"(?P<{category}>" + "|".join(re.escape(k) for k in keywords) + ")")
+        if not groups:
+            return None
+        return re.compile(r"\b(?:" + "|".join(groups) + r")\b", re.IGNORECASE)
+
+    def find_column(self, fieldnames, candidates):
+        lookup = {name.strip().lower(): name for name in fieldnames if name}
+        for candidate in candidates:
+            if candidate in lookup:
+                return lookup[candidate]
+        return None
+
+    def parse_amount(self, value):
+        value = (value or "").strip().replace(",", "").replace("KES", "").replace("Ksh", "").strip()
+        if not value:
+            return 0.0
+        if value.startswith("(") and value.endswith(")"):
+            value = "-" + value[1:-1]
+        return float(value)
+
+    def parse_statement_month(self, value, cache):
+        value = (value or "").strip()
+        if len(value) >= 7 and value[:4].isdigit() and value[4] in "-/" and value[5:7].isdigit():
+            return f"{value[:4]}-{value[5:7]}"
+
+        # Cached by date, not the full value: timestamps such as M-Pesa's
+        # "Completion Time" are nearly all unique, dates repeat
+        date_part = value.split(" ")[0] if value[:2].isdigit() and value[2:3] in "/-." else value[:11]
+        if date_part in cache:
+            return cache[date_part]
+
+        month = None
+        for fmt in self.IMPORT_DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(date_part, fmt)
+                month = f"{parsed.year}-{parsed.month:02d}"
+                break
+            except ValueError:
+                continue
+
+        cache[date_part] = month
+        return month
+
+    def read_statement(self, file_path, matcher, months, date_cache):
+        """Stream one bank or M-Pesa statement CSV into per-month income/category totals."""
+        stats = {"rows": 0, "categorised": 0, "uncategorised": 0, "uncategorised_amount": 0.0, "skipped": 0}
+
+        with open(file_path, 'r', newline='', encoding='utf-8-sig', errors='replace') as f:
+            reader = csv.DictReader(f)
+            fieldnames = reader.fieldnames or []
+            date_col = self.find_column(fieldnames, ["completion time", "transaction date", "date", "value date", "posting date"])
+            details_col = self.find_column(fieldnames, ["details", "description", "narrative", "particulars", "transaction details"])
+            paid_in_col = self.find_column(fieldnames, ["paid in", "credit", "credit amount", "money in", "deposits"])
+            withdrawn_col = self.find_column(fieldnames, ["withdrawn", "debit", "debit amount", "money out", "withdrawals", "paid out"])
+            amount_col = self.find_column(fieldnames, ["amount", "transaction amount"])
+            status_col = self.find_column(fieldnames, ["transaction status", "status"])
+
+            if not date_col or not details_col or not (paid_in_col or withdrawn_col or amount_col):
+                raise ValueError(f"Unrecognised statement layout in {file_path}")
+
+            for row in reader:
+                stats["rows"] += 1
+                if status_col and row.get(status_col, "").strip().lower() not in ("", "completed", "success", "successful"):
+                    stats["skipped"] += 1
+                    continue
+
+                month = self.parse_statement_month(row.get(date_col), date_cache)
+                try:
+                    if paid_in_col or withdrawn_col:
+                        paid_in = abs(self.parse_amount(row.get(paid_in_col))) if paid_in_col else 0.0
+                        withdrawn = abs(self.parse_amount(row.get(withdrawn_col))) if withdrawn_col else 0.0
+                    else:
+                        amount = self.parse_amount(row.get(amount_col))
+                        paid_in, withdrawn = max(amount, 0.0), max(-amount, 0.0)
+                except ValueError:
+                    month = None
+                if not month:
+                    stats["skipped"] += 1
+                    continue
+
+                totals = months.setdefault(month, {"income": 0.0, "expenditures": {}})
+                totals["income"] += paid_in
+                if withdrawn:
+                    match = matcher.search(row.get(details_col) or "") if matcher else None
+                    if match:
+                        category = match.lastgroup
+                        totals["expenditures"][category] = totals["expenditures"].get(category, 0.0) + withdrawn
+                        stats["categorised"] += 1
+                    else:
+                        stats["uncategorised"] += 1
+                        stats["uncategorised_amount"] += withdrawn
+
+        return stats
+
+    def recalculate_month(self, month_data):
+        self.allocate_income(month_data, month_data.get("income", 0))
+        total_exp = (
+            sum(month_data["expenditures"].values()) +
+            sum(item["cost"] for item in month_data.get("food_purchases", [])) -
+            sum(item["income"] for item in month_data.get("food_sales", []))
+        )
+        self.settle_month(month_data, total_exp)
+        self.perform_budget_analysis(month_data)
+
+    def merge_imported_months(self, months):
+        """Add imported per-month totals into state["history"] in a single pass."""
+        positions = {item["month"]: i for i, item in enumerate(self.state["history"])}
+        added, updated = 0, 0
+
+        for month, totals in sorted(months.items()):
+            position = positions.get(month)
+            if position is None:
+                month_data = {
+                    "month": month,
+                    "income": 0,
+                    "expenditures": {category: 0 for category in ("upkeep", "transport", "utilities", "entertainment", "rent")},
+                    "food_purchases": [],
+                    "food_sales": []
+                }
+                positions[month] = len(self.state["history"])
+                self.state["history"].append(month_data)
+                previous_short_term = None
+                added += 1
+            else:
+                # Replace the entry rather than edit it: history entries are never edited in place
+                month_data = copy.deepcopy(self.state["history"][position])
+                self.state["history"][position] = month_data
+                previous_short_term = month_data.get("savings", {}).get("short_term", 0)
+                updated += 1
+
+            month_data["income"] = month_data.get("income", 0) + totals["income"]
+            for category, amount in totals["expenditures"].items():
+                month_data["expenditures"][category] = month_data["expenditures"].get(category, 0) + amount
+            self.recalculate_month(month_data)
+
+            if previous_short_term is None:
+                self.state["total_savings"] += self.LONG_TERM_SAVINGS
+                self.state["short_term_savings"] += month_data["savings"]["short_term"]
+            else:
+                self.state["short_term_savings"] += month_data["savings"]["short_term"] - previous_short_term
+
+        return added, updated
+
+    def import_statements(self):
+        file_paths = filedialog.askopenfilenames(
+            title="Select bank or M-Pesa statement CSVs",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
+        )
+        if not file_paths:
+            return
+
+        self.load_import_rules()
+        matcher = self.compile_import_rules()
+        months = {}
+        date_cache = {}
+        totals = {"rows": 0, "categorised": 0, "uncategorised": 0, "uncategorised_amount": 0.0, "skipped": 0}
+
+        try:
+            for file_path in file_paths:
+                for key, value in self.read_statement(file_path, matcher, months, date_cache).items():
+                    totals[key] += value
+        except (OSError, ValueError, csv.Error) as e:
+            messagebox.showerror("Error", f"Failed to import statements: {str(e)}")
+            return
+
+        if not months:
+            messagebox.showinfo("Import", "No transactions found in the selected statements")
+            return
+
+        if not messagebox.askyesno("Confirm Import",
+                                   f"Import {totals['rows']:,} transactions covering {len(months)} months?\n"
+                                   "Amounts are added to any months already recorded."):
+            return
+
+        added, updated = self.merge_imported_months(months)
+        self.save_data()
+
+        summary = f"Imported {totals['rows']:,} transactions from {len(file_paths)} file(s)\n\n"
+        summary += f"New months: {added}\nUpdated months: {updated}\n"
+        summary += f"Categorised expenses: {totals['categorised']:,}\n"
+        summary += f"Uncategorised expenses: {totals['uncategorised']:,} ({totals['uncategorised_amount']:,.2f} KES, not added)\n"
+        summary += f"Skipped rows: {totals['skipped']:,}"
+        messagebox.showinfo("Import Complete", summary)
+        self.show_screen(self.state["current_screen"])
 
     def clear_all_data(self):
         if messagebox.askyesno("Confirm", "Are you sure you want to delete all your financial data?"):
@@ -1412,8 +2188,10 @@ class PersonalFinanceTracker:
                 "total_savings": 442000,
                 "short_term_savings": 0,
                 "food_inventory": {food: 0 for food in self.food_prices},
+                "food_realised_gains": 0,
                 "current_screen": "month_selector"
             }
+            self.build_food_ledgers()
 
             self.save_data()
             self.show_screen("month_selector")
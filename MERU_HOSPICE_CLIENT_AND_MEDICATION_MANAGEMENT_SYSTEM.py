@@ -1,8 +1,71 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import json
 import os
-from datetime import date, datetime
+import bisect
+from datetime import date, datetime, timedelta
+
+# Batches expiring within this many days are included in the daily alert
+EXPIRY_ALERT_DAYS = 30
+
+class ExpiryIndex:
+    """Every medication batch, kept sorted by expiry date.
+
+    Expiry dates are parsed once, when a medication's batches are indexed,
+    so "expiring within N days" is two bisections plus the matching slice
+    (O(log n + k)) instead of parsing every expiry string on each query.
+    """
+
+    def __init__(self):
+        self._keys = []     # sorted (expiry ordinal, medication id, lot)
+        self._entries = {}  # key -> (medication, batch)
+        self._by_med = {}   # medication id -> its keys
+
+    def _add(self, med):
+        # Register a medication's batches; returns their keys (not yet in self._keys)
+        keys = []
+        for batch in med.get('batches', []):
+            try:
+                ordinal = date.fromisoformat(batch['expiry']).toordinal()
+            except (TypeError, ValueError):
+                continue
+            key = (ordinal, med['id'], batch['lot'])
+            self._entries[key] = (med, batch)
+            keys.append(key)
+        if keys:
+            self._by_med[med['id']] = keys
+        return keys
+
+    def set_batches(self, med):
+        """Index a medication's batches, replacing whatever it had before."""
+        self.remove(med['id'])
+        for key in self._add(med):
+            bisect.insort(self._keys, key)
+
+    def remove(self, med_id):
+        for key in self._by_med.pop(med_id, ()):
+            del self._keys[bisect.bisect_left(self._keys, key)]
+            del self._entries[key]
+
+    def rebuild(self, medications):
+        self._keys, self._entries, self._by_med = [], {}, {}
+        for med in medications:
+            self._keys.extend(self._add(med))
+        self._keys.sort()
+
+    def between(self, start, end):
+        """(expiry date, medication, batch) for batches expiring from start to end inclusive."""
+        lo = bisect.bisect_left(self._keys, (start.toordinal(),))
+        hi = bisect.bisect_left(self._keys, (end.toordinal() + 1,))
+        return [(date.fromordinal(key[0]),) + self._entries[key] for key in self._keys[lo:hi]]
+
+    def expired(self, today=None):
+        today = today or date.today()
+        return self.between(date.min, today - timedelta(days=1))
+
+    def expiring_within(self, days, today=None):
+        today = today or date.today()
+        return self.between(today, today + timedelta(days=days))
 
 class MeruHospiceManager:
     def __init__(self, root):
@@ -15,6 +78,9 @@ class MeruHospiceManager:
         self.supplies = []
         self.medications = []
         
+        # Medication batches ordered by expiry date
+        self.expiry_index = ExpiryIndex()
+        
         # Create notebook (tabbed interface)
         self.notebook = ttk.Notebook(root)
         self.notebook.pack(fill='both', expand=True, padx=10, pady=10)
@@ -35,6 +101,9 @@ class MeruHospiceManager:
         
         # Load existing data
         self.load_data()
+        
+        # Alert about expired and soon-to-expire batches (repeats daily)
+        self.check_expiry_alerts()
     
     def build_client_section(self):
         # Main frame for client section
@@ -218,6 +287,9 @@ class MeruHospiceManager:
         ttk.Button(button_frame, text="Add Medication", command=self.add_medication).pack(side='left', padx=(0, 5))
         ttk.Button(button_frame, text="Edit Medication", command=self.edit_medication).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Delete Medication", command=self.delete_medication).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Receive Batch", command=self.receive_batch).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Dispense (FEFO)", command=self.dispense_medication).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Expiry Report", command=self.expiry_report).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Export Data", command=self.export_med_data).pack(side='right')
         
         # Right frame for medication details
@@ -422,6 +494,11 @@ For support contact: support@grimstrelab.com
             if os.path.exists('medications.json'):
                 with open('medications.json', 'r') as f:
                     self.medications = json.load(f)
+                for med in self.medications:
+                    if 'batches' not in med:
+                        # Saved before batch tracking: its stock is one batch
+                        med['batches'] = self.single_batch(med)
+                self.expiry_index.rebuild(self.medications)
                 for med in self.medications:
                     self.med_tree.insert('', 'end', values=(
                         med['id'], med['name'], med['quantity'], 
@@ -755,7 +832,8 @@ For support contact: support@grimstrelab.com
             'expiry': '',
             'client': '',
             'dosage': '',
-            'instructions': ''
+            'instructions': '',
+            'batches': []
         }
         
         self.medications.append(new_med)
@@ -800,6 +878,7 @@ For support contact: support@grimstrelab.com
         
         # Remove from list and treeview
         self.medications = [m for m in self.medications if m['id'] != med_id]
+        self.expiry_index.remove(med_id)
         self.med_tree.delete(selected)
         
         # Clear form
@@ -831,21 +910,247 @@ For support contact: support@grimstrelab.com
         
         if med:
             med['name'] = self.med_name.get()
-            med['quantity'] = self.med_quantity.get()
-            med['expiry'] = self.med_expiry.get()
             med['client'] = self.med_client.get()
             med['dosage'] = self.med_dosage.get()
             med['instructions'] = self.med_instructions.get(1.0, 'end-1c')
             
+            if len(med.get('batches', [])) > 1:
+                # Quantity and expiry follow the batches once there are several
+                if (self.med_quantity.get(), self.med_expiry.get()) != (med['quantity'], med['expiry']):
+                    messagebox.showwarning("Warning", "This medication is held in several batches. "
+                                           "Use Receive Batch or Dispense to change its quantity or expiry.")
+            else:
+                med['quantity'] = self.med_quantity.get()
+                med['expiry'] = self.med_expiry.get()
+                med['batches'] = self.single_batch(med)
+            
             # Update treeview
-            self.med_tree.item(selected, values=(
-                med['id'], med['name'], med['quantity'], 
-                med['expiry'], med['client']
-            ))
+            self.update_med_batches(selected, med)
             
             self.save_data()
             messagebox.showinfo("Success", "Medication details saved successfully.")
     
+    def single_batch(self, med):
+        # The medication's whole quantity as one batch, when its expiry is a valid date
+        try:
+            expiry = date.fromisoformat(med.get('expiry', '')).isoformat()
+            quantity = int(med.get('quantity', 0))
+        except (TypeError, ValueError):
+            return []
+        lot = med['batches'][0]['lot'] if med.get('batches') else ''
+        return [{'lot': lot, 'quantity': quantity, 'expiry': expiry}] if quantity > 0 else []
+    
+    def update_med_batches(self, item, med):
+        # Keep batches in expiry order; quantity is their total and the listed
+        # expiry is the earliest one
+        batches = med.setdefault('batches', [])
+        if batches:
+            batches.sort(key=lambda batch: batch['expiry'])
+            med['quantity'] = str(sum(batch['quantity'] for batch in batches))
+            med['expiry'] = batches[0]['expiry']
+        self.expiry_index.set_batches(med)
+        
+        self.med_tree.item(item, values=(
+            med['id'], med['name'], med['quantity'], 
+            med['expiry'], med['client']
+        ))
+    
+    def fefo_plan(self, med, quantity, today=None):
+        """Batches to dispense quantity from, first expiring first, as
+        [(batch, units)]; expired batches are skipped. None if the
+        unexpired stock is short."""
+        today = (today or date.today()).isoformat()
+        plan = []
+        for batch in med.get('batches', []):
+            if quantity <= 0:
+                break
+            if batch['expiry'] < today:
+                continue
+            units = min(batch['quantity'], quantity)
+            plan.append((batch, units))
+            quantity -= units
+        return plan if quantity <= 0 else None
+    
+    def receive_batch(self):
+        selected = self.med_tree.focus()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select a medication to receive a batch for.")
+            return
+        
+        values = self.med_tree.item(selected, 'values')
+        if not values:
+            return
+        
+        med_id = values[0]
+        med = next((m for m in self.medications if m['id'] == med_id), None)
+        if not med:
+            return
+        
+        lot = simpledialog.askstring("Receive Batch", f"Lot number for {med['name']}:", parent=self.root)
+        if lot is None:
+            return
+        expiry = simpledialog.askstring("Receive Batch", "Expiry date (YYYY-MM-DD):", parent=self.root)
+        if expiry is None:
+            return
+        try:
+            expiry = date.fromisoformat(expiry.strip()).isoformat()
+        except ValueError:
+            messagebox.showerror("Error", "Expiry date must be in YYYY-MM-DD format.")
+            return
+        quantity = simpledialog.askinteger("Receive Batch", "Quantity received:", minvalue=1, parent=self.root)
+        if quantity is None:
+            return
+        
+        lot = lot.strip()
+        batches = med.setdefault('batches', [])
+        batch = next((b for b in batches if b['lot'] == lot), None)
+        if batch is None:
+            batches.append({'lot': lot, 'quantity': quantity, 'expiry': expiry})
+        elif batch['expiry'] != expiry:
+            messagebox.showerror("Error", f"Lot {lot} is already recorded with expiry {batch['expiry']}.")
+            return
+        else:
+            batch['quantity'] += quantity
+        
+        self.update_med_batches(selected, med)
+        self.on_med_select(None)
+        self.save_data()
+        messagebox.showinfo("Success", f"Received {quantity} units of {med['name']} (lot {lot or 'unnumbered'}).")
+    
+    def dispense_medication(self):
+        selected = self.med_tree.focus()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select a medication to dispense.")
+            return
+        
+        values = self.med_tree.item(selected, 'values')
+        if not values:
+            return
+        
+        med_id = values[0]
+        med = next((m for m in self.medications if m['id'] == med_id), None)
+        if not med:
+            return
+        
+        today = date.today().isoformat()
+        available = sum(b['quantity'] for b in med.get('batches', []) if b['expiry'] >= today)
+        if available <= 0:
+            messagebox.showwarning("Warning", f"{med['name']} has no unexpired batches to dispense from.")
+            return
+        
+        quantity = simpledialog.askinteger("Dispense", f"Quantity of {med['name']} to dispense "
+                                           f"({available} unexpired):", minvalue=1, maxvalue=available,
+                                           parent=self.root)
+        if quantity is None:
+            return
+        
+        # Suggest first-expired-first-out and let the user confirm
+        plan = self.fefo_plan(med, quantity)
+        if plan is None:
+            return
+        lines = "\n".join(f"Lot {batch['lot'] or 'unnumbered'} (expires {batch['expiry']}): {units}"
+                          for batch, units in plan)
+        if not messagebox.askyesno("Confirm", f"Dispense {quantity} units of {med['name']} from:\n\n{lines}"):
+            return
+        
+        for batch, units in plan:
+            batch['quantity'] -= units
+        med['batches'] = [b for b in med['batches'] if b['quantity'] > 0]
+        if not med['batches']:
+            med['quantity'] = '0'
+            med['expiry'] = ''
+        
+        self.update_med_batches(selected, med)
+        self.on_med_select(None)
+        self.save_data()
+        messagebox.showinfo("Success", f"Dispensed {quantity} units of {med['name']}.")
+    
+    def expiry_alert_rows(self, days):
+        # Expired batches, then those expiring within the given number of days
+        today = date.today()
+        rows = []
+        for status, batches in (('Expired', self.expiry_index.expired(today)),
+                                ('Expiring', self.expiry_index.expiring_within(days, today))):
+            for expiry, med, batch in batches:
+                rows.append({
+                    'status': status,
+                    'id': med['id'],
+                    'name': med['name'],
+                    'lot': batch['lot'],
+                    'quantity': batch['quantity'],
+                    'expiry': batch['expiry'],
+                    'days_left': (expiry - today).days
+                })
+        return rows
+    
+    def check_expiry_alerts(self):
+        rows = self.expiry_alert_rows(EXPIRY_ALERT_DAYS)
+        if rows:
+            self.show_expiry_report(rows, f"Expiry Alert - {date.today()}")
+        
+        # Check again just after midnight
+        tomorrow = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+        delay = int((tomorrow - datetime.now()).total_seconds() * 1000) + 1000
+        self.root.after(delay, self.check_expiry_alerts)
+    
+    def expiry_report(self):
+        days = simpledialog.askinteger("Expiry Report", "Show batches expiring within how many days?",
+                                       initialvalue=EXPIRY_ALERT_DAYS, minvalue=0, parent=self.root)
+        if days is None:
+            return
+        
+        rows = self.expiry_alert_rows(days)
+        if not rows:
+            messagebox.showinfo("Expiry Report", f"No batches are expired or expire within {days} days.")
+            return
+        self.show_expiry_report(rows, f"Expiry Report - next {days} days")
+    
+    def show_expiry_report(self, rows, title):
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        window.geometry("700x400")
+        
+        columns = ('status', 'name', 'lot', 'quantity', 'expiry', 'days_left')
+        tree = ttk.Treeview(window, columns=columns, show='headings')
+        for column, heading, width in (('status', 'Status', 80), ('name', 'Medication Name', 180),
+                                       ('lot', 'Lot', 100), ('quantity', 'Quantity', 80),
+                                       ('expiry', 'Expiry Date', 100), ('days_left', 'Days Left', 80)):
+            tree.heading(column, text=heading)
+            tree.column(column, width=width)
+        for row in rows:
+            tree.insert('', 'end', values=tuple(row[column] for column in columns))
+        tree.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        button_frame = ttk.Frame(window)
+        button_frame.pack(fill='x', padx=10, pady=(0, 10))
+        ttk.Button(button_frame, text="Export", command=lambda: self.export_expiry_report(rows)).pack(side='left')
+        ttk.Button(button_frame, text="Close", command=window.destroy).pack(side='right')
+    
+    def export_expiry_report(self, rows):
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            initialfile=f"expiry_report_{date.today().isoformat()}.csv",
+            title="Export Expiry Report"
+        )
+        
+        if not filename:
+            return
+        
+        try:
+            with open(filename, 'w', encoding='utf-8') as f:
+                # Write header
+                f.write("Status,Medication ID,Name,Lot,Quantity,Expiry Date,Days Left\n")
+                
+                # Write data
+                for row in rows:
+                    f.write(f'"{row["status"]}","{row["id"]}","{row["name"]}","{row["lot"]}",'
+                            f'"{row["quantity"]}","{row["expiry"]}","{row["days_left"]}"\n')
+            
+            messagebox.showinfo("Success", f"Expiry report exported to {filename}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export report: {str(e)}")
+    
     def add_supply(self):
         # Generate a new ID
         if self.supplies:
@@ -6,13 +6,20 @@ Created on Mon Aug 25 10:48:58 2025
 """
 
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import json
 import os
-from datetime import date, datetime
+from datetime import date, datetime, timedelta, timezone
 import hashlib
 import socket
+import sqlite3
+import struct
 import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from contextlib import contextmanager
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import pandas as pd
@@ -22,6 +29,858 @@ import numpy as np
 def set_times_new_roman(font_size=10, weight="normal"):
     return ("Times New Roman", font_size, weight)
 
+DATABASE_FILE = 'meru_hospice.db'
+
+def default_admin():
+    return {
+        'username': 'admin',
+        'password': hashlib.sha256('admin123'.encode()).hexdigest(),
+        'role': 'admin',
+        'full_name': 'System Administrator'
+    }
+
+SEARCH_DEBOUNCE_MS = 150
+
+# Stock forecasting: daily usage is an EWMA of dispensing over the window
+FORECAST_WINDOW_DAYS = 90
+USAGE_HALF_LIFE_DAYS = 14
+REORDER_LEAD_DAYS = 7    # days between placing an order and receiving it
+REORDER_COVER_DAYS = 30  # days a reorder should last once it arrives
+
+# Network reporting: queued reports are sent in batches over one connection
+REPORT_BATCH_SIZE = 50
+REPORT_BATCH_WAIT = 2.0       # seconds to wait for more reports before sending a batch
+REPORT_QUEUE_LIMIT = 1000     # oldest unsent reports are dropped beyond this
+REPORT_TIMEOUT = 10           # seconds for connect and for the server's acknowledgement
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+# Record sync: changed rows are exchanged with the central server in chunks
+SYNC_CHUNK_ROWS = 500
+SYNC_POLL_MS = 200
+
+class SearchIndex:
+    """Trigram index over the searchable text fields of a set of records.
+
+    Matching keeps the old behaviour (case-insensitive substring of any
+    field) but only looks at records sharing every trigram of the query,
+    instead of lowercasing every field of every record per keystroke.
+    Queries shorter than a trigram scan the cached lowercase text.
+    Results come back in the order records were first added.
+    """
+
+    GRAM = 3
+
+    def __init__(self, fields):
+        self.fields = fields
+        self._text = {}      # key -> lowercased field values
+        self._order = {}     # key -> insertion sequence number
+        self._postings = {}  # trigram -> keys whose fields contain it
+        self._next = 0
+
+    def _grams(self, values):
+        return {value[i:i + self.GRAM] for value in values for i in range(len(value) - self.GRAM + 1)}
+
+    def add(self, record):
+        """Index a new record, or re-index an edited one in place."""
+        key = str(record.get('id', ''))
+        if key in self._text:
+            self._unindex(key)
+        else:
+            self._order[key] = self._next
+            self._next += 1
+        values = tuple(str(record.get(field, '') or '').lower() for field in self.fields)
+        self._text[key] = values
+        for gram in self._grams(values):
+            self._postings.setdefault(gram, set()).add(key)
+
+    def _unindex(self, key):
+        for gram in self._grams(self._text[key]):
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def remove(self, key):
+        key = str(key)
+        if key in self._text:
+            self._unindex(key)
+            del self._text[key]
+            del self._order[key]
+
+    def rebuild(self, records):
+        self._text, self._order, self._postings, self._next = {}, {}, {}, 0
+        for record in records:
+            self.add(record)
+
+    def search(self, query):
+        """Keys of records with query in any field (all keys for an empty query)."""
+        query = query.lower()
+        if not query:
+            return list(self._text)
+        if len(query) < self.GRAM:
+            return [key for key, values in self._text.items() if any(query in value for value in values)]
+        postings = sorted((self._postings.get(gram, set()) for gram in self._grams((query,))), key=len)
+        matches = set(postings[0]).intersection(*postings[1:])
+        if len(query) > self.GRAM:
+            # Shared trigrams don't guarantee a contiguous match, so confirm each candidate
+            matches = [key for key in matches if any(query in value for value in self._text[key])]
+        return sorted(matches, key=self._order.__getitem__)
+
+def to_int(value, default=0):
+    # Stock quantities are whole numbers; anything unparseable counts as the default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+class DashboardCounters:
+    """Running totals behind the dashboard: client statuses and stock levels.
+
+    Each record's bucket is remembered by ID, so adding, editing or deleting
+    a record moves one count instead of rescanning (and re-parsing) every
+    client, medication and supply on each change.
+    """
+
+    STOCK_LEVELS = ('Normal', 'Low', 'Critical')
+
+    def __init__(self):
+        self.status_counts = {}
+        self.stock_counts = {kind: dict.fromkeys(self.STOCK_LEVELS, 0) for kind in ('medications', 'supplies')}
+        self._buckets = {'clients': {}, 'medications': {}, 'supplies': {}}
+
+    @staticmethod
+    def stock_level(record):
+        quantity = record.get('quantity', 0)
+        min_stock = record.get('min_stock', 0)
+        if quantity <= min_stock * 0.3:
+            return 'Critical'
+        if quantity <= min_stock:
+            return 'Low'
+        return 'Normal'
+
+    def _counts(self, kind):
+        return self.status_counts if kind == 'clients' else self.stock_counts[kind]
+
+    def add(self, kind, record):
+        """Count a new record, or recount an edited one."""
+        key = str(record.get('id', ''))
+        self.remove(kind, key)
+        bucket = record.get('status', 'Active') if kind == 'clients' else self.stock_level(record)
+        self._buckets[kind][key] = bucket
+        counts = self._counts(kind)
+        counts[bucket] = counts.get(bucket, 0) + 1
+
+    def remove(self, kind, key):
+        bucket = self._buckets[kind].pop(key, None)
+        if bucket is not None:
+            self._counts(kind)[bucket] -= 1
+
+    def rebuild(self, kind, records):
+        self._buckets[kind] = {}
+        if kind == 'clients':
+            self.status_counts = {}
+        else:
+            self.stock_counts[kind] = dict.fromkeys(self.STOCK_LEVELS, 0)
+        for record in records:
+            self.add(kind, record)
+
+    def total(self, kind):
+        return len(self._buckets[kind])
+
+    def low_stock(self, kind):
+        # At or below minimum stock (critical items included)
+        counts = self.stock_counts[kind]
+        return counts['Low'] + counts['Critical']
+
+def forecast_stock(items, usage, first_days, today=None):
+    """Usage forecast for every stock item in one vectorised pass.
+
+    items is a list of (table, record); usage holds (table, item_id, day,
+    units dispensed) rows and first_days maps (table, item_id) to the
+    item's first ledger date, as returned by HospiceDatabase.daily_consumption.
+    Returns arrays aligned with items: daily_usage (EWMA of units dispensed
+    per day, counted from the item's first ledger entry), days_of_cover
+    (inf with no usage), reorder_quantity (units to bring stock up to
+    lead time + cover days of usage above min stock) and needs_reorder
+    (stock at or below min stock plus the usage expected over the lead time).
+    """
+    today = today or date.today()
+    start = today - timedelta(days=FORECAST_WINDOW_DAYS - 1)
+    keys = [(table, str(record.get('id', ''))) for table, record in items]
+    position = {key: i for i, key in enumerate(keys)}
+    
+    # Items x days matrix of units dispensed
+    rows, days, amounts = [], [], []
+    for table, item_id, day, amount in usage:
+        row = position.get((table, item_id))
+        offset = (date.fromisoformat(day) - start).days
+        if row is not None and 0 <= offset < FORECAST_WINDOW_DAYS:
+            rows.append(row)
+            days.append(offset)
+            amounts.append(amount)
+    daily = np.zeros((len(items), FORECAST_WINDOW_DAYS))
+    np.add.at(daily, (np.array(rows, dtype=int), np.array(days, dtype=int)), amounts)
+    
+    # Exponential weights, newest day heaviest; days before an item's first
+    # ledger entry are not observations (an item with no ledger has none)
+    alpha = 1 - 0.5 ** (1 / USAGE_HALF_LIFE_DAYS)
+    weights = (1 - alpha) ** np.arange(FORECAST_WINDOW_DAYS - 1, -1, -1)
+    first = np.array([(date.fromisoformat(first_days[key]) - start).days if key in first_days
+                      else FORECAST_WINDOW_DAYS for key in keys], dtype=int)
+    observed = np.arange(FORECAST_WINDOW_DAYS) >= first[:, None]
+    weight_sums = (observed * weights).sum(axis=1)
+    daily_usage = np.divide((daily * weights).sum(axis=1), weight_sums,
+                            out=np.zeros(len(items)), where=weight_sums > 0)
+    
+    quantity = np.array([record.get('quantity', 0) for _, record in items], dtype=float)
+    min_stock = np.array([record.get('min_stock', 0) for _, record in items], dtype=float)
+    days_of_cover = np.divide(quantity, daily_usage, out=np.full(len(items), np.inf), where=daily_usage > 0)
+    target = min_stock + daily_usage * (REORDER_LEAD_DAYS + REORDER_COVER_DAYS)
+    return {
+        'daily_usage': daily_usage,
+        'days_of_cover': days_of_cover,
+        'reorder_quantity': np.maximum(np.ceil(target - quantity), 0).astype(int),
+        'needs_reorder': quantity <= min_stock + daily_usage * REORDER_LEAD_DAYS
+    }
+
+def sync_order(change):
+    # Of two versions of a record the higher version wins, then the later
+    # edit, then the higher origin id, so every copy picks the same one
+    return (change['version'], change['updated_at'], change['origin'])
+
+class StaleRecordError(Exception):
+    """A record was changed in the database (by a sync) after it was loaded."""
+
+class HospiceDatabase:
+    """SQLite storage for clients, medications, supplies and users.
+
+    Each add, edit, restock or delete touches only its own row inside a
+    transaction, instead of rewriting the JSON files in full. WAL mode with
+    synchronous=FULL means a crash mid-write leaves the last committed state
+    intact. Existing clients.json, medications.json, supplies.json and
+    users.json are imported once, the first time the database is opened.
+    Every restock, dispense and adjustment of stock is also appended to the
+    stock_movements ledger, which triggers keep append-only.
+    
+    Clients, medications and supplies are replicated (see BranchSync), so
+    each of their rows carries a version, the time and origin (node_id of
+    the database that made it) of its last change, created_by (node_id of
+    the database that created the record) and a change_seq: the local
+    change number, 0 for changes received from the server. Deleted records
+    leave a row in sync_tombstones with the same fields. Records with the
+    same id but different creators are distinct records, never merged.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS clients (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL DEFAULT '',
+            dob TEXT NOT NULL DEFAULT '',
+            phone TEXT NOT NULL DEFAULT '',
+            address TEXT NOT NULL DEFAULT '',
+            condition TEXT NOT NULL DEFAULT '',
+            status TEXT NOT NULL DEFAULT 'Active',
+            notes TEXT NOT NULL DEFAULT '',
+            extra_json TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS idx_clients_name ON clients(name);
+        CREATE INDEX IF NOT EXISTS idx_clients_status ON clients(status);
+        CREATE TABLE IF NOT EXISTS medications (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL DEFAULT '',
+            description TEXT NOT NULL DEFAULT '',
+            quantity INTEGER NOT NULL DEFAULT 0,
+            min_stock INTEGER NOT NULL DEFAULT 0,
+            last_restocked TEXT NOT NULL DEFAULT '',
+            extra_json TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS idx_medications_name ON medications(name);
+        CREATE TABLE IF NOT EXISTS supplies (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL DEFAULT '',
+            description TEXT NOT NULL DEFAULT '',
+            quantity INTEGER NOT NULL DEFAULT 0,
+            min_stock INTEGER NOT NULL DEFAULT 0,
+            last_restocked TEXT NOT NULL DEFAULT '',
+            extra_json TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS idx_supplies_name ON supplies(name);
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user',
+            full_name TEXT NOT NULL DEFAULT '',
+            extra_json TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
+        CREATE TABLE IF NOT EXISTS stock_movements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_table TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('restock', 'dispense', 'adjust')),
+            change INTEGER NOT NULL,
+            quantity_after INTEGER NOT NULL,
+            occurred_at TEXT NOT NULL,
+            username TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS idx_stock_movements_item ON stock_movements(item_table, item_id, occurred_at);
+        CREATE INDEX IF NOT EXISTS idx_stock_movements_kind ON stock_movements(kind, occurred_at);
+        CREATE TRIGGER IF NOT EXISTS stock_movements_no_update BEFORE UPDATE ON stock_movements
+        BEGIN
+            SELECT RAISE(ABORT, 'stock_movements is append-only');
+        END;
+        CREATE TRIGGER IF NOT EXISTS stock_movements_no_delete BEFORE DELETE ON stock_movements
+        BEGIN
+            SELECT RAISE(ABORT, 'stock_movements is append-only');
+        END;
+        CREATE TABLE IF NOT EXISTS sync_tombstones (
+            item_table TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            updated_at TEXT NOT NULL,
+            origin TEXT NOT NULL,
+            created_by TEXT NOT NULL DEFAULT '',
+            change_seq INTEGER NOT NULL,
+            PRIMARY KEY (item_table, item_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_sync_tombstones_seq ON sync_tombstones(change_seq);
+    '''
+
+    # Columns per table (the first is the key); other record fields go to extra_json
+    COLUMNS = {
+        'clients': ('id', 'name', 'dob', 'phone', 'address', 'condition', 'status', 'notes'),
+        'medications': ('id', 'name', 'description', 'quantity', 'min_stock', 'last_restocked'),
+        'supplies': ('id', 'name', 'description', 'quantity', 'min_stock', 'last_restocked'),
+        'users': ('username', 'password', 'role', 'full_name')
+    }
+
+    # Tables replicated by BranchSync, and the columns added to them for it
+    SYNC_TABLES = ('clients', 'medications', 'supplies')
+    SYNC_COLUMNS = {
+        'version': "INTEGER NOT NULL DEFAULT 0",
+        'updated_at': "TEXT NOT NULL DEFAULT ''",
+        'origin': "TEXT NOT NULL DEFAULT ''",
+        'created_by': "TEXT NOT NULL DEFAULT ''",
+        'change_seq': "INTEGER NOT NULL DEFAULT 0"
+    }
+    
+    # Stored and loaded as ints, whatever the legacy JSON held
+    INTEGER_COLUMNS = ('quantity', 'min_stock')
+
+    JSON_FILES = {
+        'clients': 'clients.json',
+        'medications': 'medications.json',
+        'supplies': 'supplies.json',
+        'users': 'users.json'
+    }
+
+    def __init__(self, path=DATABASE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=FULL')
+        self.conn.executescript(self.SCHEMA)
+        # Identifies this database as the origin of its changes
+        self.conn.execute('INSERT OR IGNORE INTO meta (key, value) VALUES (?, ?)',
+                          ('node_id', f'{socket.gethostname()}-{uuid.uuid4().hex[:8]}'))
+        self.node_id = self.get_meta('node_id')
+        # Prefix of the record ids this database hands out, unique per database
+        self.id_prefix = self.node_id.rsplit('-', 1)[-1]
+        self.add_sync_columns()
+        self.migrate_from_json()
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        if self.conn.in_transaction:  # nested: join the outer transaction
+            yield self.conn
+            return
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.conn
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def _row_to_record(self, table, row):
+        record = json.loads(row['extra_json'])
+        for column in self.COLUMNS[table]:
+            record[column] = row[column]
+            if column in self.INTEGER_COLUMNS:
+                record[column] = to_int(record[column])
+        return record
+
+    def _record_params(self, table, record):
+        columns = self.COLUMNS[table]
+        extra = {k: v for k, v in record.items() if k not in columns}
+        defaults = {'quantity': 0, 'min_stock': 0, 'status': 'Active', 'role': 'user'}
+        values = [record.get(column, defaults.get(column, '')) for column in columns]
+        values = [to_int(value) if column in self.INTEGER_COLUMNS else value
+                  for column, value in zip(columns, values)]
+        return values + [json.dumps(extra)]
+
+    def load(self, table):
+        """All records of a table, in the order they were first added."""
+        return [self._row_to_record(table, row)
+                for row in self.conn.execute(f'SELECT * FROM {table} ORDER BY rowid')]
+
+    def get(self, table, key):
+        key_column = self.COLUMNS[table][0]
+        row = self.conn.execute(f'SELECT * FROM {table} WHERE {key_column} = ?', (key,)).fetchone()
+        return self._row_to_record(table, row) if row else None
+
+    def _upsert(self, conn, table, columns, values):
+        conn.execute(f'''
+            INSERT INTO {table} ({', '.join(columns)})
+            VALUES ({', '.join('?' for _ in columns)})
+            ON CONFLICT({columns[0]}) DO UPDATE SET
+                {', '.join(f'{c} = excluded.{c}' for c in columns[1:])}
+        ''', values)
+
+    def versions(self, table):
+        """Record id -> version for a replicated table (see save_record)."""
+        return {str(key): version for key, version in
+                self.conn.execute(f'SELECT {self.COLUMNS[table][0]}, version FROM {table}')}
+
+    def _check_version(self, conn, table, key, expected_version):
+        # expected_version is the version the caller loaded, 0 for a new record
+        row = conn.execute(f'SELECT version FROM {table} WHERE {self.COLUMNS[table][0]} = ?', (key,)).fetchone()
+        if expected_version is not None and (row['version'] if row else 0) != expected_version:
+            raise StaleRecordError(f"{table} record {key} was changed by a sync since it was loaded")
+
+    def save_record(self, table, record, expected_version=None):
+        """Insert or update one record in place (its position in load() is kept).
+
+        For replicated tables returns the record's new version; given
+        expected_version, raises StaleRecordError instead of overwriting a
+        newer version of the record.
+        """
+        columns = self.COLUMNS[table] + ('extra_json',)
+        values = self._record_params(table, record)
+        with self.transaction() as conn:
+            if table not in self.SYNC_TABLES:
+                self._upsert(conn, table, columns, values)
+                return None
+            key = str(record.get(columns[0], ''))
+            self._check_version(conn, table, key, expected_version)
+            stamp = self._local_change(conn, table, key)
+            self._upsert(conn, table, columns + tuple(self.SYNC_COLUMNS), values + stamp)
+            conn.execute('DELETE FROM sync_tombstones WHERE item_table = ? AND item_id = ?', (table, key))
+            return stamp[0]
+
+    def _save_tombstone(self, conn, table, key, stamp):
+        conn.execute('INSERT OR REPLACE INTO sync_tombstones '
+                     '(item_table, item_id, version, updated_at, origin, created_by, change_seq) '
+                     'VALUES (?, ?, ?, ?, ?, ?, ?)', [table, str(key)] + stamp)
+
+    def delete_record(self, table, key, expected_version=None):
+        key_column = self.COLUMNS[table][0]
+        with self.transaction() as conn:
+            if table in self.SYNC_TABLES:
+                self._check_version(conn, table, key, expected_version)
+                if conn.execute(f'SELECT 1 FROM {table} WHERE {key_column} = ?', (key,)).fetchone():
+                    self._save_tombstone(conn, table, key, self._local_change(conn, table, key))
+            conn.execute(f'DELETE FROM {table} WHERE {key_column} = ?', (key,))
+
+    def replace_all(self, table, records):
+        """Rewrite a whole table in one transaction (imports and bulk saves)."""
+        columns = self.COLUMNS[table]
+        with self.transaction() as conn:
+            if table in self.SYNC_TABLES:
+                # Row by row, so replication sees the edits and deletions
+                keep = {str(record.get(columns[0], '')) for record in records}
+                for (key,) in conn.execute(f'SELECT {columns[0]} FROM {table}').fetchall():
+                    if key not in keep:
+                        self.delete_record(table, key)
+                for record in records:
+                    self.save_record(table, record)
+                return
+            conn.execute(f'DELETE FROM {table}')
+            conn.executemany(
+                f'INSERT OR REPLACE INTO {table} ({", ".join(columns)}, extra_json) '
+                f'VALUES ({", ".join("?" for _ in columns)}, ?)',
+                [self._record_params(table, record) for record in records])
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else default
+
+    def set_meta(self, key, value):
+        with self.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def _next_change_seq(self, conn, count=1):
+        # Reserves count local change numbers and returns the last
+        conn.execute("INSERT INTO meta (key, value) VALUES ('change_seq', ?) "
+                     "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + ?", (str(count), count))
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'change_seq'").fetchone()[0])
+
+    def _sync_state(self, conn, table, key):
+        # version, updated_at, origin and created_by of a record or its tombstone, or None
+        return (conn.execute(f'SELECT version, updated_at, origin, created_by FROM {table} '
+                             f'WHERE {self.COLUMNS[table][0]} = ?', (key,)).fetchone()
+                or conn.execute('SELECT version, updated_at, origin, created_by FROM sync_tombstones '
+                                'WHERE item_table = ? AND item_id = ?', (table, key)).fetchone())
+
+    def _local_change(self, conn, table, key):
+        # Sync column values for a change made here: the next version and change number
+        state = self._sync_state(conn, table, key)
+        return [(state['version'] if state else 0) + 1, datetime.now(timezone.utc).isoformat(),
+                self.node_id, state['created_by'] if state else self.node_id, self._next_change_seq(conn)]
+
+    def add_sync_columns(self):
+        """Add the sync columns to databases created before replication.
+
+        Their existing rows become version 1 changes created by this
+        database, so the first sync sends them all.
+        """
+        with self.transaction() as conn:
+            for table in self.SYNC_TABLES + ('sync_tombstones',):
+                existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+                for column, declaration in self.SYNC_COLUMNS.items():
+                    if column not in existing:
+                        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+                if 'change_seq' not in existing:
+                    rows = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {table}').fetchone()[0]
+                    if rows:
+                        base = self._next_change_seq(conn, rows) - rows
+                        conn.execute(f'UPDATE {table} SET version = 1, updated_at = ?, origin = ?, '
+                                     f'created_by = ?, change_seq = ? + rowid',
+                                     (datetime.now(timezone.utc).isoformat(), self.node_id, self.node_id, base))
+                elif 'created_by' not in existing:
+                    # Synced before creators were tracked: the last editor is the best guess
+                    conn.execute(f'UPDATE {table} SET created_by = origin')
+                if table != 'sync_tombstones':
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_change_seq ON {table}(change_seq)')
+
+    def _change(self, table, key, row, record):
+        return {'table': table, 'id': str(key), 'version': row['version'], 'updated_at': row['updated_at'],
+                'origin': row['origin'], 'created_by': row['created_by'], 'seq': row['change_seq'],
+                'record': record}
+
+    def changes_since(self, seq, limit):
+        """Up to limit changes made here after local change number seq, oldest
+        first; the record of a deletion is None."""
+        changes = []
+        with self.transaction() as conn:  # one snapshot, so no change number is skipped
+            for table in self.SYNC_TABLES:
+                for row in conn.execute(f'SELECT * FROM {table} WHERE change_seq > ? '
+                                        f'ORDER BY change_seq LIMIT ?', (seq, limit)):
+                    changes.append(self._change(table, row[self.COLUMNS[table][0]], row,
+                                                self._row_to_record(table, row)))
+            for row in conn.execute('SELECT * FROM sync_tombstones WHERE change_seq > ? '
+                                    'ORDER BY change_seq LIMIT ?', (seq, limit)):
+                changes.append(self._change(row['item_table'], row['item_id'], row, None))
+        changes.sort(key=lambda change: change['seq'])
+        return changes[:limit]
+
+    def apply_remote(self, changes):
+        """Apply changes received from the server where they win under
+        sync_order(). They get change number 0, so they are not sent back.
+        Returns how many were applied, and the (table, id) of changes to a
+        different record than the local one with that id (another
+        database created it), which are left out.
+        """
+        applied, conflicts = 0, []
+        with self.transaction() as conn:
+            for change in changes:
+                table, key = change['table'], str(change['id'])
+                if table not in self.SYNC_TABLES:
+                    continue
+                state = self._sync_state(conn, table, key)
+                if state is not None and state['created_by'] != change['created_by']:
+                    conflicts.append((table, key))
+                    continue
+                if state is not None and sync_order(state) >= sync_order(change):
+                    continue
+                stamp = [change['version'], change['updated_at'], change['origin'], change['created_by'], 0]
+                if change['record'] is None:
+                    conn.execute(f'DELETE FROM {table} WHERE {self.COLUMNS[table][0]} = ?', (key,))
+                    self._save_tombstone(conn, table, key, stamp)
+                else:
+                    record = dict(change['record'], **{self.COLUMNS[table][0]: key})
+                    self._upsert(conn, table, self.COLUMNS[table] + ('extra_json',) + tuple(self.SYNC_COLUMNS),
+                                 self._record_params(table, record) + stamp)
+                    conn.execute('DELETE FROM sync_tombstones WHERE item_table = ? AND item_id = ?', (table, key))
+                applied += 1
+        return applied, conflicts
+
+    def record_movement(self, table, item_id, kind, change, quantity_after, username=''):
+        """Append one stock movement (restock, dispense or adjust) to the ledger."""
+        with self.transaction() as conn:
+            conn.execute('''
+                INSERT INTO stock_movements (item_table, item_id, kind, change, quantity_after, occurred_at, username)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (table, item_id, kind, change, quantity_after, datetime.now().isoformat(timespec='seconds'), username))
+
+    def daily_consumption(self, since):
+        """Units dispensed per item per day from since (an ISO date) on,
+        and each item's first ledger date, for forecast_stock()."""
+        usage = self.conn.execute('''
+            SELECT item_table, item_id, substr(occurred_at, 1, 10) AS day, -SUM(change)
+            FROM stock_movements
+            WHERE kind = 'dispense' AND occurred_at >= ?
+            GROUP BY item_table, item_id, day
+        ''', (since,)).fetchall()
+        first_days = {(table, item_id): day for table, item_id, day in self.conn.execute('''
+            SELECT item_table, item_id, substr(MIN(occurred_at), 1, 10)
+            FROM stock_movements
+            GROUP BY item_table, item_id
+        ''')}
+        return usage, first_days
+
+    def load_users(self):
+        users = self.load('users')
+        if not users:
+            # Create default admin user if there are no users yet
+            users = [default_admin()]
+            self.replace_all('users', users)
+        return users
+
+    def save_users(self, users):
+        self.replace_all('users', users)
+
+    def migrate_from_json(self):
+        """Import each legacy JSON file once, into an empty table."""
+        for table, filename in self.JSON_FILES.items():
+            marker = f'migrated_{table}'
+            if self.conn.execute('SELECT 1 FROM meta WHERE key = ?', (marker,)).fetchone():
+                continue
+            with self.transaction() as conn:
+                empty = conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone() is None
+                if empty and os.path.exists(filename):
+                    try:
+                        with open(filename, 'r') as f:
+                            records = json.load(f)
+                    except (OSError, ValueError) as e:
+                        print(f"Error importing {filename}: {e}")
+                        records = []
+                    self.replace_all(table, records)
+                conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                             (marker, datetime.now().isoformat()))
+
+def encode_frame(message):
+    """A network message as a frame: 4-byte big-endian length, then zlib-compressed JSON."""
+    payload = zlib.compress(json.dumps(message).encode('utf-8'))
+    return struct.pack('!I', len(payload)) + payload
+
+def recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed by peer")
+        data.extend(chunk)
+    return bytes(data)
+
+def read_frame(sock):
+    """Read one frame written by encode_frame() and return its message."""
+    (size,) = struct.unpack('!I', recv_exactly(sock, 4))
+    if size > MAX_FRAME_BYTES:
+        raise ValueError(f"frame of {size} bytes is too large")
+    try:
+        payload = zlib.decompress(recv_exactly(sock, size))
+    except zlib.error as e:
+        raise ValueError(f"corrupt frame: {e}") from e
+    return json.loads(payload.decode('utf-8'))
+
+class ReportClient:
+    """Sends reports to the network reporting server from a background thread.
+
+    submit() only queues a report, so the Tk thread never waits on the
+    network. The sender thread keeps one TCP connection open and sends
+    whatever has queued up (up to REPORT_BATCH_SIZE reports) as a single
+    frame {'reports': [...]}, which the server acknowledges with
+    {'ack': <count>}. If sending fails the batch goes back on the queue
+    and the thread reconnects, backing off exponentially between failed
+    attempts. Delivery is at-least-once; every report carries a report_id
+    so the server can drop duplicates.
+    """
+
+    def __init__(self, host, port):
+        self.address = (host, port)
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.sock = None
+        self.sock_address = None
+        self.delay = RECONNECT_MIN_DELAY
+        self.last_error = None
+        self.sent = 0
+        self.thread = threading.Thread(target=self._run, name='hospice-report-client', daemon=True)
+        self.thread.start()
+
+    def submit(self, report):
+        with self.condition:
+            self.pending.append(dict(report, report_id=report.get('report_id') or uuid.uuid4().hex))
+            while len(self.pending) > REPORT_QUEUE_LIMIT:
+                self.pending.popleft()
+            self.condition.notify()
+
+    def set_address(self, host, port):
+        # The next batch goes to the new address (the old connection is dropped)
+        with self.condition:
+            self.address = (host, port)
+            self.delay = RECONNECT_MIN_DELAY
+            self.condition.notify()
+
+    def close(self, timeout=5):
+        """Stop the sender, giving it up to timeout seconds to flush the queue."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join(timeout)
+
+    def _next_batch(self):
+        with self.condition:
+            while not self.pending and not self.closed:
+                self.condition.wait()
+            if not self.pending:
+                return None, None
+            # Give other reports a moment to join this batch
+            deadline = time.monotonic() + REPORT_BATCH_WAIT
+            while len(self.pending) < REPORT_BATCH_SIZE and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = [self.pending.popleft() for _ in range(min(REPORT_BATCH_SIZE, len(self.pending)))]
+            return batch, self.address
+
+    def _run(self):
+        while True:
+            batch, address = self._next_batch()
+            if batch is None:
+                break
+            reused = self.sock is not None and self.sock_address == address
+            try:
+                self._send(batch, address)
+            except Exception as e:  # any failure must requeue, or the thread would die with reports queued
+                self.last_error = e
+                self._disconnect()
+                with self.condition:
+                    self.pending.extendleft(reversed(batch))
+                    while len(self.pending) > REPORT_QUEUE_LIMIT:
+                        self.pending.popleft()
+                    if self.closed:
+                        break
+                    if not reused:
+                        # A fresh connection failed: back off before trying again
+                        self.condition.wait_for(lambda: self.closed, timeout=self.delay)
+                        self.delay = min(self.delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            self.last_error = None
+            self.delay = RECONNECT_MIN_DELAY
+            self.sent += len(batch)
+        self._disconnect()
+
+    def _send(self, batch, address):
+        if self.sock is None or self.sock_address != address:
+            self._disconnect()
+            self.sock = socket.create_connection(address, timeout=REPORT_TIMEOUT)
+            self.sock_address = address
+        self.sock.sendall(encode_frame({'reports': batch}))
+        reply = read_frame(self.sock)
+        if reply.get('ack') != len(batch):
+            raise ValueError(f"unexpected reply from report server: {reply!r}")
+
+    def _disconnect(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.sock_address = None
+
+class BranchSync:
+    """Replicates this branch's clients, medications and supplies with the
+    central copy kept by the report server, on a worker thread.
+    
+    Only changes are exchanged, each side tracking how far it got with a
+    high-water mark kept in the meta table. Push sends this database's
+    changes after the last acknowledged local change number; pull asks for
+    the changes made by other databases of the same branch (the server's
+    change numbers) after the last one received. Both go in frames of at
+    most SYNC_CHUNK_ROWS changes and each mark moves on per acknowledged
+    frame, so an interrupted sync resumes where it stopped. Conflicting
+    edits are settled by sync_order() on both sides. Records that share an
+    id but were created by different databases are never merged: they are
+    skipped and listed in conflicts as (table, id). The thread uses its
+    own database connection; pushed and pulled are the change counts, and
+    error is whatever stopped the sync.
+    """
+    
+    def __init__(self, db_path, host, port, branch):
+        self.db_path = db_path
+        self.address = (host, port)
+        self.branch = branch
+        self.pushed = 0
+        self.pulled = 0
+        self.conflicts = []
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='hospice-record-sync', daemon=True)
+        self.thread.start()
+    
+    def _mark(self, direction):
+        # Per server and branch, so changing either starts a full sync
+        return f'sync_{direction}_seq:{self.address[0]}:{self.address[1]}:{self.branch}'
+    
+    def _run(self):
+        db = None
+        try:
+            db = HospiceDatabase(self.db_path)
+            with socket.create_connection(self.address, timeout=REPORT_TIMEOUT) as sock:
+                self._push(db, sock)
+                self._pull(db, sock)
+        except Exception as e:  # anything, so the UI never reports a failed sync as complete
+            self.error = e
+        finally:
+            if db is not None:
+                db.close()
+    
+    def _push(self, db, sock):
+        mark = self._mark('push')
+        since = int(db.get_meta(mark, 0))
+        while True:
+            changes = db.changes_since(since, SYNC_CHUNK_ROWS)
+            if not changes:
+                return
+            sock.sendall(encode_frame({'sync_push': {'branch': self.branch, 'changes': changes}}))
+            reply = read_frame(sock)
+            if reply.get('ack') != len(changes):
+                raise ValueError(f"unexpected reply from report server: {reply!r}")
+            self.conflicts.extend((table, key) for table, key in reply.get('conflicts', []))
+            since = changes[-1]['seq']
+            db.set_meta(mark, since)
+            self.pushed += len(changes)
+    
+    def _pull(self, db, sock):
+        mark = self._mark('pull')
+        since = int(db.get_meta(mark, 0))
+        while True:
+            sock.sendall(encode_frame({'sync_pull': {'branch': self.branch, 'node': db.node_id,
+                                                     'since': since, 'limit': SYNC_CHUNK_ROWS}}))
+            reply = read_frame(sock)
+            applied, conflicts = db.apply_remote(reply['changes'])
+            self.pulled += applied
+            self.conflicts.extend(conflicts)
+            since = reply['hwm']
+            db.set_meta(mark, since)
+            if not reply.get('more'):
+                return
+
 class LoginWindow:
     def __init__(self, root, main_app_callback):
         self.root = root
@@ -74,30 +933,15 @@ class LoginWindow:
         
     def load_users(self):
         try:
-            if os.path.exists('users.json'):
-                with open('users.json', 'r') as f:
-                    return json.load(f)
-            else:
-                # Create default admin user if file doesn't exist
-                default_users = [{
-                    'username': 'admin',
-                    'password': self.hash_password('admin123'),
-                    'role': 'admin',
-                    'full_name': 'System Administrator'
-                }]
-                # Save the default user
-                with open('users.json', 'w') as f:
-                    json.dump(default_users, f, indent=4)
-                return default_users
+            db = HospiceDatabase(DATABASE_FILE)
+            try:
+                return db.load_users()
+            finally:
+                db.close()
         except Exception as e:
             print(f"Error loading users: {e}")
-            # Default admin user if file doesn't exist or error reading
-            return [{
-                'username': 'admin',
-                'password': self.hash_password('admin123'),
-                'role': 'admin',
-                'full_name': 'System Administrator'
-            }]
+            # Default admin user if the database can't be read
+            return [default_admin()]
     
     def hash_password(self, password):
         return hashlib.sha256(password.encode()).hexdigest()
@@ -144,6 +988,32 @@ class MeruHospiceManager:
         self.clients = []
         self.supplies = []
         self.medications = []
+        self.db = HospiceDatabase(DATABASE_FILE)
+        
+        # Search indexes, pending debounced searches and rows hidden by a filter
+        self.search_indexes = {
+            'clients': SearchIndex(('id', 'name', 'phone', 'status')),
+            'medications': SearchIndex(('id', 'name')),
+            'supplies': SearchIndex(('id', 'name'))
+        }
+        self.search_jobs = {}
+        self.hidden_rows = {'clients': set(), 'medications': set(), 'supplies': set()}
+        
+        # Status and stock-level counts read by the dashboard
+        self.counters = DashboardCounters()
+        
+        # ID -> record for each list; tree rows use the ID as their item id,
+        # so these also map a selected row straight to its record
+        self.records_by_id = {'clients': {}, 'medications': {}, 'supplies': {}}
+        self.next_ids = {'clients': 1, 'medications': 1, 'supplies': 1}
+        
+        # ID -> database version of each record as last loaded or saved, so a
+        # save can't overwrite a newer version written by a record sync
+        self.versions = {'clients': {}, 'medications': {}, 'supplies': {}}
+        
+        # Set while a user action runs (see user_action)
+        self.in_action = False
+        self.dashboard_dirty = False
         
         # Create menu bar
         self.menu_bar = tk.Menu(self.root)
@@ -169,6 +1039,7 @@ class MeruHospiceManager:
         self.menu_bar.add_cascade(label="Network", menu=self.network_menu)
         self.network_menu.add_command(label="Configure Network Reporting", command=self.configure_network)
         self.network_menu.add_command(label="Send Report to Network", command=self.send_network_report)
+        self.network_menu.add_command(label="Sync Records with Server", command=self.sync_records)
         
         # Admin menu (only for admin users)
         if self.user['role'] == 'admin':
@@ -200,21 +1071,40 @@ class MeruHospiceManager:
         # Load existing data
         self.load_data()
         
-        # Network configuration
+        # Network configuration; reports are sent by a background client
         self.network_config = self.load_network_config()
+        self.report_client = None
+        self.changed_stock = {}
+        self.update_report_client()
+        self.record_sync = None
         
     def load_network_config(self):
+        config = {
+            'enabled': False,
+            'ip_address': '127.0.0.1',
+            'port': 5000,
+            'auto_send': False,
+            'branch': socket.gethostname()
+        }
         try:
             if os.path.exists('network_config.json'):
                 with open('network_config.json', 'r') as f:
-                    return json.load(f)
-        except:
-            return {
-                'enabled': False,
-                'ip_address': '127.0.0.1',
-                'port': 5000,
-                'auto_send': False
-            }
+                    config.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Error loading network config: {e}")
+        return config
+    
+    def update_report_client(self):
+        # Start, re-point or stop the background report client to match the config
+        config = self.network_config
+        if not config['enabled']:
+            if self.report_client is not None:
+                self.report_client.close()
+                self.report_client = None
+        elif self.report_client is None:
+            self.report_client = ReportClient(config['ip_address'], config['port'])
+        else:
+            self.report_client.set_address(config['ip_address'], config['port'])
     
     def save_network_config(self):
         try:
@@ -269,6 +1159,7 @@ class MeruHospiceManager:
             self.network_config['port'] = int(port_entry.get())
             self.network_config['auto_send'] = self.auto_send.get()
             self.save_network_config()
+            self.update_report_client()
             config_window.destroy()
             messagebox.showinfo("Success", "Network configuration saved successfully")
         
@@ -284,25 +1175,78 @@ class MeruHospiceManager:
             # Create a simple report
             report = {
                 'type': 'full_report',
+                'branch': self.network_config['branch'],
                 'timestamp': datetime.now().isoformat(),
                 'clients_count': len(self.clients),
+                'active_clients_count': self.counters.status_counts.get('Active', 0),
                 'medications_count': len(self.medications),
                 'supplies_count': len(self.supplies),
                 'low_stock_items': self.get_low_stock_items()
             }
             
-            # Convert to JSON
-            report_json = json.dumps(report)
+            # Queue it for the background client
+            self.report_client.submit(report)
             
-            # Send over network
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.connect((self.network_config['ip_address'], self.network_config['port']))
-                s.sendall(report_json.encode())
-                
-            messagebox.showinfo("Success", "Report sent successfully over network")
+            status = "It will be sent in the background."
+            if self.report_client.last_error is not None:
+                status = f"The server is currently unreachable ({self.report_client.last_error}); it will be sent once it is back."
+            messagebox.showinfo("Success", f"Report queued. {status}")
             
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to send network report: {str(e)}")
+            messagebox.showerror("Error", f"Failed to queue network report: {str(e)}")
+    
+    def send_stock_change_report(self):
+        # Auto-send: report the stock items changed by the last user action
+        changed, self.changed_stock = self.changed_stock, {}
+        if not changed or self.report_client is None or not self.network_config['auto_send']:
+            return
+        items = []
+        for (table, item_id), record in changed.items():
+            item = {'table': table, 'id': item_id}
+            if record is None:
+                item['deleted'] = True
+            else:
+                item.update(name=record.get('name', ''), quantity=record.get('quantity', 0),
+                            min_stock=record.get('min_stock', 0))
+            items.append(item)
+        self.report_client.submit({
+            'type': 'stock_change',
+            'branch': self.network_config['branch'],
+            'timestamp': datetime.now().isoformat(),
+            'items': items
+        })
+    
+    def sync_records(self):
+        if not self.network_config['enabled']:
+            messagebox.showwarning("Warning", "Network reporting is not enabled. Please configure it first.")
+            return
+        if self.record_sync is not None:
+            messagebox.showinfo("Sync", "A record sync is already running.")
+            return
+        config = self.network_config
+        self.record_sync = BranchSync(self.db.path, config['ip_address'], config['port'], config['branch'])
+        self.root.after(SYNC_POLL_MS, self.finish_record_sync)
+    
+    def finish_record_sync(self):
+        sync = self.record_sync
+        if sync.thread.is_alive():
+            self.root.after(SYNC_POLL_MS, self.finish_record_sync)
+            return
+        self.record_sync = None
+        if sync.pulled:
+            self.load_data()
+        conflicts = list(dict.fromkeys(sync.conflicts))  # a record can clash both ways
+        if conflicts:
+            listed = ', '.join(f"{table} {key}" for table, key in conflicts[:10])
+            more = f" and {len(conflicts) - 10} more" if len(conflicts) > 10 else ""
+            messagebox.showwarning("Sync Conflicts", f"{len(conflicts)} records were not synced because another "
+                                                     f"workstation has a different record with the same ID: "
+                                                     f"{listed}{more}.")
+        if sync.error is not None:
+            messagebox.showerror("Error", f"Record sync stopped after sending {sync.pushed} and receiving "
+                                          f"{sync.pulled} changes: {sync.error!r}")
+        else:
+            messagebox.showinfo("Sync Complete", f"Sent {sync.pushed} and received {sync.pulled} changed records.")
     
     def manage_users(self):
         user_window = tk.Toplevel(self.root)
@@ -353,29 +1297,14 @@ class MeruHospiceManager:
     
     def load_users(self):
         try:
-            if os.path.exists('users.json'):
-                with open('users.json', 'r') as f:
-                    return json.load(f)
-            else:
-                # Create default admin user if file doesn't exist
-                default_users = [{
-                    'username': 'admin',
-                    'password': hashlib.sha256('admin123'.encode()).hexdigest(),
-                    'role': 'admin',
-                    'full_name': 'System Administrator'
-                }]
-                # Save the default user
-                with open('users.json', 'w') as f:
-                    json.dump(default_users, f, indent=4)
-                return default_users
+            return self.db.load_users()
         except Exception as e:
             print(f"Error loading users: {e}")
             return []
     
     def save_users(self, users):
         try:
-            with open('users.json', 'w') as f:
-                json.dump(users, f, indent=4)
+            self.db.save_users(users)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save users: {str(e)}")
     
@@ -742,7 +1671,7 @@ class MeruHospiceManager:
         # Create medication chart
         med_fig, med_ax = plt.subplots(figsize=(6, 4))
         med_names = [med['name'] for med in self.medications]
-        med_quantities = [int(med['quantity']) for med in self.medications]
+        med_quantities = [med['quantity'] for med in self.medications]
         
         if med_names and med_quantities:
             med_ax.bar(med_names, med_quantities)
@@ -768,7 +1697,7 @@ class MeruHospiceManager:
         # Create supplies chart
         sup_fig, sup_ax = plt.subplots(figsize=(6, 4))
         sup_names = [sup['name'] for sup in self.supplies]
-        sup_quantities = [int(sup['quantity']) for sup in self.supplies]
+        sup_quantities = [sup['quantity'] for sup in self.supplies]
         
         if sup_names and sup_quantities:
             sup_ax.bar(sup_names, sup_quantities)
@@ -849,6 +1778,7 @@ class MeruHospiceManager:
         ttk.Button(button_frame, text="Edit Medication", command=self.edit_medication).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Delete Medication", command=self.delete_medication).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Restock Medication", command=self.restock_medication).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Dispense Medication", command=self.dispense_medication).pack(side='left', padx=5)
         
         # Right frame for medication details
         right_frame = ttk.LabelFrame(main_frame, text="Medication Details")
@@ -947,6 +1877,7 @@ class MeruHospiceManager:
         ttk.Button(button_frame, text="Edit Supply", command=self.edit_supply).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Delete Supply", command=self.delete_supply).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Restock Supply", command=self.restock_supply).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Dispense Supply", command=self.dispense_supply).pack(side='left', padx=5)
         
         # Right frame for supply details
         right_frame = ttk.LabelFrame(main_frame, text="Supply Details")
@@ -1092,18 +2023,15 @@ class MeruHospiceManager:
                  font=set_times_new_roman(9)).pack(pady=5)
     
     def update_dashboard(self):
-        # Update summary metrics
-        self.total_clients.config(text=str(len(self.clients)))
-        active_count = sum(1 for client in self.clients if client.get('status') == 'Active')
-        self.active_clients.config(text=str(active_count))
+        # Update summary metrics (kept current by self.counters)
+        self.total_clients.config(text=str(self.counters.total('clients')))
+        self.active_clients.config(text=str(self.counters.status_counts.get('Active', 0)))
         
-        self.total_meds.config(text=str(len(self.medications)))
-        low_med_count = sum(1 for med in self.medications if int(med.get('quantity', 0)) <= int(med.get('min_stock', 0)))
-        self.low_stock_meds.config(text=str(low_med_count))
+        self.total_meds.config(text=str(self.counters.total('medications')))
+        self.low_stock_meds.config(text=str(self.counters.low_stock('medications')))
         
-        self.total_supplies.config(text=str(len(self.supplies)))
-        low_sup_count = sum(1 for sup in self.supplies if int(sup.get('quantity', 0)) <= int(sup.get('min_stock', 0)))
-        self.low_stock_supplies.config(text=str(low_sup_count))
+        self.total_supplies.config(text=str(self.counters.total('supplies')))
+        self.low_stock_supplies.config(text=str(self.counters.low_stock('supplies')))
         
         # Update charts
         self.update_client_chart()
@@ -1114,11 +2042,8 @@ class MeruHospiceManager:
         self.client_chart_canvas.delete('all')
         
         # Count client statuses
-        status_count = {'Active': 0, 'Inactive': 0, 'Deceased': 0}
-        for client in self.clients:
-            status = client.get('status', 'Active')
-            if status in status_count:
-                status_count[status] += 1
+        status_count = {status: self.counters.status_counts.get(status, 0)
+                        for status in ('Active', 'Inactive', 'Deceased')}
         
         # Draw pie chart
         width = self.client_chart_canvas.winfo_width()
@@ -1165,18 +2090,9 @@ class MeruHospiceManager:
         self.stock_chart_canvas.delete('all')
         
         # Count stock status
-        stock_status = {'Normal': 0, 'Low': 0, 'Critical': 0}
-        
-        for item in self.medications + self.supplies:
-            quantity = int(item.get('quantity', 0))
-            min_stock = int(item.get('min_stock', 0))
-            
-            if quantity <= min_stock * 0.3:
-                stock_status['Critical'] += 1
-            elif quantity <= min_stock:
-                stock_status['Low'] += 1
-            else:
-                stock_status['Normal'] += 1
+        stock_counts = self.counters.stock_counts
+        stock_status = {level: stock_counts['medications'][level] + stock_counts['supplies'][level]
+                        for level in DashboardCounters.STOCK_LEVELS}
         
         # Draw bar chart
         width = self.stock_chart_canvas.winfo_width()
@@ -1216,166 +2132,251 @@ class MeruHospiceManager:
     def load_data(self):
         # Load clients
         try:
-            if os.path.exists('clients.json'):
-                with open('clients.json', 'r') as f:
-                    self.clients = json.load(f)
-                    self.populate_client_tree()
-        except:
+            with self.db.transaction():  # records and versions from one snapshot
+                self.clients = self.db.load('clients')
+                self.versions['clients'] = self.db.versions('clients')
+            self.index_records('clients')
+            self.populate_client_tree()
+        except Exception as e:
+            print(f"Error loading clients: {e}")
             self.clients = []
         
         # Load medications
         try:
-            if os.path.exists('medications.json'):
-                with open('medications.json', 'r') as f:
-                    self.medications = json.load(f)
-                    self.populate_med_tree()
-        except:
+            with self.db.transaction():  # records and versions from one snapshot
+                self.medications = self.db.load('medications')
+                self.versions['medications'] = self.db.versions('medications')
+            self.index_records('medications')
+            self.populate_med_tree()
+        except Exception as e:
+            print(f"Error loading medications: {e}")
             self.medications = []
         
         # Load supplies
         try:
-            if os.path.exists('supplies.json'):
-                with open('supplies.json', 'r') as f:
-                    self.supplies = json.load(f)
-                    self.populate_sup_tree()
-        except:
+            with self.db.transaction():  # records and versions from one snapshot
+                self.supplies = self.db.load('supplies')
+                self.versions['supplies'] = self.db.versions('supplies')
+            self.index_records('supplies')
+            self.populate_sup_tree()
+        except Exception as e:
+            print(f"Error loading supplies: {e}")
             self.supplies = []
         
         # Update dashboard
         self.update_dashboard()
     
-    def save_data(self):
-        # Save clients
-        with open('clients.json', 'w') as f:
-            json.dump(self.clients, f, indent=4)
-        
-        # Save medications
-        with open('medications.json', 'w') as f:
-            json.dump(self.medications, f, indent=4)
-        
-        # Save supplies
-        with open('supplies.json', 'w') as f:
-            json.dump(self.supplies, f, indent=4)
+    def save_record(self, table, record):
+        # Row-level write; inside user_action() it joins the action's transaction.
+        # Raises StaleRecordError if a record sync changed the record since it was loaded
+        key = str(record.get('id', ''))
+        self.versions[table][key] = self.db.save_record(table, record, self.versions[table].get(key, 0))
+        if table in ('medications', 'supplies'):
+            self.changed_stock[(table, key)] = record
+    
+    def delete_record(self, table, key):
+        self.db.delete_record(table, key, self.versions[table].get(key, 0))
+        self.versions[table].pop(key, None)
+        if table in ('medications', 'supplies'):
+            self.changed_stock[(table, key)] = None
+    
+    def record_movement(self, table, record, kind, change):
+        # Stock ledger entry; inside user_action() it commits together with the item
+        if change:
+            self.db.record_movement(table, str(record.get('id', '')), kind, change,
+                                    record.get('quantity', 0), self.user['username'])
+    
+    @contextmanager
+    def user_action(self):
+        """Group the work of one user action.
+        
+        Its writes commit as a single transaction and the dashboard is
+        refreshed once at the end, however many records changed. Yields a
+        dict whose 'saved' flag is False if the writes failed. If a record
+        sync changed one of the records meanwhile nothing is saved and the
+        lists are reloaded from the database.
+        """
+        action = {'saved': True}
+        self.in_action = True
+        self.dashboard_dirty = False
+        self.changed_stock = {}
+        try:
+            with self.db.transaction():
+                yield action
+        except StaleRecordError as e:
+            action['saved'] = False
+            self.changed_stock = {}
+            self.in_action = False
+            self.load_data()
+            messagebox.showwarning("Warning", f"Nothing was saved: {str(e)}. "
+                                              f"The lists now show the synced data; please make the change again.")
+        except sqlite3.Error as e:
+            action['saved'] = False
+            self.changed_stock = {}
+            for kind in self.versions:  # versions set by the rolled-back saves
+                self.versions[kind] = self.db.versions(kind)
+            messagebox.showerror("Error", f"Failed to save data: {str(e)}")
+        finally:
+            self.in_action = False
+        if self.dashboard_dirty:
+            self.update_dashboard()
+        self.send_stock_change_report()
+    
+    def refresh_dashboard(self):
+        if self.in_action:
+            self.dashboard_dirty = True
+        else:
+            self.update_dashboard()
+    
+    def index_records(self, kind):
+        # Rebuild the ID map, next ID and search index for one list
+        records = getattr(self, kind)
+        self.records_by_id[kind] = {str(record.get('id', '')): record for record in records}
+        # New IDs carry this database's prefix so they can't clash with another
+        # workstation's; numbering carries on from the plain numeric IDs of old
+        prefix = self.db.id_prefix + '-'
+        numbers = [key[len(prefix):] if key.startswith(prefix) else key for key in self.records_by_id[kind]]
+        self.next_ids[kind] = max((int(number) for number in numbers if number.isdigit()), default=0) + 1
+        self.search_indexes[kind].rebuild(records)
+        self.counters.rebuild(kind, records)
+    
+    def new_record_id(self, kind):
+        new_id = f'{self.db.id_prefix}-{self.next_ids[kind]}'
+        self.next_ids[kind] += 1
+        return new_id
+    
+    def search_view(self, kind):
+        # (tree, search entry) for each searchable list
+        return {
+            'clients': (self.client_tree, self.client_search),
+            'medications': (self.med_tree, self.med_search),
+            'supplies': (self.sup_tree, self.sup_search)
+        }[kind]
+    
+    def clear_tree(self, kind):
+        # Rows hidden by a search are detached, not deleted, so remove those too
+        tree, _ = self.search_view(kind)
+        tree.delete(*tree.get_children(), *self.hidden_rows[kind])
+        self.hidden_rows[kind] = set()
+    
+    def row_values(self, kind, record):
+        if kind == 'clients':
+            return (
+                record.get('id', ''),
+                record.get('name', ''),
+                record.get('dob', ''),
+                record.get('phone', ''),
+                record.get('status', 'Active')
+            )
+        return (
+            record.get('id', ''),
+            record.get('name', ''),
+            record.get('quantity', ''),
+            record.get('min_stock', ''),
+            record.get('last_restocked', '')
+        )
+    
+    def insert_row(self, kind, record):
+        tree, _ = self.search_view(kind)
+        tree.insert('', 'end', iid=str(record.get('id', '')), values=self.row_values(kind, record))
+        self.search_indexes[kind].add(record)
+        self.counters.add(kind, record)
+        self.apply_search(kind)
+    
+    def update_row(self, kind, record):
+        # Update just this row in place; re-filter in case it no longer matches the search
+        tree, entry = self.search_view(kind)
+        item = str(record.get('id', ''))
+        if tree.exists(item):
+            tree.item(item, values=self.row_values(kind, record))
+        self.search_indexes[kind].add(record)
+        self.counters.add(kind, record)
+        if entry.get():
+            self.apply_search(kind)
+    
+    def remove_row(self, kind, item):
+        tree, _ = self.search_view(kind)
+        if tree.exists(item):
+            tree.delete(item)
+        self.hidden_rows[kind].discard(item)
+        self.search_indexes[kind].remove(item)
+        self.counters.remove(kind, item)
     
     def populate_client_tree(self):
         # Clear existing items
-        for item in self.client_tree.get_children():
-            self.client_tree.delete(item)
+        self.clear_tree('clients')
         
-        # Add clients to treeview
+        # Add clients to treeview (the client ID is the row's item id)
         for client in self.clients:
-            self.client_tree.insert('', 'end', values=(
-                client.get('id', ''),
-                client.get('name', ''),
-                client.get('dob', ''),
-                client.get('phone', ''),
-                client.get('status', 'Active')
-            ))
+            self.client_tree.insert('', 'end', iid=str(client.get('id', '')), values=self.row_values('clients', client))
+        self.apply_search('clients')
     
     def populate_med_tree(self):
         # Clear existing items
-        for item in self.med_tree.get_children():
-            self.med_tree.delete(item)
+        self.clear_tree('medications')
         
         # Add medications to treeview
         for med in self.medications:
-            self.med_tree.insert('', 'end', values=(
-                med.get('id', ''),
-                med.get('name', ''),
-                med.get('quantity', ''),
-                med.get('min_stock', ''),
-                med.get('last_restocked', '')
-            ))
+            self.med_tree.insert('', 'end', iid=str(med.get('id', '')), values=self.row_values('medications', med))
+        self.apply_search('medications')
     
     def populate_sup_tree(self):
         # Clear existing items
-        for item in self.sup_tree.get_children():
-            self.sup_tree.delete(item)
+        self.clear_tree('supplies')
         
         # Add supplies to treeview
         for sup in self.supplies:
-            self.sup_tree.insert('', 'end', values=(
-                sup.get('id', ''),
-                sup.get('name', ''),
-                sup.get('quantity', ''),
-                sup.get('min_stock', ''),
-                sup.get('last_restocked', '')
-            ))
+            self.sup_tree.insert('', 'end', iid=str(sup.get('id', '')), values=self.row_values('supplies', sup))
+        self.apply_search('supplies')
+    
+    def schedule_search(self, kind):
+        # Debounce typing: only search once the user pauses
+        job = self.search_jobs.get(kind)
+        if job is not None:
+            self.root.after_cancel(job)
+        self.search_jobs[kind] = self.root.after(SEARCH_DEBOUNCE_MS, lambda: self.apply_search(kind))
+    
+    def apply_search(self, kind):
+        self.search_jobs.pop(kind, None)
+        tree, entry = self.search_view(kind)
+        query = entry.get()
+        hidden = self.hidden_rows[kind]
+        if not query and not hidden:
+            return  # nothing filtered, every row is already shown
+        wanted = self.search_indexes[kind].search(query)
+        wanted_set = set(wanted)
+        
+        # Detach rows that no longer match
+        visible = set()
+        for item in tree.get_children():
+            if item in wanted_set:
+                visible.add(item)
+            else:
+                tree.detach(item)
+                hidden.add(item)
+        
+        # Reattach newly matching rows at their position in the filtered order
+        for position, item in enumerate(wanted):
+            if item not in visible and item in hidden:
+                tree.reattach(item, '', position)
+                hidden.discard(item)
     
     def filter_clients(self, event):
-        query = self.client_search.get().lower()
-        
-        # Clear existing items
-        for item in self.client_tree.get_children():
-            self.client_tree.delete(item)
-        
-        # Add filtered clients to treeview
-        for client in self.clients:
-            if (query in client.get('id', '').lower() or 
-                query in client.get('name', '').lower() or 
-                query in client.get('phone', '').lower() or
-                query in client.get('status', '').lower()):
-                
-                self.client_tree.insert('', 'end', values=(
-                    client.get('id', ''),
-                    client.get('name', ''),
-                    client.get('dob', ''),
-                    client.get('phone', ''),
-                    client.get('status', 'Active')
-                ))
+        self.schedule_search('clients')
     
     def filter_medications(self, event):
-        query = self.med_search.get().lower()
-        
-        # Clear existing items
-        for item in self.med_tree.get_children():
-            self.med_tree.delete(item)
-        
-        # Add filtered medications to treeview
-        for med in self.medications:
-            if (query in med.get('id', '').lower() or 
-                query in med.get('name', '').lower()):
-                
-                self.med_tree.insert('', 'end', values=(
-                    med.get('id', ''),
-                    med.get('name', ''),
-                    med.get('quantity', ''),
-                    med.get('min_stock', ''),
-                    med.get('last_restocked', '')
-                ))
+        self.schedule_search('medications')
     
     def filter_supplies(self, event):
-        query = self.sup_search.get().lower()
-        
-        # Clear existing items
-        for item in self.sup_tree.get_children():
-            self.sup_tree.delete(item)
-        
-        # Add filtered supplies to treeview
-        for sup in self.supplies:
-            if (query in sup.get('id', '').lower() or 
-                query in sup.get('name', '').lower()):
-                
-                self.sup_tree.insert('', 'end', values=(
-                    sup.get('id', ''),
-                    sup.get('name', ''),
-                    sup.get('quantity', ''),
-                    sup.get('min_stock', ''),
-                    sup.get('last_restocked', '')
-                ))
+        self.schedule_search('supplies')
     
     def on_client_select(self, event):
         selected = self.client_tree.focus()
         if not selected:
             return
             
-        values = self.client_tree.item(selected, 'values')
-        if not values:
-            return
-            
-        # Find client in list
-        client_id = values[0]
-        client = next((c for c in self.clients if c.get('id') == client_id), None)
+        # The row's item id is the record ID
+        client = self.records_by_id['clients'].get(selected)
         
         if client:
             # Populate form fields
@@ -1409,13 +2410,8 @@ class MeruHospiceManager:
         if not selected:
             return
             
-        values = self.med_tree.item(selected, 'values')
-        if not values:
-            return
-            
-        # Find medication in list
-        med_id = values[0]
-        med = next((m for m in self.medications if m.get('id') == med_id), None)
+        # The row's item id is the record ID
+        med = self.records_by_id['medications'].get(selected)
         
         if med:
             # Populate form fields
@@ -1444,13 +2440,8 @@ class MeruHospiceManager:
         if not selected:
             return
             
-        values = self.sup_tree.item(selected, 'values')
-        if not values:
-            return
-            
-        # Find supply in list
-        sup_id = values[0]
-        sup = next((s for s in self.supplies if s.get('id') == sup_id), None)
+        # The row's item id is the record ID
+        sup = self.records_by_id['supplies'].get(selected)
         
         if sup:
             # Populate form fields
@@ -1476,10 +2467,7 @@ class MeruHospiceManager:
     
     def add_client(self):
         # Generate new ID
-        if self.clients:
-            new_id = str(max(int(c.get('id', '0')) for c in self.clients) + 1)
-        else:
-            new_id = '1'
+        new_id = self.new_record_id('clients')
         
         # Create new client
         new_client = {
@@ -1494,15 +2482,15 @@ class MeruHospiceManager:
         }
         
         self.clients.append(new_client)
-        self.populate_client_tree()
+        self.records_by_id['clients'][new_id] = new_client
+        self.client_search.delete(0, 'end')  # show the new (blank) row
+        self.insert_row('clients', new_client)
         
         # Select the new client
-        for item in self.client_tree.get_children():
-            if self.client_tree.item(item, 'values')[0] == new_id:
-                self.client_tree.focus(item)
-                self.client_tree.selection_set(item)
-                self.on_client_select(None)
-                break
+        self.client_tree.focus(new_id)
+        self.client_tree.selection_set(new_id)
+        self.client_tree.see(new_id)
+        self.on_client_select(None)
     
     def edit_client(self):
         selected = self.client_tree.focus()
@@ -1527,12 +2515,15 @@ class MeruHospiceManager:
         if not messagebox.askyesno("Confirm", f"Are you sure you want to delete client {values[1]}?"):
             return
             
-        # Remove client from list
-        self.clients = [c for c in self.clients if c.get('id') != client_id]
-        self.populate_client_tree()
-        self.clear_client_form()
-        self.save_data()
-        self.update_dashboard()
+        # Remove client from the database, then from the list and tree
+        with self.user_action():
+            self.delete_record('clients', client_id)
+            record = self.records_by_id['clients'].pop(client_id, None)
+            if record is not None:
+                self.clients.remove(record)
+            self.remove_row('clients', client_id)
+            self.clear_client_form()
+            self.refresh_dashboard()
     
     def clear_client_form(self):
         self.client_id.config(state='normal')
@@ -1554,53 +2545,52 @@ class MeruHospiceManager:
             return
             
         # Find client in list
-        client = next((c for c in self.clients if c.get('id') == client_id), None)
+        client = self.records_by_id['clients'].get(client_id)
         if not client:
             return
             
-        # Update client data
-        client['name'] = self.client_name.get()
-        client['dob'] = self.client_dob.get()
-        client['phone'] = self.client_phone.get()
-        client['address'] = self.client_address.get()
-        client['condition'] = self.client_condition.get()
-        client['status'] = self.client_status.get()
-        client['notes'] = self.client_notes.get(1.0, 'end-1c')
-        
-        # Update treeview
-        self.populate_client_tree()
-        self.save_data()
-        self.update_dashboard()
-        
-        messagebox.showinfo("Success", "Client data saved successfully")
+        with self.user_action() as action:
+            # Update client data
+            client['name'] = self.client_name.get()
+            client['dob'] = self.client_dob.get()
+            client['phone'] = self.client_phone.get()
+            client['address'] = self.client_address.get()
+            client['condition'] = self.client_condition.get()
+            client['status'] = self.client_status.get()
+            client['notes'] = self.client_notes.get(1.0, 'end-1c')
+            self.save_record('clients', client)
+            
+            # Update just this row in the treeview
+            self.update_row('clients', client)
+            self.refresh_dashboard()
+        
+        if action['saved']:
+            messagebox.showinfo("Success", "Client data saved successfully")
     
     def add_medication(self):
         # Generate new ID
-        if self.medications:
-            new_id = str(max(int(m.get('id', '0')) for m in self.medications) + 1)
-        else:
-            new_id = '1'
+        new_id = self.new_record_id('medications')
         
         # Create new medication
         new_med = {
             'id': new_id,
             'name': '',
             'description': '',
-            'quantity': '0',
-            'min_stock': '10',
+            'quantity': 0,
+            'min_stock': 10,
             'last_restocked': date.today().isoformat()
         }
         
         self.medications.append(new_med)
-        self.populate_med_tree()
+        self.records_by_id['medications'][new_id] = new_med
+        self.med_search.delete(0, 'end')  # show the new (blank) row
+        self.insert_row('medications', new_med)
         
         # Select the new medication
-        for item in self.med_tree.get_children():
-            if self.med_tree.item(item, 'values')[0] == new_id:
-                self.med_tree.focus(item)
-                self.med_tree.selection_set(item)
-                self.on_med_select(None)
-                break
+        self.med_tree.focus(new_id)
+        self.med_tree.selection_set(new_id)
+        self.med_tree.see(new_id)
+        self.on_med_select(None)
     
     def edit_medication(self):
         selected = self.med_tree.focus()
@@ -1625,12 +2615,15 @@ class MeruHospiceManager:
         if not messagebox.askyesno("Confirm", f"Are you sure you want to delete medication {values[1]}?"):
             return
             
-        # Remove medication from list
-        self.medications = [m for m in self.medications if m.get('id') != med_id]
-        self.populate_med_tree()
-        self.clear_med_form()
-        self.save_data()
-        self.update_dashboard()
+        # Remove medication from the database, then from the list and tree
+        with self.user_action():
+            self.delete_record('medications', med_id)
+            record = self.records_by_id['medications'].pop(med_id, None)
+            if record is not None:
+                self.medications.remove(record)
+            self.remove_row('medications', med_id)
+            self.clear_med_form()
+            self.refresh_dashboard()
     
     def clear_med_form(self):
         self.med_id.config(state='normal')
@@ -1650,23 +2643,33 @@ class MeruHospiceManager:
             return
             
         # Find medication in list
-        med = next((m for m in self.medications if m.get('id') == med_id), None)
+        med = self.records_by_id['medications'].get(med_id)
         if not med:
             return
             
-        # Update medication data
-        med['name'] = self.med_name.get()
-        med['description'] = self.med_desc.get()
-        med['quantity'] = self.med_quantity.get()
-        med['min_stock'] = self.med_min_stock.get()
-        med['last_restocked'] = self.med_last_restocked.get()
-        
-        # Update treeview
-        self.populate_med_tree()
-        self.save_data()
-        self.update_dashboard()
-        
-        messagebox.showinfo("Success", "Medication data saved successfully")
+        quantity = to_int(self.med_quantity.get(), None)
+        min_stock = to_int(self.med_min_stock.get(), None)
+        if quantity is None or min_stock is None:
+            messagebox.showerror("Error", "Quantity and min stock must be whole numbers")
+            return
+            
+        previous_quantity = med.get('quantity', 0)
+        with self.user_action() as action:
+            # Update medication data
+            med['name'] = self.med_name.get()
+            med['description'] = self.med_desc.get()
+            med['quantity'] = quantity
+            med['min_stock'] = min_stock
+            med['last_restocked'] = self.med_last_restocked.get()
+            self.save_record('medications', med)
+            self.record_movement('medications', med, 'adjust', quantity - previous_quantity)
+            
+            # Update just this row in the treeview
+            self.update_row('medications', med)
+            self.refresh_dashboard()
+        
+        if action['saved']:
+            messagebox.showinfo("Success", "Medication data saved successfully")
     
     def restock_medication(self):
         selected = self.med_tree.focus()
@@ -1674,60 +2677,85 @@ class MeruHospiceManager:
             messagebox.showwarning("Warning", "Please select a medication to restock")
             return
             
-        values = self.med_tree.item(selected, 'values')
-        if not values:
+        med = self.records_by_id['medications'].get(selected)
+        if not med:
             return
             
-        med_id = values[0]
+        # Ask for restock quantity
+        quantity = simpledialog.askinteger("Restock", f"Enter restock quantity for {med['name']}:", minvalue=1)
+        if quantity is None:
+            return
+            
+        with self.user_action() as action:
+            # Update medication
+            med['quantity'] = med.get('quantity', 0) + quantity
+            med['last_restocked'] = date.today().isoformat()
+            self.save_record('medications', med)
+            self.record_movement('medications', med, 'restock', quantity)
+            
+            # Update just this row in the treeview
+            self.update_row('medications', med)
+            self.refresh_dashboard()
         
-        # Find medication in list
-        med = next((m for m in self.medications if m.get('id') == med_id), None)
+        if action['saved']:
+            messagebox.showinfo("Success", f"Restocked {quantity} units of {med['name']}")
+    
+    def dispense_medication(self):
+        selected = self.med_tree.focus()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select a medication to dispense")
+            return
+            
+        med = self.records_by_id['medications'].get(selected)
         if not med:
             return
+        if med.get('quantity', 0) <= 0:
+            messagebox.showwarning("Warning", f"{med['name']} is out of stock")
+            return
             
-        # Ask for restock quantity
-        quantity = tk.simpledialog.askinteger("Restock", f"Enter restock quantity for {med['name']}:", minvalue=1)
+        # Ask for dispensed quantity
+        quantity = simpledialog.askinteger("Dispense", f"Enter quantity of {med['name']} dispensed:",
+                                           minvalue=1, maxvalue=med.get('quantity', 0))
         if quantity is None:
             return
             
-        # Update medication
-        med['quantity'] = str(int(med.get('quantity', 0)) + quantity)
-        med['last_restocked'] = date.today().isoformat()
-        
-        # Update treeview
-        self.populate_med_tree()
-        self.save_data()
-        self.update_dashboard()
+        with self.user_action() as action:
+            # Update medication
+            med['quantity'] = med.get('quantity', 0) - quantity
+            self.save_record('medications', med)
+            self.record_movement('medications', med, 'dispense', -quantity)
+            
+            # Update just this row in the treeview
+            self.update_row('medications', med)
+            self.refresh_dashboard()
         
-        messagebox.showinfo("Success", f"Restocked {quantity} units of {med['name']}")
+        if action['saved']:
+            messagebox.showinfo("Success", f"Dispensed {quantity} units of {med['name']}")
     
     def add_supply(self):
         # Generate new ID
-        if self.supplies:
-            new_id = str(max(int(s.get('id', '0')) for s in self.supplies) + 1)
-        else:
-            new_id = '1'
+        new_id = self.new_record_id('supplies')
         
         # Create new supply
         new_sup = {
             'id': new_id,
             'name': '',
             'description': '',
-            'quantity': '0',
-            'min_stock': '10',
+            'quantity': 0,
+            'min_stock': 10,
             'last_restocked': date.today().isoformat()
         }
         
         self.supplies.append(new_sup)
-        self.populate_sup_tree()
+        self.records_by_id['supplies'][new_id] = new_sup
+        self.sup_search.delete(0, 'end')  # show the new (blank) row
+        self.insert_row('supplies', new_sup)
         
         # Select the new supply
-        for item in self.sup_tree.get_children():
-            if self.sup_tree.item(item, 'values')[0] == new_id:
-                self.sup_tree.focus(item)
-                self.sup_tree.selection_set(item)
-                self.on_sup_select(None)
-                break
+        self.sup_tree.focus(new_id)
+        self.sup_tree.selection_set(new_id)
+        self.sup_tree.see(new_id)
+        self.on_sup_select(None)
     
     def edit_supply(self):
         selected = self.sup_tree.focus()
@@ -1752,12 +2780,15 @@ class MeruHospiceManager:
         if not messagebox.askyesno("Confirm", f"Are you sure you want to delete supply {values[1]}?"):
             return
             
-        # Remove supply from list
-        self.supplies = [s for s in self.supplies if s.get('id') != sup_id]
-        self.populate_sup_tree()
-        self.clear_sup_form()
-        self.save_data()
-        self.update_dashboard()
+        # Remove supply from the database, then from the list and tree
+        with self.user_action():
+            self.delete_record('supplies', sup_id)
+            record = self.records_by_id['supplies'].pop(sup_id, None)
+            if record is not None:
+                self.supplies.remove(record)
+            self.remove_row('supplies', sup_id)
+            self.clear_sup_form()
+            self.refresh_dashboard()
     
     def clear_sup_form(self):
         self.sup_id.config(state='normal')
@@ -1777,23 +2808,33 @@ class MeruHospiceManager:
             return
             
         # Find supply in list
-        sup = next((s for s in self.supplies if s.get('id') == sup_id), None)
+        sup = self.records_by_id['supplies'].get(sup_id)
         if not sup:
             return
             
-        # Update supply data
-        sup['name'] = self.sup_name.get()
-        sup['description'] = self.sup_desc.get()
-        sup['quantity'] = self.sup_quantity.get()
-        sup['min_stock'] = self.sup_min_stock.get()
-        sup['last_restocked'] = self.sup_last_restocked.get()
-        
-        # Update treeview
-        self.populate_sup_tree()
-        self.save_data()
-        self.update_dashboard()
-        
-        messagebox.showinfo("Success", "Supply data saved successfully")
+        quantity = to_int(self.sup_quantity.get(), None)
+        min_stock = to_int(self.sup_min_stock.get(), None)
+        if quantity is None or min_stock is None:
+            messagebox.showerror("Error", "Quantity and min stock must be whole numbers")
+            return
+            
+        previous_quantity = sup.get('quantity', 0)
+        with self.user_action() as action:
+            # Update supply data
+            sup['name'] = self.sup_name.get()
+            sup['description'] = self.sup_desc.get()
+            sup['quantity'] = quantity
+            sup['min_stock'] = min_stock
+            sup['last_restocked'] = self.sup_last_restocked.get()
+            self.save_record('supplies', sup)
+            self.record_movement('supplies', sup, 'adjust', quantity - previous_quantity)
+            
+            # Update just this row in the treeview
+            self.update_row('supplies', sup)
+            self.refresh_dashboard()
+        
+        if action['saved']:
+            messagebox.showinfo("Success", "Supply data saved successfully")
     
     def restock_supply(self):
         selected = self.sup_tree.focus()
@@ -1801,32 +2842,60 @@ class MeruHospiceManager:
             messagebox.showwarning("Warning", "Please select a supply to restock")
             return
             
-        values = self.sup_tree.item(selected, 'values')
-        if not values:
+        sup = self.records_by_id['supplies'].get(selected)
+        if not sup:
             return
             
-        sup_id = values[0]
+        # Ask for restock quantity
+        quantity = simpledialog.askinteger("Restock", f"Enter restock quantity for {sup['name']}:", minvalue=1)
+        if quantity is None:
+            return
+            
+        with self.user_action() as action:
+            # Update supply
+            sup['quantity'] = sup.get('quantity', 0) + quantity
+            sup['last_restocked'] = date.today().isoformat()
+            self.save_record('supplies', sup)
+            self.record_movement('supplies', sup, 'restock', quantity)
+            
+            # Update just this row in the treeview
+            self.update_row('supplies', sup)
+            self.refresh_dashboard()
         
-        # Find supply in list
-        sup = next((s for s in self.supplies if s.get('id') == sup_id), None)
+        if action['saved']:
+            messagebox.showinfo("Success", f"Restocked {quantity} units of {sup['name']}")
+    
+    def dispense_supply(self):
+        selected = self.sup_tree.focus()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select a supply to dispense")
+            return
+            
+        sup = self.records_by_id['supplies'].get(selected)
         if not sup:
             return
+        if sup.get('quantity', 0) <= 0:
+            messagebox.showwarning("Warning", f"{sup['name']} is out of stock")
+            return
             
-        # Ask for restock quantity
-        quantity = tk.simpledialog.askinteger("Restock", f"Enter restock quantity for {sup['name']}:", minvalue=1)
+        # Ask for dispensed quantity
+        quantity = simpledialog.askinteger("Dispense", f"Enter quantity of {sup['name']} dispensed:",
+                                           minvalue=1, maxvalue=sup.get('quantity', 0))
         if quantity is None:
             return
             
-        # Update supply
-        sup['quantity'] = str(int(sup.get('quantity', 0)) + quantity)
-        sup['last_restocked'] = date.today().isoformat()
-        
-        # Update treeview
-        self.populate_sup_tree()
-        self.save_data()
-        self.update_dashboard()
+        with self.user_action() as action:
+            # Update supply
+            sup['quantity'] = sup.get('quantity', 0) - quantity
+            self.save_record('supplies', sup)
+            self.record_movement('supplies', sup, 'dispense', -quantity)
+            
+            # Update just this row in the treeview
+            self.update_row('supplies', sup)
+            self.refresh_dashboard()
         
-        messagebox.showinfo("Success", f"Restocked {quantity} units of {sup['name']}")
+        if action['saved']:
+            messagebox.showinfo("Success", f"Dispensed {quantity} units of {sup['name']}")
     
     def generate_report(self, report_type):
         if report_type == 'client':
@@ -1864,16 +2933,12 @@ class MeruHospiceManager:
             messagebox.showerror("Error", f"Failed to generate report: {str(e)}")
     
     def generate_stock_alert_report(self):
-        # Get low stock items
-        low_stock_meds = [m for m in self.medications if int(m.get('quantity', 0)) <= int(m.get('min_stock', 0))]
-        low_stock_supplies = [s for s in self.supplies if int(s.get('quantity', 0)) <= int(s.get('min_stock', 0))]
+        # Get low stock items, with their usage forecast and suggested reorder
+        low_stock_items = self.get_low_stock_items()
         
-        if not low_stock_meds and not low_stock_supplies:
+        if not low_stock_items:
             messagebox.showinfo("Info", "No low stock items found")
             return
-            
-        # Combine low stock items
-        low_stock_items = low_stock_meds + low_stock_supplies
         
         # Ask for save location
         filename = f"stock_alert_report_{date.today().isoformat()}.csv"
@@ -1895,9 +2960,29 @@ class MeruHospiceManager:
             messagebox.showerror("Error", f"Failed to generate stock alert report: {str(e)}")
     
     def get_low_stock_items(self):
-        low_stock_meds = [m for m in self.medications if int(m.get('quantity', 0)) <= int(m.get('min_stock', 0))]
-        low_stock_supplies = [s for s in self.supplies if int(s.get('quantity', 0)) <= int(s.get('min_stock', 0))]
-        return low_stock_meds + low_stock_supplies
+        """Medications and supplies at or below min stock, or expected to get
+        there within the reorder lead time at their current rate of use.
+        
+        Each is a copy of the record with its type, daily_usage,
+        days_of_cover (None with no recorded usage) and reorder_quantity.
+        """
+        items = [('medications', med) for med in self.medications] + [('supplies', sup) for sup in self.supplies]
+        since = (date.today() - timedelta(days=FORECAST_WINDOW_DAYS - 1)).isoformat()
+        forecast = forecast_stock(items, *self.db.daily_consumption(since))
+        
+        low_stock_items = []
+        for i, (table, record) in enumerate(items):
+            if not forecast['needs_reorder'][i]:
+                continue
+            days_of_cover = float(forecast['days_of_cover'][i])
+            low_stock_items.append(dict(
+                record,
+                type='Medication' if table == 'medications' else 'Supply',
+                daily_usage=round(float(forecast['daily_usage'][i]), 2),
+                days_of_cover=round(days_of_cover, 1) if np.isfinite(days_of_cover) else None,
+                reorder_quantity=int(forecast['reorder_quantity'][i])
+            ))
+        return low_stock_items
     
     def export_all_data(self):
         # Create a dictionary with all data
@@ -1952,6 +3037,8 @@ class MeruHospiceManager:
     
     def run(self):
         self.root.mainloop()
+        if self.report_client is not None:
+            self.report_client.close()
 
 def main():
     # Create login window
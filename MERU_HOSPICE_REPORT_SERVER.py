@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""
+Central report server for MERU HOSPICE branches.
+
+Each branch running MERU_HOSPICE_CLIENT_MANAGEMENT_SYSTEM.py with network
+reporting enabled sends its reports here (Network > Configure Network
+Reporting: this machine's address and --port). Reports arrive as frames
+(4-byte big-endian length, then zlib-compressed JSON {"reports": [...]})
+and every frame is acknowledged with {"ack": <count>} once it has been
+stored. Any number of branches can stay connected at once.
+
+Reports are kept in SQLite (duplicates, identified by report_id, are
+dropped). The server also keeps consolidated views that are updated as
+each report is stored: client counts per branch and overall, and the
+items each branch has low on stock. Those views are served as JSON over
+HTTP:
+
+    GET /api/branches    latest summary reported by each branch
+    GET /api/clients     client counts per branch and in total
+    GET /api/low-stock   low-stock items across branches, also grouped by name
+    GET /health
+
+The server also keeps the central copy of each branch's clients,
+medications and supplies for record sync (Network > Sync Records with
+Server, see BranchSync). Over the same connection a branch sends
+{"sync_push": {"branch", "changes"}} frames with its changed records,
+answered with {"ack": <count>, "conflicts": [[table, id], ...]}, and
+{"sync_pull": {"branch", "node", "since", "limit"}} frames, answered with
+{"changes", "hwm", "more"}: the records of that branch changed by other
+databases after change number since. Copies are kept per branch name, and
+of two versions of a record the one that wins under sync_order() is kept.
+A pushed record whose id belongs to a record created by another database
+is a conflict: it is not stored, and is listed back to the branch.
+
+Usage:
+    python MERU_HOSPICE_REPORT_SERVER.py
+    python MERU_HOSPICE_REPORT_SERVER.py --port 5000 --http-port 8080 --database reports.db
+"""
+
+import argparse
+import asyncio
+import json
+import sqlite3
+import struct
+import zlib
+from datetime import datetime
+
+DATABASE_FILE = 'meru_hospice_reports.db'
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+MAX_HTTP_HEADER_BYTES = 16 * 1024
+CONNECTION_BACKLOG = 1024
+SYNC_CHUNK_ROWS = 500
+
+
+def encode_frame(message):
+    """Same framing as encode_frame() in MERU_HOSPICE_CLIENT_MANAGEMENT_SYSTEM.py."""
+    payload = zlib.compress(json.dumps(message).encode('utf-8'))
+    return struct.pack('!I', len(payload)) + payload
+
+
+async def read_frame(reader):
+    (size,) = struct.unpack('!I', await reader.readexactly(4))
+    if size > MAX_FRAME_BYTES:
+        raise ValueError(f"frame of {size} bytes is too large")
+    return json.loads(zlib.decompress(await reader.readexactly(size)).decode('utf-8'))
+
+
+def sync_order(change):
+    """Same ordering as sync_order() in MERU_HOSPICE_CLIENT_MANAGEMENT_SYSTEM.py."""
+    return (change['version'], change['updated_at'], change['origin'])
+
+
+class ReportStore:
+    """SQLite storage for received reports plus the consolidated views.
+
+    The views (branch summaries and the last known state of each branch's
+    stock items) live in memory and are updated per report, so HTTP
+    requests never query the report log; they are also saved in their own
+    tables and reloaded on start-up. Each item keeps the timestamp of the
+    report it came from, so a report that arrives late cannot overwrite
+    newer information.
+
+    Synced records are kept in synced_records with a change number from
+    one server-wide sequence, which is what branches pull against.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS reports (
+            report_id TEXT PRIMARY KEY,
+            branch TEXT NOT NULL,
+            type TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            received_at TEXT NOT NULL,
+            payload TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_reports_branch ON reports(branch, timestamp);
+        CREATE TABLE IF NOT EXISTS branch_summaries (
+            branch TEXT PRIMARY KEY,
+            summary_json TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS stock_items (
+            branch TEXT NOT NULL,
+            item_table TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            item_json TEXT NOT NULL,
+            PRIMARY KEY (branch, item_table, item_id)
+        );
+        CREATE TABLE IF NOT EXISTS synced_records (
+            branch TEXT NOT NULL,
+            item_table TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            updated_at TEXT NOT NULL,
+            origin TEXT NOT NULL,
+            created_by TEXT NOT NULL DEFAULT '',
+            record_json TEXT,
+            change_seq INTEGER NOT NULL,
+            PRIMARY KEY (branch, item_table, item_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_synced_records_seq ON synced_records(branch, change_seq);
+    '''
+
+    SUMMARY_FIELDS = ('clients_count', 'active_clients_count', 'medications_count', 'supplies_count')
+
+    def __init__(self, path=DATABASE_FILE):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(synced_records)')}
+        if 'created_by' not in columns:
+            # Synced before creators were tracked: the last editor is the best guess
+            self.conn.execute("ALTER TABLE synced_records ADD COLUMN created_by TEXT NOT NULL DEFAULT ''")
+            self.conn.execute('UPDATE synced_records SET created_by = origin')
+        self.branches = {branch: json.loads(summary) for branch, summary in
+                         self.conn.execute('SELECT branch, summary_json FROM branch_summaries')}
+        self.items = {(branch, table, item_id): json.loads(item) for branch, table, item_id, item in
+                      self.conn.execute('SELECT branch, item_table, item_id, item_json FROM stock_items')}
+        self.branch_items = {}  # branch -> keys of its items in self.items
+        for key in self.items:
+            self.branch_items.setdefault(key[0], set()).add(key)
+        self.sync_seq = self.conn.execute('SELECT COALESCE(MAX(change_seq), 0) FROM synced_records').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def store(self, reports):
+        """Store one frame's reports in a single transaction; returns how many were new."""
+        received_at = datetime.now().isoformat()
+        new = 0
+        self.conn.execute('BEGIN')
+        try:
+            for report in reports:
+                branch = str(report.get('branch') or 'unknown')
+                timestamp = str(report.get('timestamp') or received_at)
+                inserted = self.conn.execute(
+                    'INSERT OR IGNORE INTO reports (report_id, branch, type, timestamp, received_at, payload) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (str(report.get('report_id') or f'{branch}:{timestamp}'), branch,
+                     str(report.get('type', '')), timestamp, received_at, json.dumps(report))).rowcount
+                if not inserted:
+                    continue  # a resend of a report we already have
+                new += 1
+                if report.get('type') == 'full_report':
+                    self._apply_full_report(branch, timestamp, report)
+                elif report.get('type') == 'stock_change':
+                    self._apply_stock_change(branch, timestamp, report)
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return new
+
+    def _summary(self, branch):
+        return self.branches.setdefault(branch, {'branch': branch, 'reported_at': '', 'last_seen': ''})
+
+    def _save_summary(self, branch, summary):
+        self.conn.execute('INSERT OR REPLACE INTO branch_summaries (branch, summary_json) VALUES (?, ?)',
+                          (branch, json.dumps(summary)))
+
+    def _set_item(self, branch, item, timestamp, low):
+        key = (branch, str(item.get('table', '')), str(item.get('id', '')))
+        current = self.items.get(key)
+        if current is not None and current['updated_at'] > timestamp:
+            return  # we already hold newer information about this item
+        entry = dict(item, branch=branch, table=key[1], id=key[2], low=low, updated_at=timestamp)
+        self.items[key] = entry
+        self.branch_items.setdefault(branch, set()).add(key)
+        self.conn.execute('INSERT OR REPLACE INTO stock_items (branch, item_table, item_id, item_json) '
+                          'VALUES (?, ?, ?, ?)', key + (json.dumps(entry),))
+
+    def _apply_full_report(self, branch, timestamp, report):
+        summary = self._summary(branch)
+        if timestamp >= summary['reported_at']:
+            summary.update({field: int(report.get(field) or 0) for field in self.SUMMARY_FIELDS})
+            summary['reported_at'] = timestamp
+        summary['last_seen'] = max(summary['last_seen'], timestamp)
+        self._save_summary(branch, summary)
+
+        # The report lists every low item of the branch: anything else is no longer low
+        listed = set()
+        for item in report.get('low_stock_items', []):
+            table = item.get('table') or ('medications' if item.get('type') == 'Medication' else 'supplies')
+            item = dict(item, table=table)
+            self._set_item(branch, item, timestamp, low=True)
+            listed.add((branch, table, str(item.get('id', ''))))
+        for key in self.branch_items.get(branch, set()) - listed:
+            if self.items[key]['low']:
+                self._set_item(branch, self.items[key], timestamp, low=False)
+
+    def _apply_stock_change(self, branch, timestamp, report):
+        summary = self._summary(branch)
+        summary['last_seen'] = max(summary['last_seen'], timestamp)
+        self._save_summary(branch, summary)
+
+        for item in report.get('items', []):
+            low = not item.get('deleted') and item.get('quantity', 0) <= item.get('min_stock', 0)
+            self._set_item(branch, item, timestamp, low)
+
+    def apply_sync(self, branch, changes):
+        """Keep each pushed record version that wins under sync_order().
+
+        Returns how many were kept, and the [table, id] of changes to a
+        different record than the stored one with that id (created by
+        another database), which are not stored.
+        """
+        applied, conflicts = 0, []
+        self.conn.execute('BEGIN')
+        try:
+            for change in changes:
+                key = (branch, str(change['table']), str(change['id']))
+                current = self.conn.execute(
+                    'SELECT version, updated_at, origin, created_by FROM synced_records '
+                    'WHERE branch = ? AND item_table = ? AND item_id = ?', key).fetchone()
+                incoming = (int(change['version']), str(change['updated_at']), str(change['origin']))
+                created_by = str(change['created_by'])
+                if current is not None and current[3] != created_by:
+                    conflicts.append([key[1], key[2]])
+                    continue
+                if current is not None and tuple(current[:3]) >= incoming:
+                    continue
+                record = change.get('record')
+                self.sync_seq += 1
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO synced_records (branch, item_table, item_id, version, updated_at, '
+                    'origin, created_by, record_json, change_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    key + incoming + (created_by, None if record is None else json.dumps(record), self.sync_seq))
+                applied += 1
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return applied, conflicts
+
+    def sync_changes(self, branch, node, since, limit):
+        """Records of branch changed after since by databases other than node,
+        up to limit of them; hwm is the change number to ask from next time."""
+        rows = self.conn.execute(
+            'SELECT item_table, item_id, version, updated_at, origin, created_by, record_json, change_seq '
+            'FROM synced_records '
+            'WHERE branch = ? AND change_seq > ? AND origin != ? ORDER BY change_seq LIMIT ?',
+            (branch, since, node, limit + 1)).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        changes = [{'table': table, 'id': item_id, 'version': version, 'updated_at': updated_at,
+                    'origin': origin, 'created_by': created_by,
+                    'record': None if record is None else json.loads(record)}
+                   for table, item_id, version, updated_at, origin, created_by, record, _ in rows]
+        # With nothing left to send, node's own later changes can be skipped too
+        return {'changes': changes, 'hwm': rows[-1][7] if more else max(self.sync_seq, since), 'more': more}
+
+    def branch_view(self):
+        return sorted(self.branches.values(), key=lambda summary: summary['branch'])
+
+    def client_view(self):
+        branches = {branch: {field: summary.get(field, 0) for field in ('clients_count', 'active_clients_count')}
+                    for branch, summary in self.branches.items()}
+        return {
+            'total_clients': sum(counts['clients_count'] for counts in branches.values()),
+            'active_clients': sum(counts['active_clients_count'] for counts in branches.values()),
+            'branches': branches
+        }
+
+    def low_stock_view(self):
+        items = sorted((item for item in self.items.values() if item['low']),
+                       key=lambda item: (str(item.get('name', '')).lower(), item['branch']))
+        by_name = {}
+        for item in items:
+            group = by_name.setdefault(str(item.get('name', '')), {'total_quantity': 0, 'branches': []})
+            group['total_quantity'] += item.get('quantity', 0) or 0
+            group['branches'].append(item['branch'])
+        return {'count': len(items), 'items': items, 'by_name': by_name}
+
+
+class ReportServer:
+    """Framed report receiver plus the HTTP/JSON view endpoint, on one event loop."""
+
+    def __init__(self, store, host='0.0.0.0', port=5000, http_port=8080):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.http_port = http_port
+        self.servers = []
+        self.connections = 0
+
+    async def start(self):
+        self.servers = [
+            await asyncio.start_server(self.handle_reports, self.host, self.port, backlog=CONNECTION_BACKLOG),
+            await asyncio.start_server(self.handle_http, self.host, self.http_port, backlog=CONNECTION_BACKLOG)
+        ]
+        # Report the real ports (useful when started with port 0)
+        self.port = self.servers[0].sockets[0].getsockname()[1]
+        self.http_port = self.servers[1].sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Receiving reports on {self.host}:{self.port}, views on http://{self.host}:{self.http_port}/api/")
+        await asyncio.gather(*(server.serve_forever() for server in self.servers))
+
+    async def handle_reports(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    message = await read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break  # the branch closed its connection
+                writer.write(encode_frame(self.reply(message)))
+                await writer.drain()
+        except (OSError, ValueError, KeyError, TypeError, zlib.error, sqlite3.Error) as e:
+            print(f"Dropping report connection from {peer}: {e}")
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def reply(self, message):
+        if 'sync_push' in message:
+            push = message['sync_push']
+            _, conflicts = self.store.apply_sync(str(push['branch']), push['changes'])
+            return {'ack': len(push['changes']), 'conflicts': conflicts}
+        if 'sync_pull' in message:
+            pull = message['sync_pull']
+            return self.store.sync_changes(str(pull['branch']), str(pull['node']), int(pull['since']),
+                                           max(1, min(int(pull.get('limit', SYNC_CHUNK_ROWS)), SYNC_CHUNK_ROWS)))
+        reports = message.get('reports', [])
+        self.store.store(reports)
+        return {'ack': len(reports)}
+
+    async def handle_http(self, reader, writer):
+        try:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            if len(head) > MAX_HTTP_HEADER_BYTES:
+                return
+            parts = head.split(b'\r\n', 1)[0].decode('latin-1').split()
+            method, path = (parts[0], parts[1]) if len(parts) >= 2 else ('', '')
+            status, body = self.route(method, path.split('?', 1)[0])
+            payload = json.dumps(body).encode('utf-8')
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + payload)
+            await writer.drain()
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    def route(self, method, path):
+        views = {
+            '/api/branches': self.store.branch_view,
+            '/api/clients': self.store.client_view,
+            '/api/low-stock': self.store.low_stock_view,
+            '/health': lambda: {'status': 'ok', 'branches': len(self.store.branches),
+                                'report_connections': self.connections}
+        }
+        if path not in views:
+            return '404 Not Found', {'error': 'not found'}
+        if method != 'GET':
+            return '405 Method Not Allowed', {'error': 'only GET is supported'}
+        return '200 OK', views[path]()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Central report server for MERU HOSPICE branches')
+    parser.add_argument('--host', default='0.0.0.0', help='address to listen on')
+    parser.add_argument('--port', type=int, default=5000, help='port branches send reports to')
+    parser.add_argument('--http-port', type=int, default=8080, help='port for the JSON views')
+    parser.add_argument('--database', default=DATABASE_FILE, help='SQLite file for received reports')
+    args = parser.parse_args()
+
+    store = ReportStore(args.database)
+    server = ReportServer(store, args.host, args.port, args.http_port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()